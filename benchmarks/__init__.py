@@ -0,0 +1,10 @@
+"""Benchmarks for lab parsing and compose generation.
+
+Run from the repository root::
+
+    python -m benchmarks                      # compare against benchmarks/baseline.json
+    python -m benchmarks --sizes 10,100       # quick run
+    python -m benchmarks --update-baseline    # record a new baseline
+
+Docker image validation is stubbed out, so no daemon is needed.
+"""
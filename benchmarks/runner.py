@@ -0,0 +1,221 @@
+"""Measure throughput and peak memory of parsing/generation and compare to a baseline."""
+
+from __future__ import annotations
+
+import argparse
+import json
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from contextlib import ExitStack
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Callable
+from unittest import mock
+
+from benchmarks.synthetic import IMAGE_MIXES, generate_topology, write_lab
+from inspect_kathara._util import clear_lab_conf_cache, parse_lab_conf
+from inspect_kathara.compose_generator import generate_compose_from_topology, validate_topology
+from inspect_kathara.sandbox import generate_compose_for_inspect
+
+BASELINE_PATH = Path(__file__).with_name("baseline.json")
+
+DEFAULT_SIZES = (10, 100, 1000, 10000)
+DEFAULT_FANOUT = 4
+
+# Minimum wall time spent timing one case (runs repeat until it is reached)
+MIN_BENCH_SECONDS = 0.2
+
+# Relative slowdown / memory growth against the baseline that counts as a regression
+REGRESSION_TOLERANCE = 0.3
+# Absolute peak-memory growth always allowed: small cases peak at a few KiB, where
+# interpreter noise alone exceeds any relative tolerance
+MEMORY_SLACK_KB = 64.0
+
+# Rounds over every case; each case reports its median round. The baseline is
+# recorded with BASELINE_REPEAT rounds so a single noisy run cannot set it.
+DEFAULT_REPEAT = 3
+BASELINE_REPEAT = 5
+
+
+@dataclass
+class BenchResult:
+    name: str
+    machines: int
+    image_mix: str
+    runs: int
+    seconds_per_run: float
+    machines_per_second: float
+    peak_memory_kb: float
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}/{self.image_mix}/{self.machines}"
+
+
+def _measure(fn: Callable[[], object], min_seconds: float) -> tuple[int, float, float]:
+    """Run *fn* until *min_seconds* have elapsed; return (runs, seconds per run, peak KiB)."""
+    # Peak memory comes from one separate traced run: tracemalloc slows the timed runs down
+    tracemalloc.start()
+    try:
+        fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    runs = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        runs += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return runs, elapsed / runs, peak / 1024
+
+
+def run_benchmarks(
+    sizes: tuple[int, ...] = DEFAULT_SIZES,
+    image_mixes: tuple[str, ...] = tuple(IMAGE_MIXES),
+    fanout: int = DEFAULT_FANOUT,
+    min_seconds: float = MIN_BENCH_SECONDS,
+) -> list[BenchResult]:
+    """Benchmark every target for every size and image mix."""
+    results: list[BenchResult] = []
+    with ExitStack() as stack:
+        # Image validation would pull/build through Docker; generation is what is measured
+        stack.enter_context(mock.patch("inspect_kathara.sandbox.validate_kathara_image", side_effect=lambda i: i))
+        root = Path(stack.enter_context(tempfile.TemporaryDirectory()))
+
+        for image_mix in image_mixes:
+            for machines in sizes:
+                lab_path = write_lab(root / f"{image_mix}-{machines}", machines, image_mix, fanout)
+                lab_conf = lab_path / "topology" / "lab.conf"
+                topology = generate_topology(machines, image_mix, fanout)
+                targets: dict[str, Callable[[], object]] = {
+                    # Cold parses: the lab.conf cache would otherwise turn every run after the first into a stat
+                    "parse_lab_conf": lambda: (clear_lab_conf_cache(), parse_lab_conf(lab_conf)),
+                    "generate_compose_for_inspect": lambda: generate_compose_for_inspect(lab_path),
+                    "generate_compose_from_topology": lambda: generate_compose_from_topology(topology, "bench"),
+                    "validate_topology": lambda: validate_topology(topology),
+                }
+                for name, fn in targets.items():
+                    runs, per_run, peak_kb = _measure(fn, min_seconds)
+                    results.append(
+                        BenchResult(
+                            name=name,
+                            machines=machines,
+                            image_mix=image_mix,
+                            runs=runs,
+                            seconds_per_run=per_run,
+                            machines_per_second=machines / per_run,
+                            peak_memory_kb=peak_kb,
+                        )
+                    )
+    return results
+
+
+def median_results(rounds: list[list[BenchResult]]) -> list[BenchResult]:
+    """Combine rounds of ``run_benchmarks`` into the per-case median time and peak memory."""
+    combined = []
+    for cases in zip(*rounds):
+        first = cases[0]
+        per_run = statistics.median(case.seconds_per_run for case in cases)
+        combined.append(
+            BenchResult(
+                name=first.name,
+                machines=first.machines,
+                image_mix=first.image_mix,
+                runs=sum(case.runs for case in cases),
+                seconds_per_run=per_run,
+                machines_per_second=first.machines / per_run,
+                peak_memory_kb=statistics.median(case.peak_memory_kb for case in cases),
+            )
+        )
+    return combined
+
+
+def compare(
+    results: list[BenchResult], baseline: dict[str, dict], tolerance: float = REGRESSION_TOLERANCE
+) -> list[str]:
+    """Describe every result that is slower or uses more memory than *baseline* allows."""
+    regressions = []
+    for result in results:
+        reference = baseline.get(result.key)
+        if reference is None:
+            continue
+        if result.machines_per_second < reference["machines_per_second"] * (1 - tolerance):
+            regressions.append(
+                f"{result.key}: throughput {result.machines_per_second:,.0f} machines/s "
+                f"(baseline {reference['machines_per_second']:,.0f})"
+            )
+        if result.peak_memory_kb > reference["peak_memory_kb"] * (1 + tolerance) + MEMORY_SLACK_KB:
+            regressions.append(
+                f"{result.key}: peak memory {result.peak_memory_kb:,.0f} KiB "
+                f"(baseline {reference['peak_memory_kb']:,.0f})"
+            )
+    return regressions
+
+
+def load_baseline(path: Path = BASELINE_PATH) -> dict[str, dict]:
+    if not path.exists():
+        return {}
+    return dict(json.loads(path.read_text()).get("results", {}))
+
+
+def write_baseline(results: list[BenchResult], path: Path = BASELINE_PATH, repeat: int = 1) -> None:
+    data = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "repeat": repeat,
+        "results": {result.key: asdict(result) for result in results},
+    }
+    path.write_text(json.dumps(data, indent=2, sort_keys=True) + "\n")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="comma-separated machine counts")
+    parser.add_argument("--mixes", default=",".join(IMAGE_MIXES), help="comma-separated image mixes")
+    parser.add_argument("--fanout", type=int, default=DEFAULT_FANOUT, help="machines per collision domain")
+    parser.add_argument("--min-seconds", type=float, default=MIN_BENCH_SECONDS, help="minimum timing per case")
+    parser.add_argument("--baseline", type=Path, default=BASELINE_PATH, help="baseline JSON file")
+    parser.add_argument("--tolerance", type=float, default=REGRESSION_TOLERANCE, help="allowed relative regression")
+    parser.add_argument("--update-baseline", action="store_true", help="write results as the new baseline")
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=None,
+        help=f"rounds reporting each case's median (default {DEFAULT_REPEAT}, {BASELINE_REPEAT} for a baseline)",
+    )
+    args = parser.parse_args(argv)
+    repeat = args.repeat or (BASELINE_REPEAT if args.update_baseline else DEFAULT_REPEAT)
+
+    rounds = [
+        run_benchmarks(
+            sizes=tuple(int(size) for size in args.sizes.split(",")),
+            image_mixes=tuple(args.mixes.split(",")),
+            fanout=args.fanout,
+            min_seconds=args.min_seconds,
+        )
+        for _ in range(repeat)
+    ]
+    results = median_results(rounds)
+    print(f"{'benchmark':<55} {'runs':>6} {'ms/run':>10} {'machines/s':>12} {'peak KiB':>10}")
+    for result in results:
+        print(
+            f"{result.key:<55} {result.runs:>6} {result.seconds_per_run * 1000:>10.2f} "
+            f"{result.machines_per_second:>12,.0f} {result.peak_memory_kb:>10,.0f}"
+        )
+
+    if args.update_baseline:
+        write_baseline(results, args.baseline, repeat)
+        print(f"Wrote baseline to {args.baseline}")
+        return 0
+
+    regressions = compare(results, load_baseline(args.baseline), args.tolerance)
+    for regression in regressions:
+        print(f"REGRESSION {regression}", file=sys.stderr)
+    return 1 if regressions else 0
@@ -0,0 +1,84 @@
+"""Synthetic Kathara labs and topology definitions of arbitrary size."""
+
+from __future__ import annotations
+
+import random
+from pathlib import Path
+
+from inspect_kathara.compose_generator import LinkConfig, TopologyDefinition
+
+# Image distributions used to draw each machine's image
+IMAGE_MIXES: dict[str, dict[str, float]] = {
+    "hosts": {"kathara/base": 1.0},
+    "mixed": {"kathara/base": 0.6, "kathara/frr": 0.3, "kathara/bind": 0.1},
+    "routers": {"kathara/frr": 0.7, "kathara/quagga": 0.2, "kathara/bird": 0.1},
+}
+
+# Fraction of machines that get a .startup file
+STARTUP_FILE_RATIO = 0.25
+
+
+def _images(machines: int, image_mix: str, seed: int) -> list[str]:
+    mix = IMAGE_MIXES[image_mix]
+    return random.Random(seed).choices(list(mix), weights=list(mix.values()), k=machines)
+
+
+def _domains(machines: int, fanout: int) -> list[list[str]]:
+    """Interfaces of each machine, as collision domain names in eth order.
+
+    Machines are packed ``fanout`` per collision domain; the first machine of
+    each domain also joins the next domain, chaining segments together.
+    """
+    fanout = max(2, fanout)
+    interfaces: list[list[str]] = []
+    for idx in range(machines):
+        segment = idx // fanout
+        domains = [f"cd{segment}"]
+        if idx % fanout == 0 and idx + fanout < machines:
+            domains.append(f"cd{segment + 1}")
+        interfaces.append(domains)
+    return interfaces
+
+
+def generate_lab_conf(machines: int, image_mix: str = "mixed", fanout: int = 4, seed: int = 0) -> str:
+    """lab.conf text for a synthetic lab of *machines* machines."""
+    lines = [
+        f'LAB_NAME="synthetic-{machines}-{image_mix}"',
+        'LAB_DESCRIPTION="Synthetic benchmark lab"',
+        "LAB_VERSION=1.0",
+        "",
+    ]
+    images = _images(machines, image_mix, seed)
+    for idx, (image, domains) in enumerate(zip(images, _domains(machines, fanout))):
+        name = f"m{idx}"
+        lines.extend(f'{name}[{eth}]="{domain}"' for eth, domain in enumerate(domains))
+        lines.append(f'{name}[image]="{image}"')
+    return "\n".join(lines) + "\n"
+
+
+def write_lab(root: Path, machines: int, image_mix: str = "mixed", fanout: int = 4, seed: int = 0) -> Path:
+    """Write a synthetic lab (``topology/lab.conf`` plus startup files) under *root*."""
+    topology = root / "topology"
+    topology.mkdir(parents=True, exist_ok=True)
+    (topology / "lab.conf").write_text(generate_lab_conf(machines, image_mix, fanout, seed))
+    every = max(1, round(1 / STARTUP_FILE_RATIO))
+    for idx in range(0, machines, every):
+        (topology / f"m{idx}.startup").write_text(f"ip link set eth0 up\necho m{idx} > /tmp/ready\n")
+    return root
+
+
+def generate_topology(machines: int, image_mix: str = "mixed", fanout: int = 4, seed: int = 0) -> TopologyDefinition:
+    """Topology definition equivalent to ``generate_lab_conf`` for compose_generator."""
+    images = _images(machines, image_mix, seed)
+    members: dict[str, list[str]] = {}
+    for idx, domains in enumerate(_domains(machines, fanout)):
+        for domain in domains:
+            members.setdefault(domain, []).append(f"m{idx}")
+
+    links: list[LinkConfig] = []
+    for idx, names in enumerate(members.values()):
+        links.append({"machines": names, "subnet": f"10.{idx // 256 % 256}.{idx % 256}.0/24"})
+    return {
+        "machines": {f"m{idx}": {"image": image} for idx, image in enumerate(images)},
+        "links": links,
+    }
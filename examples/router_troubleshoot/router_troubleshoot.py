@@ -16,7 +16,7 @@ from inspect_ai.agent import react
 from inspect_ai.dataset import MemoryDataset, Sample
 from inspect_ai.solver import Generate, Solver, TaskState, solver
 from inspect_ai.tool import bash
-from inspect_ai.util import sandbox
+from inspect_kathara import exec_many, register_topology
 
 from scorer import router_fix_scorer
 from tools import exec_command, read_file, write_file
@@ -59,12 +59,17 @@ def load_dataset() -> MemoryDataset:
         if record.get("setup"):
             metadata["fault_setup"] = record["setup"]
 
+        # Let the kathara sandbox size concurrency from this topology
+        sandbox_spec = _resolve_sandbox_path(record["sandbox"])
+        if len(sandbox_spec) > 1:
+            register_topology(Path(sandbox_spec[1]))
+
         samples.append(
             Sample(
                 id=record["id"],
                 input=prompt_template,
                 target=record["target"],
-                sandbox=_resolve_sandbox_path(record["sandbox"]),
+                sandbox=sandbox_spec,
                 metadata=metadata,
             )
         )
@@ -81,11 +86,16 @@ def inject_faults() -> Solver:
         if not fault_setup:
             return state
 
-        for device, script in fault_setup.items():
-            if script and script.strip():
-                # Run setup script on the target device
-                device_sandbox = sandbox(name=device)
-                await device_sandbox.exec(cmd=["sh", "-c", script], timeout=30)
+        # Run every device's setup script concurrently
+        scripts = {device: script for device, script in fault_setup.items() if script and script.strip()}
+        outcomes = await exec_many(scripts, timeout=30, deadline=60)
+
+        # A fault that was not injected would leave nothing for the agent to fix
+        failed = [
+            f"{device}: {outcome.output.strip() or 'failed'}" for device, outcome in outcomes.items() if not outcome.ok
+        ]
+        if failed:
+            raise RuntimeError(f"Fault injection failed ({'; '.join(failed)})")
 
         return state
 
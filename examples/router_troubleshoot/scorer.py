@@ -1,7 +1,7 @@
 """Custom scorer for router troubleshooting task."""
 
 from inspect_ai.scorer import Score, CORRECT, INCORRECT, scorer, accuracy, stderr
-from inspect_ai.util import sandbox
+from inspect_kathara import exec_many
 
 PC2_IP = "10.0.2.10"
 
@@ -11,21 +11,21 @@ def router_fix_scorer():
     """Tests connectivity by pinging from PC1 to PC2."""
 
     async def score(_state, _target) -> Score:
-        try:
-            pc1_sandbox = sandbox("pc1")
-        except (ProcessLookupError, ValueError) as e:
-            return Score(value=INCORRECT, answer="No sandbox", explanation=f"Could not get PC1 sandbox: {e}")
+        # One probe per machine, run concurrently; add machines here to check more paths
+        outcomes = await exec_many({"pc1": ["ping", "-c", "1", "-W", "5", PC2_IP]}, deadline=30)
+        ping = outcomes["pc1"]
+        if ping.result is None and not ping.timed_out:
+            return Score(value=INCORRECT, answer="No sandbox", explanation=f"Could not run on PC1: {ping.error}")
 
-        result = await pc1_sandbox.exec(["ping", "-c", "1", "-W", "5", PC2_IP])
-
-        if result.success and result.returncode == 0:
+        if ping.ok:
             return Score(
                 value=CORRECT,
                 answer="Connection successful",
                 explanation=f"PC1 can ping PC2 ({PC2_IP}). Router forwarding works.",
             )
 
-        ping_output = result.stdout[:200] if result.stdout else result.stderr[:200]
+        result = ping.result
+        ping_output = (result.stdout or result.stderr)[:200] if result else ping.output
         return Score(
             value=INCORRECT,
             answer="Connection failed",
@@ -8,13 +8,30 @@ _LAZY_IMPORTS = {
     "get_machine_service_mapping": ("sandbox", "get_machine_service_mapping"),
     "estimate_startup_time": ("sandbox", "estimate_startup_time"),
     "get_frr_services": ("sandbox", "get_frr_services"),
+    "estimate_stack_memory": ("sandbox", "estimate_stack_memory"),
+    "register_topology": ("sandbox", "register_topology"),
+    "lab_images": ("sandbox", "lab_images"),
+    "ensure_image_manifests": ("sandbox", "ensure_image_manifests"),
+    "compile_labs": ("bulk", "compile_labs"),
+    "compile_labs_async": ("bulk", "compile_labs_async"),
+    "compile_lab_tree": ("bulk", "compile_lab_tree"),
+    "discover_labs": ("bulk", "discover_labs"),
+    "resolve_labs": ("bulk", "resolve_labs"),
+    "resolve_labs_async": ("bulk", "resolve_labs_async"),
+    "exec_many": ("fanout", "exec_many"),
+    "ExecOutcome": ("fanout", "ExecOutcome"),
+    "network_snapshot": ("snapshot", "network_snapshot"),
+    "NetworkSnapshot": ("snapshot", "NetworkSnapshot"),
+    "Probe": ("snapshot", "Probe"),
     "get_image_config": ("_util", "get_image_config"),
     "is_routing_image": ("_util", "is_routing_image"),
     "has_vtysh": ("_util", "has_vtysh"),
     "IMAGE_CONFIGS": ("_util", "IMAGE_CONFIGS"),
     "parse_lab_conf": ("_util", "parse_lab_conf"),
     "LabConfig": ("_util", "LabConfig"),
+    "LabConfError": ("_util", "LabConfError"),
     "validate_kathara_image": ("_util", "validate_kathara_image"),
+    "ensure_kathara_images": ("_util", "ensure_kathara_images"),
 }
 
 
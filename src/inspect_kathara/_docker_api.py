@@ -0,0 +1,250 @@
+"""Minimal async Docker Engine API client over the daemon's unix socket.
+
+Startup paths that only need to query or mutate daemon state (image
+listings, pulls, network listing/inspection/removal) use this client instead
+of forking the ``docker`` CLI for every call. Connections are HTTP/1.1
+keep-alive and pooled per event loop. Callers fall back to the CLI whenever
+the socket is unavailable or a request fails (``DockerAPIError``/``OSError``).
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import weakref
+from typing import Any
+from urllib.parse import quote, urlencode
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DOCKER_SOCKET = "/var/run/docker.sock"
+
+# Maximum open connections per client (per event loop)
+DOCKER_API_MAX_CONNECTIONS = 8
+
+# Seconds to wait for a single API response (pulls stream for much longer)
+DOCKER_API_TIMEOUT = 30.0
+DOCKER_API_PULL_TIMEOUT = 600.0
+
+
+class DockerAPIError(RuntimeError):
+    """A Docker Engine API request failed or returned an error status."""
+
+    def __init__(self, message: str, status: int | None = None):
+        super().__init__(message)
+        self.status = status
+
+
+def docker_socket_path() -> str | None:
+    """Unix socket of the daemon the ``docker`` CLI talks to, or None when it is not a local socket.
+
+    Resolved like the CLI: ``DOCKER_HOST``, else the endpoint of the active
+    context (``DOCKER_CONTEXT``, else ``currentContext`` in the CLI config).
+    A context whose metadata cannot be read yields None, so callers use the
+    CLI rather than a socket of a different daemon.
+    """
+    host = os.environ.get("DOCKER_HOST") or _context_host()
+    if host is None:
+        return None
+    if not host:
+        return DEFAULT_DOCKER_SOCKET
+    if host.startswith("unix://"):
+        return host[len("unix://") :]
+    return None
+
+
+def _context_host() -> str | None:
+    """``Host`` of the active docker context: "" for the default context, None if unreadable."""
+    config_dir = os.environ.get("DOCKER_CONFIG") or os.path.join(os.path.expanduser("~"), ".docker")
+    context = os.environ.get("DOCKER_CONTEXT", "")
+    if not context:
+        try:
+            with open(os.path.join(config_dir, "config.json")) as f:
+                context = json.load(f).get("currentContext") or ""
+        except FileNotFoundError:
+            return ""
+        except (OSError, ValueError, AttributeError):
+            return None
+    if context in ("", "default"):
+        return ""
+    # The CLI stores context metadata under the sha256 of the context name
+    meta = os.path.join(config_dir, "contexts", "meta", hashlib.sha256(context.encode()).hexdigest(), "meta.json")
+    try:
+        with open(meta) as f:
+            host = json.load(f)["Endpoints"]["docker"]["Host"]
+    except (OSError, ValueError, KeyError, TypeError):
+        logger.debug(f"Cannot read docker context {context!r}, using the CLI")
+        return None
+    return host if isinstance(host, str) else None
+
+
+class _Connection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+class DockerAPIClient:
+    """Async HTTP/1.1 client for the Docker Engine API with connection pooling."""
+
+    def __init__(self, socket_path: str, max_connections: int = DOCKER_API_MAX_CONNECTIONS):
+        self.socket_path = socket_path
+        self._idle: list[_Connection] = []
+        self._slots = asyncio.Semaphore(max(1, max_connections))
+        self.connections_opened = 0
+
+    async def _acquire(self) -> _Connection:
+        while self._idle:
+            conn = self._idle.pop()
+            if not conn.reader.at_eof() and not conn.writer.is_closing():
+                return conn
+            conn.close()
+        reader, writer = await asyncio.open_unix_connection(self.socket_path)
+        self.connections_opened += 1
+        return _Connection(reader, writer)
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        params: dict[str, Any] | None = None,
+        body: Any = None,
+        timeout: float = DOCKER_API_TIMEOUT,
+    ) -> tuple[int, bytes]:
+        """Send one request and return ``(status, body)``."""
+        target = path + (f"?{urlencode(params)}" if params else "")
+        payload = json.dumps(body).encode() if body is not None else b""
+        head = f"{method} {target} HTTP/1.1\r\nHost: docker\r\nContent-Length: {len(payload)}\r\n"
+        if body is not None:
+            head += "Content-Type: application/json\r\n"
+        head += "\r\n"
+
+        async with self._slots:
+            conn = await self._acquire()
+            reuse = False
+            try:
+                conn.writer.write(head.encode() + payload)
+                await conn.writer.drain()
+                status, data, reuse = await asyncio.wait_for(_read_response(conn.reader), timeout)
+                return status, data
+            finally:
+                if reuse:
+                    self._idle.append(conn)
+                else:
+                    conn.close()
+
+    async def get_json(self, path: str, params: dict[str, Any] | None = None) -> Any:
+        status, data = await self.request("GET", path, params)
+        if status >= 400:
+            raise DockerAPIError(f"GET {path} failed ({status}): {_error_message(data)}", status)
+        return json.loads(data) if data else None
+
+    async def image_repositories(self) -> set[str]:
+        """Repository names of all local images (tags stripped)."""
+        images = await self.get_json("/images/json") or []
+        repositories: set[str] = set()
+        for image in images:
+            for tag in image.get("RepoTags") or []:
+                repositories.add(tag.rsplit(":", 1)[0] if ":" in tag.split("/")[-1] else tag)
+        return repositories
+
+    async def pull(self, image: str) -> None:
+        """Pull *image* (``repo[:tag]``), raising DockerAPIError if the daemon reports an error."""
+        repo, _, tag = image.partition(":") if ":" in image.split("/")[-1] else (image, "", "")
+        params = {"fromImage": repo, "tag": tag or "latest"}
+        status, data = await self.request("POST", "/images/create", params, timeout=DOCKER_API_PULL_TIMEOUT)
+        if status >= 400:
+            raise DockerAPIError(f"pull {image} failed ({status}): {_error_message(data)}", status)
+        # Pull progress is a stream of JSON objects; failures are reported in-band
+        for line in data.splitlines():
+            try:
+                event = json.loads(line)
+            except ValueError:
+                continue
+            if isinstance(event, dict) and event.get("error"):
+                raise DockerAPIError(f"pull {image} failed: {event['error']}")
+
+    async def networks(self, name: str | None = None) -> list[dict[str, Any]]:
+        """List networks, optionally filtered by (substring) name."""
+        params = {"filters": json.dumps({"name": [name]})} if name else None
+        return list(await self.get_json("/networks", params) or [])
+
+    async def inspect_network(self, name: str) -> dict[str, Any]:
+        return dict(await self.get_json(f"/networks/{quote(name, safe='')}") or {})
+
+    async def remove_network(self, name: str) -> None:
+        status, data = await self.request("DELETE", f"/networks/{quote(name, safe='')}")
+        if status >= 400 and status != 404:
+            raise DockerAPIError(f"remove network {name} failed ({status}): {_error_message(data)}", status)
+
+    async def inspect_container(self, container_id: str) -> dict[str, Any]:
+        return dict(await self.get_json(f"/containers/{quote(container_id, safe='')}/json") or {})
+
+    async def close(self) -> None:
+        while self._idle:
+            self._idle.pop().close()
+
+
+async def _read_response(reader: asyncio.StreamReader) -> tuple[int, bytes, bool]:
+    """Read one HTTP/1.1 response. Returns ``(status, body, keep_alive)``."""
+    status_line = await reader.readline()
+    if not status_line:
+        raise DockerAPIError("connection closed by Docker daemon")
+    parts = status_line.decode("latin-1").split(" ", 2)
+    if len(parts) < 2 or not parts[1].isdigit():
+        raise DockerAPIError(f"malformed response: {status_line!r}")
+    status = int(parts[1])
+
+    headers: dict[str, str] = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        key, _, value = line.decode("latin-1").partition(":")
+        headers[key.strip().lower()] = value.strip()
+
+    keep_alive = headers.get("connection", "").lower() != "close"
+    if headers.get("transfer-encoding", "").lower() == "chunked":
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                await reader.readline()
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readline()
+        return status, b"".join(chunks), keep_alive
+    if "content-length" in headers:
+        return status, await reader.readexactly(int(headers["content-length"])), keep_alive
+    if status in (204, 304) or 100 <= status < 200:
+        return status, b"", keep_alive
+    return status, await reader.read(), False
+
+
+def _error_message(data: bytes) -> str:
+    try:
+        return str(json.loads(data).get("message", data.decode(errors="replace")))
+    except (ValueError, AttributeError):
+        return data.decode(errors="replace").strip()
+
+
+_clients: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, DockerAPIClient] = weakref.WeakKeyDictionary()
+
+
+def get_docker_client() -> DockerAPIClient | None:
+    """Pooled client for the running event loop, or None if no local socket is available."""
+    socket_path = docker_socket_path()
+    if socket_path is None or not os.path.exists(socket_path):
+        return None
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None or client.socket_path != socket_path:
+        client = DockerAPIClient(socket_path)
+        _clients[loop] = client
+    return client
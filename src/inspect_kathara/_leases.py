@@ -0,0 +1,356 @@
+"""Host-wide subnet leases so concurrent stacks never request overlapping pools.
+
+Generated compose files pin every collision domain to a fixed subnet, so two
+running copies of a lab (or two labs) ask Docker for the same address pools
+and the second ``compose up`` fails with "Pool overlaps with other one on
+this address space". Before each stack starts, its networks are given
+subnets from a lease on a non-overlapping block of
+``INSPECT_KATHARA_SUBNET_POOL`` (on by default) and the stack is started
+from a copy of its compose file with the IPAM config rewritten. The copy is
+kept in the lease directory, not in the dataset tree, with relative host
+paths made absolute.
+
+Leases are files in a shared directory guarded by ``flock``, so separate
+eval processes on one host coordinate too. Each records its owner's pid:
+leases of dead processes (crashed runs) are reclaimed on the next
+allocation.
+"""
+
+from __future__ import annotations
+
+import copy
+import fcntl
+import ipaddress
+import json
+import logging
+import math
+import os
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from pathlib import Path
+from typing import Any, Iterator
+
+import yaml  # type: ignore[import-untyped]
+
+from inspect_kathara._util import YAML_DUMPER
+
+logger = logging.getLogger(__name__)
+
+SUBNET_POOL_ENV = "INSPECT_KATHARA_SUBNET_POOL"
+DEFAULT_SUBNET_POOL = "10.128.0.0/9"
+LEASE_DIR_ENV = "INSPECT_KATHARA_LEASE_DIR"
+
+# Smallest subnet handed out (a /28 holds 13 containers plus gateway)
+MAX_PREFIX = 28
+
+_Network = ipaddress.IPv4Network
+
+
+def subnet_pool() -> _Network | None:
+    """Address pool to lease from, or None when leasing is disabled (``off``)."""
+    value = os.environ.get(SUBNET_POOL_ENV, DEFAULT_SUBNET_POOL).strip()
+    if value.lower() in ("", "0", "off", "false", "no"):
+        return None
+    try:
+        return ipaddress.IPv4Network(value)
+    except ValueError:
+        logger.warning(f"Ignoring invalid {SUBNET_POOL_ENV}={value!r}")
+        return ipaddress.IPv4Network(DEFAULT_SUBNET_POOL)
+
+
+def lease_dir() -> Path:
+    value = os.environ.get(LEASE_DIR_ENV)
+    return Path(value) if value else Path(tempfile.gettempdir()) / "inspect-kathara-leases"
+
+
+def subnet_prefix(members: int) -> int:
+    """Prefix length whose subnet fits *members* containers plus gateway, network and broadcast."""
+    addresses = max(1, members) + 3
+    return min(MAX_PREFIX, 32 - math.ceil(math.log2(addresses)))
+
+
+def _leasable(network: Any) -> bool:
+    if not isinstance(network, dict):
+        return network is None
+    return (
+        not network.get("external")
+        and network.get("driver", "bridge") == "bridge"
+        and network.get("enable_ipv4", True) is not False
+    )
+
+
+def network_prefixes(compose: dict[str, Any]) -> dict[str, int]:
+    """Subnet prefix for each leasable (local bridge, IPv4-enabled) network in *compose*.
+
+    Sized by the number of attached services; networks with static
+    ``ipv4_address`` assignments, or a ``gateway``, ``ip_range`` or
+    ``aux_addresses`` in their IPv4 IPAM entry, are grown until the highest
+    offset fits.
+    """
+    networks = compose.get("networks") or {}
+    members = {name: 0 for name, network in networks.items() if _leasable(network)}
+    highest = {name: max(_ipam_offsets(networks[name]), default=0) for name in members}
+    for service in (compose.get("services") or {}).values():
+        attachments = service.get("networks") if isinstance(service, dict) else None
+        for name in attachments or ():
+            if name not in members:
+                continue
+            members[name] += 1
+            attachment = attachments[name] if isinstance(attachments, dict) else None
+            address = attachment.get("ipv4_address") if isinstance(attachment, dict) else None
+            subnet = _configured_subnet(networks[name])
+            if address and subnet is not None:
+                offset = int(ipaddress.IPv4Address(address)) - int(subnet.network_address)
+                highest[name] = max(highest[name], offset)
+    return {name: min(subnet_prefix(count), subnet_prefix(highest[name] - 1)) for name, count in members.items()}
+
+
+def _ipam_configs(network: Any) -> list[Any]:
+    configs = ((network.get("ipam") or {}).get("config") or []) if isinstance(network, dict) else []
+    return configs if isinstance(configs, list) else []
+
+
+def _ipv4_entry(network: Any) -> dict[str, Any] | None:
+    """The IPAM config entry of *network* with an IPv4 subnet (IPv6 entries are left alone)."""
+    for entry in _ipam_configs(network):
+        if not isinstance(entry, dict) or not entry.get("subnet"):
+            continue
+        if ipaddress.ip_network(entry["subnet"], strict=False).version == 4:
+            return entry
+    return None
+
+
+def _configured_subnet(network: Any) -> _Network | None:
+    entry = _ipv4_entry(network)
+    return ipaddress.IPv4Network(entry["subnet"], strict=False) if entry is not None else None
+
+
+def _ipam_offsets(network: Any) -> Iterator[int]:
+    """Offsets in the IPv4 subnet of its ``gateway``, ``aux_addresses`` and last ``ip_range`` address."""
+    entry = _ipv4_entry(network)
+    if entry is None:
+        return
+    base = int(ipaddress.IPv4Network(entry["subnet"], strict=False).network_address)
+    addresses = [entry.get("gateway"), *(entry.get("aux_addresses") or {}).values()]
+    for address in addresses:
+        if address:
+            yield int(ipaddress.IPv4Address(address)) - base
+    if entry.get("ip_range"):
+        yield int(ipaddress.IPv4Network(entry["ip_range"], strict=False).broadcast_address) - base
+
+
+def _moved_ipv4_entry(entry: dict[str, Any], new: _Network) -> dict[str, Any]:
+    """*entry* on subnet *new*, with its gateway, auxiliary addresses and IP range at the same offsets."""
+    old = ipaddress.IPv4Network(entry["subnet"], strict=False)
+
+    def move(address: str) -> str:
+        return str(new.network_address + (int(ipaddress.IPv4Address(address)) - int(old.network_address)))
+
+    moved = dict(entry, subnet=str(new))
+    if entry.get("gateway"):
+        moved["gateway"] = move(entry["gateway"])
+    if entry.get("aux_addresses"):
+        moved["aux_addresses"] = {host: move(address) for host, address in entry["aux_addresses"].items()}
+    if entry.get("ip_range"):
+        ip_range = ipaddress.IPv4Network(entry["ip_range"], strict=False)
+        moved["ip_range"] = f"{move(str(ip_range.network_address))}/{ip_range.prefixlen}"
+    return moved
+
+
+def pack_subnets(block: _Network, prefixes: dict[str, int]) -> dict[str, str]:
+    """Place subnets of the given prefixes contiguously in *block*, largest first (keeps alignment)."""
+    subnets: dict[str, str] = {}
+    offset = 0
+    for name, prefix in sorted(prefixes.items(), key=lambda item: (item[1], item[0])):
+        subnets[name] = str(ipaddress.IPv4Network((int(block.network_address) + offset, prefix)))
+        offset += 2 ** (32 - prefix)
+    return subnets
+
+
+def block_prefix(prefixes: dict[str, int]) -> int:
+    """Prefix of the smallest aligned block holding all *prefixes*."""
+    total = sum(2 ** (32 - prefix) for prefix in prefixes.values())
+    return 32 - math.ceil(math.log2(max(total, 1)))
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+@dataclass
+class SubnetLease:
+    """A leased block and the subnets assigned to one stack's networks."""
+
+    id: str
+    block: str
+    subnets: dict[str, str]
+    pid: int = field(default_factory=os.getpid)
+    created: float = field(default_factory=time.time)
+    compose_file: str | None = None
+
+
+class SubnetLeaseManager:
+    """Allocate non-overlapping blocks of *pool* recorded as files in *directory*."""
+
+    def __init__(self, pool: _Network, directory: Path):
+        self.pool = pool
+        self.directory = directory
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        with open(self.directory / ".lock", "w") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def _path(self, lease_id: str) -> Path:
+        return self.directory / f"{lease_id}.json"
+
+    def _read_leases(self) -> list[SubnetLease]:
+        leases = []
+        for path in self.directory.glob("*.json"):
+            try:
+                leases.append(SubnetLease(**json.loads(path.read_text())))
+            except (OSError, ValueError, TypeError):
+                logger.debug(f"Removing unreadable subnet lease {path}")
+                path.unlink(missing_ok=True)
+        return leases
+
+    def _drop(self, lease: SubnetLease) -> None:
+        self._path(lease.id).unlink(missing_ok=True)
+        if lease.compose_file:
+            Path(lease.compose_file).unlink(missing_ok=True)
+
+    def acquire(self, prefixes: dict[str, int]) -> SubnetLease:
+        """Lease a block holding one subnet of the given prefix per network.
+
+        Raises:
+            RuntimeError: If the pool has no free block large enough.
+        """
+        prefix = block_prefix(prefixes)
+        if prefix < self.pool.prefixlen:
+            raise RuntimeError(f"Stack needs a /{prefix} block, larger than subnet pool {self.pool}")
+        with self._locked():
+            taken = []
+            for lease in self._read_leases():
+                if _pid_alive(lease.pid):
+                    taken.append(ipaddress.IPv4Network(lease.block))
+                else:
+                    logger.info(f"Reclaiming subnet lease {lease.block} of exited process {lease.pid}")
+                    self._drop(lease)
+            for block in self.pool.subnets(new_prefix=prefix):
+                if not any(block.overlaps(other) for other in taken):
+                    subnets = pack_subnets(block, prefixes)
+                    lease = SubnetLease(id=uuid.uuid4().hex[:12], block=str(block), subnets=subnets)
+                    self._path(lease.id).write_text(json.dumps(asdict(lease)))
+                    return lease
+        raise RuntimeError(f"No free /{prefix} block left in subnet pool {self.pool}")
+
+    def update(self, lease: SubnetLease) -> None:
+        with self._locked():
+            self._path(lease.id).write_text(json.dumps(asdict(lease)))
+
+    def release(self, lease: SubnetLease) -> None:
+        with self._locked():
+            self._drop(lease)
+
+
+def _absolute(path: str, base: Path) -> str:
+    return path if os.path.isabs(path) or path.startswith("~") else str(base / path)
+
+
+def _absolute_volume(volume: Any, base: Path) -> Any:
+    if isinstance(volume, dict):
+        if volume.get("type", "volume") == "bind" and isinstance(volume.get("source"), str):
+            volume["source"] = _absolute(volume["source"], base)
+        return volume
+    if isinstance(volume, str) and volume.startswith("."):
+        source, sep, rest = volume.partition(":")
+        return _absolute(source, base) + sep + rest
+    return volume
+
+
+def absolute_host_paths(compose: dict[str, Any], base: Path) -> None:
+    """Resolve relative host paths of *compose* services against *base*, in place.
+
+    Covers bind mounts, build contexts, ``env_file`` and ``extends.file``, so
+    a copy of the compose file can be started from another directory.
+    """
+    for service in (compose.get("services") or {}).values():
+        if not isinstance(service, dict):
+            continue
+        if isinstance(service.get("volumes"), list):
+            service["volumes"] = [_absolute_volume(volume, base) for volume in service["volumes"]]
+        build = service.get("build")
+        if isinstance(build, str):
+            service["build"] = _absolute(build, base)
+        elif isinstance(build, dict) and isinstance(build.get("context", "."), str):
+            build["context"] = _absolute(build.get("context", "."), base)
+        env_files = service.get("env_file")
+        if isinstance(env_files, str):
+            service["env_file"] = _absolute(env_files, base)
+        elif isinstance(env_files, list):
+            for i, env_file in enumerate(env_files):
+                if isinstance(env_file, str):
+                    env_files[i] = _absolute(env_file, base)
+                elif isinstance(env_file, dict) and isinstance(env_file.get("path"), str):
+                    env_file["path"] = _absolute(env_file["path"], base)
+        extends = service.get("extends")
+        if isinstance(extends, dict) and isinstance(extends.get("file"), str):
+            extends["file"] = _absolute(extends["file"], base)
+
+
+def write_leased_compose(config_file: Path, compose: dict[str, Any], lease: SubnetLease, directory: Path) -> Path:
+    """Write a copy of *compose* to *directory* with networks moved to the leased subnets.
+
+    Relative host paths are resolved against the directory of *config_file*
+    so they point where they did in the original. Static ``ipv4_address``
+    assignments, gateways, auxiliary addresses and IP ranges keep their
+    offset within the network. Only the IPv4 IPAM entry is replaced (or
+    added); IPv6 entries are kept as they are.
+    """
+    compose = copy.deepcopy(compose)
+    absolute_host_paths(compose, config_file.resolve().parent)
+    moved: dict[str, tuple[_Network, _Network]] = {}
+    for name, subnet in lease.subnets.items():
+        network = compose["networks"].get(name)
+        if not isinstance(network, dict):
+            network = compose["networks"][name] = {}
+        new = ipaddress.IPv4Network(subnet)
+        configs = _ipam_configs(network)
+        entry = _ipv4_entry(network)
+        if entry is None:
+            configs = [{"subnet": subnet}, *configs]
+        else:
+            moved[name] = (ipaddress.IPv4Network(entry["subnet"], strict=False), new)
+            configs = [_moved_ipv4_entry(entry, new) if config is entry else config for config in configs]
+        if not isinstance(network.get("ipam"), dict):
+            network["ipam"] = {}
+        network["ipam"]["config"] = configs
+
+    for service in (compose.get("services") or {}).values():
+        attachments = service.get("networks") if isinstance(service, dict) else None
+        if not isinstance(attachments, dict):
+            continue
+        for name, attachment in attachments.items():
+            if name in moved and isinstance(attachment, dict) and attachment.get("ipv4_address"):
+                old_net, new_net = moved[name]
+                offset = int(ipaddress.IPv4Address(attachment["ipv4_address"])) - int(old_net.network_address)
+                attachment["ipv4_address"] = str(new_net.network_address + offset)
+
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{lease.id}.compose.yaml"
+    path.write_text(yaml.dump(compose, default_flow_style=False, sort_keys=False, Dumper=YAML_DUMPER))
+    return path
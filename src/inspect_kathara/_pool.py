@@ -0,0 +1,113 @@
+"""Warm pool of pre-started Kathara stacks keyed by compose fingerprint.
+
+Samples that share a topology (e.g. every fault-injection variant of
+examples/router_troubleshoot) can check out a stack that was already started
+and health-verified in the background, instead of paying ``compose up`` and
+readiness on the critical path. The pool is opt-in via
+``INSPECT_KATHARA_WARM_POOL=<stacks per topology>``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import hashlib
+import logging
+import os
+from collections import deque
+from typing import Awaitable, Callable
+
+from inspect_ai.util._sandbox.docker.docker import resolve_config_environment
+from inspect_ai.util._sandbox.environment import SandboxEnvironment, SandboxEnvironmentConfigType
+
+logger = logging.getLogger(__name__)
+
+WARM_POOL_ENV = "INSPECT_KATHARA_WARM_POOL"
+
+Environments = dict[str, SandboxEnvironment]
+StackFactory = Callable[[], Awaitable[Environments]]
+
+
+def warm_pool_size() -> int:
+    """Stacks to keep warm per compose fingerprint (0 disables the pool)."""
+    value = os.environ.get(WARM_POOL_ENV)
+    if not value:
+        return 0
+    try:
+        return max(0, int(value))
+    except ValueError:
+        logger.warning(f"Ignoring invalid {WARM_POOL_ENV}={value!r}")
+        return 0
+
+
+def compose_fingerprint(config: SandboxEnvironmentConfigType | None, metadata: dict[str, str]) -> str | None:
+    """Fingerprint a compose file so identical topologies share pooled stacks.
+
+    Returns None when the stack cannot be pooled: no compose file on disk, or
+    a compose file that interpolates ``SAMPLE_METADATA_*`` variables (each
+    sample would then need its own environment).
+    """
+    resolved = resolve_config_environment(config, metadata)
+    if resolved is None or resolved.env:
+        return None
+    digest = hashlib.sha256()
+    digest.update(os.path.realpath(resolved.config_file).encode())
+    digest.update(b"\0")
+    digest.update(resolved.config_text.encode())
+    return digest.hexdigest()
+
+
+class WarmPool:
+    """Pre-started stacks per compose fingerprint, refilled in the background."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._ready: dict[str, deque[Environments]] = {}
+        self._pending: dict[str, int] = {}
+        self._tasks: set[asyncio.Task[None]] = set()
+
+    def ready_count(self, key: str) -> int:
+        return len(self._ready.get(key, ()))
+
+    def checkout(self, key: str) -> Environments | None:
+        """Take a ready stack for *key*, or None if none is warm yet."""
+        ready = self._ready.get(key)
+        if not ready:
+            return None
+        logger.debug(f"Checked out warm Kathara stack ({len(ready) - 1} left for {key[:12]})")
+        return ready.popleft()
+
+    def checkin(self, key: str, environments: Environments) -> None:
+        """Return a ready stack to the pool (e.g. one built by a refill)."""
+        self._ready.setdefault(key, deque()).append(environments)
+
+    def refill(self, key: str, factory: StackFactory) -> None:
+        """Start background stacks until *key* has ``size`` ready or pending."""
+        missing = self.size - self.ready_count(key) - self._pending.get(key, 0)
+        for _ in range(max(0, missing)):
+            self._pending[key] = self._pending.get(key, 0) + 1
+            task = asyncio.create_task(self._start(key, factory))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _start(self, key: str, factory: StackFactory) -> None:
+        try:
+            self.checkin(key, await factory())
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Failed to pre-start warm Kathara stack: {e}")
+        finally:
+            self._pending[key] -= 1
+
+    async def drain(self) -> list[Environments]:
+        """Stop refilling, wait for in-flight refills and hand back every idle stack for cleanup.
+
+        Refills are awaited rather than cancelled: a ``compose up`` cancelled
+        halfway leaves a project behind that nothing would tear down.
+        """
+        self.size = 0
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        idle = [envs for ready in self._ready.values() for envs in ready]
+        self._ready.clear()
+        self._pending.clear()
+        return idle
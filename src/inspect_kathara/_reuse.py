@@ -0,0 +1,212 @@
+"""In-place state reset for reusing a stack across samples of one topology.
+
+Fault-injection samples usually differ from each other only in kernel and
+routing-daemon state (iptables rules, sysctls, routes, FRR config). Instead of
+tearing down and recreating every container, a stack can be restored to the
+baseline captured right after it first became ready:
+
+1. the generated startup prologue is re-run (address/route flush, config copy,
+   ``.startup`` script)
+2. FRR is reloaded from its restored config via ``frr-reload.py``/``vtysh``
+3. iptables tables are restored with ``iptables-restore``
+4. forwarding/filtering sysctls are written back
+
+The reset is verified by capturing the state again and comparing it with the
+baseline; callers fall back to full recreation when verification fails.
+Opt-in via ``INSPECT_KATHARA_REUSE=1``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import logging
+import os
+import re
+import shlex
+from dataclasses import dataclass, field
+from typing import Any
+
+from inspect_ai.util._sandbox.environment import SandboxEnvironment
+
+from inspect_kathara._util import DEFAULT_IMAGE, STARTUP_PROLOGUE_PATH, has_vtysh
+
+logger = logging.getLogger(__name__)
+
+REUSE_ENV = "INSPECT_KATHARA_REUSE"
+
+# Timeout (seconds) for one capture or reset exec inside a container
+RESET_EXEC_TIMEOUT = 60
+
+# Routes installed by routing daemons converge asynchronously, so only
+# kernel/static routes take part in verification.
+_CAPTURE_STATE = r"""
+echo '#iptables'
+for t in filter nat mangle raw; do iptables-save -t "$t" 2>/dev/null; done \
+  | sed -e '/^#/d' -e 's/\[[0-9]*:[0-9]*\]/[0:0]/'
+echo '#sysctl'
+keys='forwarding|rp_filter|accept_redirects|send_redirects|proxy_arp'
+sysctl -a 2>/dev/null | grep -E "^net\.ipv[46]\.(ip_forward|conf\.[^ ]+\.($keys)) " | sort
+echo '#addr'
+ip -o addr show 2>/dev/null | awk '{print $2, $3, $4}' | sort
+echo '#route'
+ip route show 2>/dev/null | grep -vE 'proto (bgp|ospf|rip|isis|eigrp|babel|zebra|bird)' | sort
+"""
+
+_CAPTURE_FRR = r"""
+echo '#frr'
+vtysh -c 'show running-config' 2>/dev/null | grep -vE '^(Building configuration|Current configuration|!$)'
+"""
+
+_RELOAD_FRR = r"""
+if [ -x /usr/lib/frr/frr-reload.py ] && [ -f /etc/frr/frr.conf ]; then
+  /usr/lib/frr/frr-reload.py --reload /etc/frr/frr.conf >/dev/null 2>&1 || vtysh -b >/dev/null 2>&1
+else
+  vtysh -b >/dev/null 2>&1
+fi
+"""
+
+
+def reuse_enabled() -> bool:
+    """True when stacks should be reset and reused instead of recreated."""
+    return os.environ.get(REUSE_ENV, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass
+class ServiceBaseline:
+    """Captured state and restore inputs for one container."""
+
+    state: str
+    startup_command: str | None = None
+    vtysh: bool = False
+
+    def section(self, name: str) -> str:
+        """Body of one ``#name`` section of the captured state."""
+        return parse_state(self.state).get(name, "")
+
+
+@dataclass
+class StackBaseline:
+    """Baseline of every container in a stack, plus its warm-pool key."""
+
+    key: str
+    services: dict[str, ServiceBaseline] = field(default_factory=dict)
+
+
+def parse_state(state: str) -> dict[str, str]:
+    """Split captured state into its ``#iptables``/``#sysctl``/... sections."""
+    sections: dict[str, list[str]] = {}
+    current: list[str] | None = None
+    for line in state.splitlines():
+        if line.startswith("#") and " " not in line and line[1:].isalpha():
+            current = sections.setdefault(line[1:], [])
+        elif current is not None:
+            current.append(line)
+    return {name: "\n".join(lines) for name, lines in sections.items()}
+
+
+def startup_command_from_service(service: dict[str, Any]) -> str | None:
+    """Extract the re-runnable startup script from a generated compose service.
+
+    Generated services run the mounted startup prologue
+    (``bash -l /kathara/prologue.sh``), which is re-run with its final sleep
+    skipped. Older generated services run ``bash -lc '<flush>; <copy>;
+    <startup>; sleep infinity'``; their script is returned without the
+    trailing ``sleep infinity`` and with Compose's ``$$`` escapes undone.
+    None for commands of any other shape.
+    """
+    command = service.get("command")
+    if isinstance(command, str):
+        try:
+            argv = shlex.split(command)
+        except ValueError:
+            return None
+    elif isinstance(command, list):
+        argv = [str(arg) for arg in command]
+    else:
+        return None
+    if argv == ["bash", "-l", STARTUP_PROLOGUE_PATH]:
+        return f"KATHARA_STARTUP_ONCE=1 bash -l {STARTUP_PROLOGUE_PATH}"
+    if len(argv) != 3 or argv[0] not in ("bash", "sh") or argv[1] not in ("-c", "-lc"):
+        return None
+    script = re.sub(r"(\s*(&&|;)?\s*sleep infinity\s*)$", "", argv[2].replace("$$", "$")).strip()
+    return script or None
+
+
+def capture_script(vtysh: bool) -> str:
+    return _CAPTURE_STATE + (_CAPTURE_FRR if vtysh else "")
+
+
+def reset_script(baseline: ServiceBaseline) -> str:
+    """Shell script restoring one container to *baseline*."""
+    iptables = base64.b64encode((baseline.section("iptables") + "\n").encode()).decode()
+    sysctls = base64.b64encode((baseline.section("sysctl") + "\n").encode()).decode()
+    # The startup command may itself add iptables rules or sysctls, so the
+    # captured tables and values are restored after it to land exactly on the baseline.
+    lines = ["set +e"]
+    if baseline.startup_command:
+        lines.append(f"bash -lc {shlex.quote(baseline.startup_command)} >/dev/null 2>&1")
+    if baseline.vtysh:
+        lines.append(_RELOAD_FRR)
+    lines += [
+        f"echo {iptables} | base64 -d | iptables-restore 2>/dev/null",
+        f"echo {sysctls} | base64 -d | sed 's/ = /=/' | while read -r kv; do "
+        '[ -n "$kv" ] && sysctl -q -w "$kv" >/dev/null 2>&1; done',
+        "conntrack -F >/dev/null 2>&1",
+        "ip neigh flush all >/dev/null 2>&1",
+        "exit 0",
+    ]
+    return "\n".join(lines)
+
+
+async def _capture(environment: SandboxEnvironment, vtysh: bool) -> str:
+    result = await environment.exec(["sh", "-c", capture_script(vtysh)], timeout=RESET_EXEC_TIMEOUT)
+    if not result.success:
+        raise RuntimeError(f"state capture failed: {result.stderr.strip()}")
+    return result.stdout
+
+
+async def capture_baseline(
+    key: str,
+    environments: dict[str, SandboxEnvironment],
+    compose: dict[str, Any] | None,
+) -> StackBaseline:
+    """Capture the baseline state of every container in a freshly started stack."""
+    services = (compose or {}).get("services") or {}
+
+    async def capture_service(name: str, environment: SandboxEnvironment) -> tuple[str, ServiceBaseline]:
+        service = services.get(name) or {}
+        vtysh = has_vtysh(service.get("image") or DEFAULT_IMAGE)
+        state = await _capture(environment, vtysh)
+        return name, ServiceBaseline(state=state, startup_command=startup_command_from_service(service), vtysh=vtysh)
+
+    captured = await asyncio.gather(*(capture_service(name, env) for name, env in environments.items()))
+    return StackBaseline(key=key, services=dict(captured))
+
+
+async def reset_stack(environments: dict[str, SandboxEnvironment], baseline: StackBaseline) -> bool:
+    """Restore every container to *baseline* and verify the result.
+
+    Returns:
+        True when every container's state matches its baseline again; False
+        (never raising) when a reset or verification failed and the stack
+        must be recreated instead.
+    """
+
+    async def reset_service(name: str, environment: SandboxEnvironment) -> bool:
+        service_baseline = baseline.services.get(name)
+        if service_baseline is None:
+            return False
+        await environment.exec(["sh", "-c", reset_script(service_baseline)], timeout=RESET_EXEC_TIMEOUT)
+        state = await _capture(environment, service_baseline.vtysh)
+        if parse_state(state) != parse_state(service_baseline.state):
+            logger.debug(f"Service '{name}' did not return to its baseline state")
+            return False
+        return True
+
+    try:
+        results = await asyncio.gather(*(reset_service(name, env) for name, env in environments.items()))
+    except Exception as e:
+        logger.warning(f"Failed to reset Kathara stack, recreating instead: {e}")
+        return False
+    return all(results)
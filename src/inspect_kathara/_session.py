@@ -0,0 +1,263 @@
+"""Long-lived shell sessions that run many exec calls through one process.
+
+Every ``exec`` of the Docker sandbox forks the ``docker compose`` CLI, makes
+an API round trip and starts a fresh process in the container (~100ms).
+Agents issue hundreds of small commands per sample. With sessions enabled,
+each container instead keeps one ``sh`` (started with ``docker exec -i``)
+and commands are written to its stdin one at a time. Each runs in a
+subshell with stdin, stdout and stderr redirected to files in a private
+session directory. Afterwards the shell prints a frame: a line holding a
+per-session token, the exit status and the byte counts of both streams,
+followed by the streams themselves. No command output ever mixes with the
+framing.
+
+Output is bounded end to end. A stream larger than the output limit is
+sent only as its head and tail, which the host collects into an
+``OutputCapture``. As with the Docker sandbox's exec, such a command raises
+``OutputLimitExceededError``, here with the head and tail of both streams
+as its ``truncated_output``.
+
+Timeouts use the same in-container ``timeout`` wrapper as the Docker
+sandbox, with a host-side bound on top. A shell that dies or times out on
+the host is discarded, and the next command starts a new one. Opt-in via
+``INSPECT_KATHARA_SESSIONS=1``.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import base64
+import logging
+import os
+import re
+import secrets
+import shlex
+from dataclasses import dataclass
+
+from inspect_ai.util import ExecResult, OutputLimitExceededError
+
+from inspect_kathara._util import MAX_EXEC_OUTPUT, OutputCapture
+
+logger = logging.getLogger(__name__)
+
+SESSIONS_ENV = "INSPECT_KATHARA_SESSIONS"
+
+# Seconds a session gets to exit cleanly on close before it is killed
+CLOSE_TIMEOUT = 5.0
+
+# Host-side slack over a command's in-container timeout (timeout + SIGKILL grace)
+HOST_TIMEOUT_SLACK = 10
+
+_ENV_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+_HEREDOC_END = "__KATHARA_INPUT__"
+# Bytes read from the shell's stdout at a time
+READ_CHUNK = 64 * 1024
+
+
+def sessions_enabled() -> bool:
+    """True when sandbox commands should run through persistent shell sessions."""
+    return os.environ.get(SESSIONS_ENV, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass
+class SessionExecResult(ExecResult[str]):
+    """``ExecResult`` with the size in bytes of each output stream."""
+
+    stdout_bytes: int = 0
+    stderr_bytes: int = 0
+
+
+class SessionError(RuntimeError):
+    """The session's shell died or produced output that is not a valid frame."""
+
+
+def _size_str(size: int) -> str:
+    return f"{size // 2**20} MiB" if size >= 2**20 and size % 2**20 == 0 else f"{size} bytes"
+
+
+class ShellSession:
+    """One long-lived shell (*argv*) running commands sequentially with framed output.
+
+    Args:
+        argv: Command starting a shell that reads commands from stdin, e.g.
+            ``["docker", "exec", "-i", container, "sh"]``.
+        output_limit: Bytes of each output stream a command may print; of
+            larger streams only the head and tail are kept.
+    """
+
+    def __init__(self, argv: list[str], output_limit: int = MAX_EXEC_OUTPUT):
+        self.argv = argv
+        self.output_limit = output_limit
+        self._process: asyncio.subprocess.Process | None = None
+        self._token = ""
+        self._lock = asyncio.Lock()
+
+    @property
+    def alive(self) -> bool:
+        return self._process is not None and self._process.returncode is None
+
+    @property
+    def busy(self) -> bool:
+        """True while a command is running (callers may use a separate exec instead of waiting)."""
+        return self._lock.locked()
+
+    async def _spawn(self) -> asyncio.subprocess.Process:
+        process = await asyncio.create_subprocess_exec(
+            *self.argv,
+            stdin=asyncio.subprocess.PIPE,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL,
+        )
+        self._process = process
+        self._token = f"__KATHARA_{secrets.token_hex(8)}__"
+        assert process.stdin is not None
+        # _kathara_show FILE SIZE: the whole file, or only the head and tail an OutputCapture keeps
+        capture = self._capture()
+        head, tail = capture.head_limit, capture.tail_limit
+        process.stdin.write(
+            b'KATHARA_SESSION_DIR=$(mktemp -d "${TMPDIR:-/tmp}/kathara-session.XXXXXX")\n'
+            + f'_kathara_show() {{ if [ "$2" -gt {head + tail} ]; then head -c {head} "$1"; tail -c {tail} "$1"; '
+            f'else cat "$1"; fi; }}\n'.encode()
+        )
+        logger.debug(f"Started shell session: {shlex.join(self.argv)}")
+        return process
+
+    def _capture(self) -> OutputCapture:
+        # Head and tail together hold output_limit bytes, so streams within the limit arrive whole
+        return OutputCapture(self.output_limit + OutputCapture.MARKER_RESERVE)
+
+    def _script(
+        self,
+        cmd: list[str],
+        input: str | bytes | None,
+        cwd: str | None,
+        env: dict[str, str] | None,
+        timeout: int | None,
+    ) -> bytes:
+        """Shell text running *cmd* in a subshell and printing its frame."""
+        d = '"$KATHARA_SESSION_DIR"'
+        lines = []
+        stdin = "/dev/null"
+        if input is not None:
+            data = input.encode() if isinstance(input, str) else input
+            lines.append(f"base64 -d >{d}/in <<'{_HEREDOC_END}'\n{base64.encodebytes(data).decode()}{_HEREDOC_END}")
+            stdin = f"{d}/in"
+        setup = []
+        if cwd:
+            setup.append(f"cd {shlex.quote(cwd)} &&")
+        for key, value in (env or {}).items():
+            if not _ENV_NAME.match(key):
+                raise ValueError(f"Invalid environment variable name: {key!r}")
+            setup.append(f"export {key}={shlex.quote(value)} &&")
+        command = shlex.join(cmd)
+        if timeout is not None:
+            command = f"/usr/bin/timeout -k 5s {timeout}s {command}"
+        lines.append(f"( {' '.join(setup)} exec {command} ) <{stdin} >{d}/out 2>{d}/err")
+        lines.append(f"r=$?; o=$(wc -c <{d}/out); e=$(wc -c <{d}/err)")
+        lines.append(f"printf '{self._token} %s %s %s\\n' $r $o $e; _kathara_show {d}/out $o; _kathara_show {d}/err $e")
+        return ("\n".join(lines) + "\n").encode()
+
+    async def _read_stream(self, process: asyncio.subprocess.Process, size: int) -> OutputCapture:
+        """Collect one stream of *size* bytes, of which only the head and tail were sent when large."""
+        capture = self._capture()
+        head, tail = capture.head_limit, capture.tail_limit
+        if size <= head + tail:
+            await self._feed(process, capture, size)
+        else:
+            await self._feed(process, capture, head)
+            capture.skip(size - head - tail)
+            await self._feed(process, capture, tail)
+        return capture
+
+    async def _feed(self, process: asyncio.subprocess.Process, capture: OutputCapture, count: int) -> None:
+        assert process.stdout is not None
+        while count:
+            chunk = await process.stdout.read(min(count, READ_CHUNK))
+            if not chunk:
+                raise SessionError("shell session exited")
+            capture.feed(chunk)
+            count -= len(chunk)
+
+    async def _read_frame(self, process: asyncio.subprocess.Process) -> tuple[int, OutputCapture, OutputCapture]:
+        assert process.stdout is not None
+        while True:
+            line = await process.stdout.readline()
+            if not line:
+                raise SessionError("shell session exited")
+            if line.startswith(self._token.encode()):
+                break
+        try:
+            returncode, out_bytes, err_bytes = (int(field) for field in line.split()[1:4])
+        except ValueError as e:
+            raise SessionError(f"malformed frame header {line!r}") from e
+        return returncode, await self._read_stream(process, out_bytes), await self._read_stream(process, err_bytes)
+
+    async def run(
+        self,
+        cmd: list[str],
+        input: str | bytes | None = None,
+        cwd: str | None = None,
+        env: dict[str, str] | None = None,
+        timeout: int | None = None,
+    ) -> SessionExecResult:
+        """Run *cmd* in the session, (re)starting the shell if needed.
+
+        Raises:
+            TimeoutError: If the command exceeds *timeout*.
+            OutputLimitExceededError: If stdout or stderr exceeds the output
+                limit; its ``truncated_output`` holds the head and tail.
+            SessionError: If the shell died while the command ran (the
+                command may or may not have run).
+        """
+        async with self._lock:
+            process = self._process if self.alive else await self._spawn()
+            assert process is not None and process.stdin is not None
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            try:
+                process.stdin.write(self._script(cmd, input, cwd, env, timeout))
+                await process.stdin.drain()
+                host_timeout = timeout + HOST_TIMEOUT_SLACK if timeout is not None else None
+                returncode, stdout, stderr = await asyncio.wait_for(self._read_frame(process), host_timeout)
+            except asyncio.TimeoutError:
+                await self._kill()
+                raise TimeoutError(f"Command timed out after {timeout} seconds") from None
+            except (OSError, SessionError) as e:
+                await self._kill()
+                raise SessionError(f"Shell session failed: {e}") from e
+
+        # Same exit codes as the Docker sandbox's in-container timeout (124 TERM, 137 KILL, 143 BusyBox)
+        if timeout is not None and returncode in (124, 137, 143):
+            if returncode == 124 or loop.time() - started >= timeout:
+                raise TimeoutError(f"Command timed out after {timeout} seconds")
+        if stdout.total > self.output_limit or stderr.total > self.output_limit:
+            raise OutputLimitExceededError(_size_str(self.output_limit), truncated_output=stdout.text() + stderr.text())
+        return SessionExecResult(
+            success=returncode == 0,
+            returncode=returncode,
+            stdout=stdout.text(),
+            stderr=stderr.text(),
+            stdout_bytes=stdout.total,
+            stderr_bytes=stderr.total,
+        )
+
+    async def _kill(self) -> None:
+        process, self._process = self._process, None
+        if process is not None and process.returncode is None:
+            process.kill()
+            await process.wait()
+
+    async def close(self) -> None:
+        """Remove the session directory and stop the shell."""
+        process, self._process = self._process, None
+        if process is None or process.returncode is not None:
+            return
+        try:
+            assert process.stdin is not None
+            process.stdin.write(b'rm -rf "$KATHARA_SESSION_DIR"; exit 0\n')
+            await process.stdin.drain()
+            await asyncio.wait_for(process.wait(), CLOSE_TIMEOUT)
+        except (OSError, asyncio.TimeoutError):
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
@@ -0,0 +1,82 @@
+"""Phase-level timing for Kathara stack startup and cleanup.
+
+Each ``sample_init``/``sample_cleanup`` records how long it spent in every
+phase (image resolution, network prune, admission queueing, ``compose up``,
+health convergence, ...) and how long each healthchecked service took to
+report healthy; staged stacks (``depends_on``) also record how long each
+startup stage took. The result is emitted as a structured log record and
+attached to the running Inspect sample, both as a transcript ``info`` event
+and in the sample store, so it ends up in the eval log for per-topology aggregation.
+"""
+
+from __future__ import annotations
+
+import logging
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+from inspect_ai.log import transcript
+from inspect_ai.util import store
+
+logger = logging.getLogger(__name__)
+
+# Source of transcript events and prefix of sample store keys
+TELEMETRY_SOURCE = "inspect_kathara"
+
+
+@dataclass
+class PhaseTimer:
+    """Wall-clock durations of the phases of one sandbox operation."""
+
+    operation: str
+    phases: dict[str, float] = field(default_factory=dict)
+    services: dict[str, float] = field(default_factory=dict)
+    stages: dict[str, float] = field(default_factory=dict)
+    attributes: dict[str, Any] = field(default_factory=dict)
+    started_at: float = field(default_factory=time.monotonic)
+
+    @contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        """Time the enclosed block as phase *name* (recorded even if it raises)."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + time.monotonic() - start
+
+    @property
+    def total(self) -> float:
+        return time.monotonic() - self.started_at
+
+    def to_dict(self) -> dict[str, Any]:
+        return {
+            "operation": self.operation,
+            "total": round(self.total, 3),
+            "phases": {name: round(seconds, 3) for name, seconds in self.phases.items()},
+            "services": {name: round(seconds, 3) for name, seconds in self.services.items()},
+            "stages": {name: round(seconds, 3) for name, seconds in self.stages.items()},
+            **self.attributes,
+        }
+
+
+def emit_timing(timer: PhaseTimer, attach: bool = True) -> dict[str, Any]:
+    """Log *timer* and, when *attach* is set, record it on the current sample.
+
+    Returns:
+        The emitted record.
+    """
+    data = timer.to_dict()
+    phases = ", ".join(f"{name}={seconds:.2f}s" for name, seconds in data["phases"].items())
+    logger.debug(
+        f"Kathara {timer.operation} took {data['total']:.2f}s ({phases})",
+        extra={"kathara_timing": data},
+    )
+    if attach:
+        try:
+            transcript().info(data, source=TELEMETRY_SOURCE)
+            store().set(f"{TELEMETRY_SOURCE}:{timer.operation}", data)
+        except Exception as e:
+            logger.debug(f"Failed to attach Kathara timing to sample: {e}")
+    return data
@@ -0,0 +1,145 @@
+"""Streaming file transfer to and from containers over ``docker exec``.
+
+The Docker sandbox's ``read_file``/``write_file`` move whole files through
+memory. Packet captures, FRR logs and routing table dumps can approach
+``MAX_FILE_SIZE``, and scorers often only need part of them. Here a file is
+piped through one ``docker exec`` per transfer and consumed chunk by chunk:
+
+- reads select a byte range in the container (``tail -c``/``head -c``), so
+  only the requested range leaves the container;
+- optional gzip compresses the stream on the sending side (``gzip -c`` in
+  the container for reads, ``zlib`` on the host for writes), which helps when
+  ``DOCKER_HOST`` is remote.
+
+Memory per transfer is bounded by the chunk size, not the file size.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import zlib
+from typing import AsyncIterable, AsyncIterator, Iterable
+
+# Bytes read from the exec's stdout at a time
+TRANSFER_CHUNK_SIZE = 256 * 1024
+# gzip level of compressed transfers (favours speed; logs and dumps compress well anyway)
+TRANSFER_GZIP_LEVEL = 1
+
+# Exit status used by the read script for a missing or unreadable file
+_NOT_FOUND = 3
+
+_READ_SCRIPT = f"""\
+[ -f "$1" ] && [ -r "$1" ] || {{ echo "$1: no such file" >&2; exit {_NOT_FOUND}; }}
+if [ "$2" -lt 0 ]; then tail -c "${{2#-}}" "$1"; else tail -c "+$(($2 + 1))" "$1"; fi | $3 | $4
+"""
+
+_WRITE_SCRIPT = """\
+mkdir -p "$(dirname "$1")" && $2 > "$1"
+"""
+
+
+def _read_command(container: str, file: str, offset: int, length: int | None, compress: bool) -> list[str]:
+    limit = "cat" if length is None else f"head -c {int(length)}"
+    encode = f"gzip -c -{TRANSFER_GZIP_LEVEL}" if compress else "cat"
+    return ["docker", "exec", container, "sh", "-c", _READ_SCRIPT, "sh", file, str(int(offset)), limit, encode]
+
+
+async def read_chunks(
+    container: str,
+    file: str,
+    offset: int = 0,
+    length: int | None = None,
+    compress: bool = False,
+    chunk_size: int = TRANSFER_CHUNK_SIZE,
+) -> AsyncIterator[bytes]:
+    """Yield the bytes of *file* in *container*, from *offset* (negative: from the end) for *length* bytes.
+
+    Raises:
+        FileNotFoundError: If *file* does not exist or is not readable.
+        RuntimeError: If the transfer fails otherwise.
+    """
+    process = await asyncio.create_subprocess_exec(
+        *_read_command(container, file, offset, length, compress),
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    assert process.stdout is not None and process.stderr is not None
+    errors = asyncio.ensure_future(process.stderr.read())
+    decoder = zlib.decompressobj(wbits=31) if compress else None
+    try:
+        while chunk := await process.stdout.read(chunk_size):
+            if decoder is not None:
+                chunk = decoder.decompress(chunk)
+            if chunk:
+                yield chunk
+        returncode = await process.wait()
+        message = (await errors).decode(errors="replace").strip()
+        if returncode == _NOT_FOUND:
+            raise FileNotFoundError(message or file)
+        if returncode != 0:
+            raise RuntimeError(f"Reading {file} from {container} failed ({returncode}): {message}")
+        if decoder is not None and (rest := decoder.flush()):
+            yield rest
+    finally:
+        if process.returncode is None:
+            process.kill()
+            await process.wait()
+        errors.cancel()
+
+
+async def write_chunks(
+    container: str,
+    file: str,
+    chunks: AsyncIterable[bytes] | Iterable[bytes],
+    compress: bool = False,
+) -> int:
+    """Stream *chunks* into *file* in *container* (parent directories are created).
+
+    Returns:
+        Bytes written (before compression).
+
+    Raises:
+        RuntimeError: If the container side of the transfer fails.
+    """
+    decode = "gzip -dc" if compress else "cat"
+    process = await asyncio.create_subprocess_exec(
+        *["docker", "exec", "-i", container, "sh", "-c", _WRITE_SCRIPT, "sh", file, decode],
+        stdin=asyncio.subprocess.PIPE,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    assert process.stdin is not None and process.stderr is not None
+    errors = asyncio.ensure_future(process.stderr.read())
+    encoder = zlib.compressobj(TRANSFER_GZIP_LEVEL, wbits=31) if compress else None
+    written = 0
+    try:
+        async for chunk in _aiter(chunks):
+            written += len(chunk)
+            process.stdin.write(encoder.compress(chunk) if encoder is not None else chunk)
+            await process.stdin.drain()
+        if encoder is not None:
+            process.stdin.write(encoder.flush())
+        process.stdin.close()
+        await process.stdin.wait_closed()
+    except (BrokenPipeError, ConnectionResetError):
+        pass  # the container side exited early: reported from its status below
+    except BaseException:
+        process.kill()
+        await process.wait()
+        errors.cancel()
+        raise
+    returncode = await process.wait()
+    message = (await errors).decode(errors="replace").strip()
+    if returncode != 0:
+        raise RuntimeError(f"Writing {file} to {container} failed ({returncode}): {message}")
+    return written
+
+
+async def _aiter(chunks: AsyncIterable[bytes] | Iterable[bytes]) -> AsyncIterator[bytes]:
+    if isinstance(chunks, AsyncIterable):
+        async for chunk in chunks:
+            yield chunk
+    else:
+        for chunk in chunks:
+            yield chunk
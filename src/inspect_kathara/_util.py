@@ -1,64 +1,144 @@
 from __future__ import annotations
 
+import asyncio
+import codecs
+import hashlib
+import logging
+import os
+import re
 import subprocess
+import threading
+import time
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Any
+from types import MappingProxyType
+from typing import Any, BinaryIO, Iterable, Iterator, Mapping, Sequence
+
+import yaml  # type: ignore[import-untyped]
+
+from inspect_kathara._docker_api import DockerAPIClient, DockerAPIError, get_docker_client
+
+logger = logging.getLogger(__name__)
 
 MAX_EXEC_OUTPUT = 10 * 1024 * 1024
 MAX_FILE_SIZE = 100 * 1024 * 1024
 DEFAULT_IMAGE = "kathara/base"
 
+# Seconds a `docker images` listing is trusted before it is refreshed
+IMAGE_INVENTORY_TTL = 60.0
+# Maximum concurrent `docker pull`/`docker build` calls when resolving images
+IMAGE_PULL_CONCURRENCY = 4
+# Parsed lab.conf files kept in memory (least recently used are evicted first)
+LAB_CONF_CACHE_SIZE = 256
+
+# Where generated services mount the shared startup prologue and their startup script
+STARTUP_PROLOGUE_PATH = "/kathara/prologue.sh"
+STARTUP_SCRIPT_PATH = "/kathara/startup.sh"
+
+# libyaml-backed safe dumper/loader when PyYAML was built with it (same output, several times faster)
+YAML_DUMPER = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+YAML_LOADER = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+
 IMAGE_CONFIGS: dict[str, dict[str, Any]] = {
-    "kathara/frr": {"services": ["frr"], "startup_delay": 5, "routing_capable": True, "vtysh_available": True},
+    "kathara/frr": {
+        "services": ["frr"],
+        "startup_delay": 5,
+        "routing_capable": True,
+        "vtysh_available": True,
+        "memory_mb": 256,
+    },
     "kathara/quagga": {
         "services": ["zebra", "ospfd", "bgpd", "ripd"],
         "startup_delay": 5,
         "routing_capable": True,
         "vtysh_available": True,
+        "memory_mb": 192,
     },
     "kathara/openbgpd": {
         "services": ["openbgpd"],
         "startup_delay": 3,
         "routing_capable": True,
         "vtysh_available": False,
+        "memory_mb": 128,
+    },
+    "kathara/bird": {
+        "services": ["bird"],
+        "startup_delay": 3,
+        "routing_capable": True,
+        "vtysh_available": False,
+        "memory_mb": 128,
+    },
+    "kathara/bind": {
+        "services": ["named"],
+        "startup_delay": 3,
+        "routing_capable": False,
+        "vtysh_available": False,
+        "memory_mb": 192,
     },
-    "kathara/bird": {"services": ["bird"], "startup_delay": 3, "routing_capable": True, "vtysh_available": False},
-    "kathara/bind": {"services": ["named"], "startup_delay": 3, "routing_capable": False, "vtysh_available": False},
     "kathara/sdn": {
         "services": ["openvswitch-switch"],
         "startup_delay": 5,
         "routing_capable": True,
         "vtysh_available": False,
+        "memory_mb": 384,
     },
     "kathara/p4": {
         "services": ["simple_switch_grpc"],
         "startup_delay": 5,
         "routing_capable": True,
         "vtysh_available": False,
+        "memory_mb": 512,
+    },
+    "kathara/scion": {
+        "services": [],
+        "startup_delay": 8,
+        "routing_capable": False,
+        "vtysh_available": False,
+        "memory_mb": 512,
+    },
+    "kathara/base": {
+        "services": [],
+        "startup_delay": 1,
+        "routing_capable": False,
+        "vtysh_available": False,
+        "memory_mb": 96,
     },
-    "kathara/scion": {"services": [], "startup_delay": 8, "routing_capable": False, "vtysh_available": False},
-    "kathara/base": {"services": [], "startup_delay": 1, "routing_capable": False, "vtysh_available": False},
     # NIKA images
-    "kathara/nika-base": {"services": [], "startup_delay": 1, "routing_capable": False, "vtysh_available": False},
-    "kathara/nika-frr": {"services": ["frr"], "startup_delay": 5, "routing_capable": True, "vtysh_available": True},
+    "kathara/nika-base": {
+        "services": [],
+        "startup_delay": 1,
+        "routing_capable": False,
+        "vtysh_available": False,
+        "memory_mb": 96,
+    },
+    "kathara/nika-frr": {
+        "services": ["frr"],
+        "startup_delay": 5,
+        "routing_capable": True,
+        "vtysh_available": True,
+        "memory_mb": 256,
+    },
     "kathara/nika-wireguard": {
         "services": ["wireguard"],
         "startup_delay": 5,
         "routing_capable": False,
         "vtysh_available": False,
+        "memory_mb": 128,
     },
     "kathara/nika-ryu": {
         "services": ["ryu-manager"],
         "startup_delay": 3,
         "routing_capable": True,
         "vtysh_available": False,
+        "memory_mb": 256,
     },
     "kathara/nika-influxdb": {
         "services": ["influx"],
         "startup_delay": 3,
         "routing_capable": False,
         "vtysh_available": False,
+        "memory_mb": 512,
     },
 }
 
@@ -79,51 +159,281 @@ def build_docker_image(image: str, docker_file: Path | None = None) -> str:
     return image
 
 
-def validate_kathara_image(image: str) -> str:
+class _ImageInventory:
+    """Process-wide view of local Docker image repositories.
+
+    Built from a single ``docker images`` listing and refreshed at most every
+    ``IMAGE_INVENTORY_TTL`` seconds. Images confirmed available (present,
+    pulled or built) are remembered for the life of the process, so repeated
+    validation during an eval never shells out again.
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._repositories: set[str] = set()
+        self._fetched_at: float | None = None
+        self._available: set[str] = set()
+        self._lock = threading.Lock()
+
+    def _list(self) -> set[str]:
+        result = subprocess.run(
+            ["docker", "images", "--format", "{{.Repository}}"], check=True, capture_output=True, text=True
+        )
+        return set(result.stdout.strip().splitlines())
+
+    def refresh(self) -> None:
+        self.update(self._list())
+
+    def update(self, repositories: set[str]) -> None:
+        """Replace the listing with *repositories* (e.g. fetched through the Engine API)."""
+        with self._lock:
+            self._repositories = repositories
+            self._fetched_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._fetched_at = None
+
+    def is_available(self, image: str) -> bool:
+        """True if *image* is known locally, refreshing a stale listing first."""
+        # Compare by repository name (image may include tag, e.g. kathara/frr:9)
+        image_repo = image.split(":")[0]
+        with self._lock:
+            if image in self._available:
+                return True
+            stale = self._fetched_at is None or time.monotonic() - self._fetched_at > self.ttl
+        if stale:
+            self.refresh()
+        with self._lock:
+            if image_repo in self._repositories:
+                self._available.add(image)
+                return True
+        return False
+
+    def mark_available(self, image: str) -> None:
+        with self._lock:
+            self._available.add(image)
+            self._repositories.add(image.split(":")[0])
+
+    def clear(self) -> None:
+        with self._lock:
+            self._repositories.clear()
+            self._available.clear()
+            self._fetched_at = None
+
+
+_image_inventory = _ImageInventory(IMAGE_INVENTORY_TTL)
+
+
+def check_kathara_image_name(image: str) -> str:
+    """Reject non-``kathara/*`` images without touching Docker."""
     if not image.startswith("kathara/"):
         raise ValueError(f"Only kathara/* images allowed, got: {image}")
-    local_images = (
-        subprocess.run(["docker", "images", "--format", "{{.Repository}}"], check=True, capture_output=True, text=True)
-        .stdout.strip()
-        .splitlines()
-    )
-    # Compare by repository name (image may include tag, e.g. kathara/frr:9)
-    image_repo = image.split(":")[0]
-    if image_repo in local_images:
+    return image
+
+
+def validate_kathara_image(image: str) -> str:
+    check_kathara_image_name(image)
+    if _image_inventory.is_available(image):
         return image
     # Prefer pull from Docker registry (e.g. Docker Hub); fall back to local Dockerfile if not found
     subprocess.run(["docker", "pull", image], capture_output=True, text=True)
     # Verify image exists locally (returncode alone is not reliable)
-    local_after = (
-        subprocess.run(["docker", "images", "--format", "{{.Repository}}"], check=True, capture_output=True, text=True)
-        .stdout.strip()
-        .splitlines()
-    )
-    if image_repo in local_after:
+    _image_inventory.invalidate()
+    if _image_inventory.is_available(image):
         return image
     build_docker_image(image)
+    _image_inventory.mark_available(image)
     return image
 
 
-def truncate_output(output: str, max_size: int = MAX_EXEC_OUTPUT) -> str:
-    if len(output.encode("utf-8")) <= max_size:
-        return output
-    truncated = output.encode("utf-8")[-max_size:]
-    for i in range(4):
+async def ensure_kathara_images(images: Iterable[str], max_parallel: int = IMAGE_PULL_CONCURRENCY) -> list[str]:
+    """Make every ``kathara/*`` image in *images* available locally.
+
+    Checks all images against one inventory listing, then pulls (or builds)
+    the missing ones with at most *max_parallel* running at once. Listing and
+    pulls go through the Docker Engine API socket when it is reachable, and
+    through the ``docker`` CLI otherwise. Non-kathara images are ignored.
+
+    Returns:
+        The distinct kathara images that were checked, in first-seen order.
+    """
+    distinct = [image for image in dict.fromkeys(images) if image.startswith("kathara/")]
+    client: DockerAPIClient | None = get_docker_client() if distinct else None
+    if client is not None:
         try:
-            return truncated[i:].decode("utf-8")
-        except UnicodeDecodeError:
+            _image_inventory.update(await client.image_repositories())
+        except (DockerAPIError, OSError) as e:
+            logger.debug(f"Docker API unavailable for image listing, using CLI: {e}")
+            client = None
+    available = await asyncio.to_thread(lambda: [_image_inventory.is_available(image) for image in distinct])
+    missing = [image for image, present in zip(distinct, available) if not present]
+
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+
+    async def resolve(image: str) -> None:
+        async with semaphore:
+            if client is not None:
+                try:
+                    await client.pull(image)
+                    _image_inventory.mark_available(image)
+                    return
+                except (DockerAPIError, OSError) as e:
+                    # Not on the registry (local NIKA images) or daemon error: pull/build via CLI
+                    logger.debug(f"Docker API pull of {image} failed: {e}")
+            await asyncio.to_thread(validate_kathara_image, image)
+
+    await asyncio.gather(*(resolve(image) for image in missing))
+    return distinct
+
+
+class OutputCapture:
+    """Bounded capture of a byte stream: its first *head* bytes and a ring buffer of the rest's tail.
+
+    Memory stays at *limit* bytes however much is fed. ``text()`` decodes
+    the retained bytes on UTF-8 character boundaries and marks the omitted
+    middle, staying within *limit* encoded bytes.
+    """
+
+    # Bytes kept free for the omission marker
+    MARKER_RESERVE = 64
+
+    def __init__(self, limit: int = MAX_EXEC_OUTPUT, head: int | None = None):
+        self.limit = limit
+        self.head_limit = min(64 * 1024, limit // 4) if head is None else min(head, limit)
+        self.tail_limit = max(0, limit - self.head_limit - self.MARKER_RESERVE)
+        self._head = bytearray()
+        # Grows up to tail_limit, then wraps: _ring_end is the oldest byte
+        self._ring = bytearray()
+        self._ring_end = 0
+        self.total = 0
+
+    @property
+    def truncated(self) -> bool:
+        """True when part of the stream was dropped."""
+        return self.total > len(self._head) + len(self._ring)
+
+    def feed(self, data: bytes) -> None:
+        self.total += len(data)
+        if len(self._head) < self.head_limit:
+            take = self.head_limit - len(self._head)
+            self._head += data[:take]
+            data = data[take:]
+        size = self.tail_limit
+        if not data or not size:
+            return
+        if len(self._ring) < size:
+            take = size - len(self._ring)
+            self._ring += data[:take]
+            data = data[take:]
+        if not data:
+            return
+        if len(data) >= size:
+            self._ring[:] = data[-size:]
+            self._ring_end = 0
+            return
+        first = min(len(data), size - self._ring_end)
+        self._ring[self._ring_end : self._ring_end + first] = data[:first]
+        self._ring[: len(data) - first] = data[first:]
+        self._ring_end = (self._ring_end + len(data)) % size
+
+    def skip(self, count: int) -> None:
+        """Account for *count* bytes of the stream's middle that were never read."""
+        self.total += count
+
+    def tail(self) -> bytes:
+        return bytes(self._ring[self._ring_end :] + self._ring[: self._ring_end])
+
+    def text(self) -> str:
+        head, tail = bytes(self._head), self.tail()
+        omitted = self.total - len(head) - len(tail)
+        if not omitted:
+            return (head + tail).decode("utf-8", errors="replace")
+        # Cut characters split by the omission: the head's incomplete end and the tail's continuation bytes
+        head = head[: _utf8_boundary(head)]
+        start = next((i for i in range(min(4, len(tail))) if tail[i] & 0xC0 != 0x80), 0)
+        return (
+            f"{head.decode('utf-8', errors='replace')}\n[... {omitted} bytes omitted ...]\n"
+            f"{tail[start:].decode('utf-8', errors='replace')}"
+        )
+
+
+def _utf8_boundary(data: bytes) -> int:
+    """Length of *data* without a trailing incomplete UTF-8 sequence."""
+    for back in range(1, min(4, len(data)) + 1):
+        byte = data[-back]
+        if byte & 0xC0 == 0x80:
             continue
-    return truncated.decode("utf-8", errors="ignore")
+        needed = 1 if byte < 0x80 else 2 if byte >> 5 == 0b110 else 3 if byte >> 4 == 0b1110 else 4
+        return len(data) if needed <= back else len(data) - back
+    return len(data)
+
+
+def truncate_output(output: str, max_size: int = MAX_EXEC_OUTPUT) -> str:
+    """The last *max_size* UTF-8 bytes of *output*, starting on a character boundary.
+
+    Unlike ``OutputCapture.text()`` this keeps only the tail, without an
+    omission marker.
+    """
+    encoded = output.encode("utf-8")
+    if len(encoded) <= max_size:
+        return output
+    truncated = encoded[-max_size:]
+    start = next((i for i in range(min(4, len(truncated))) if truncated[i] & 0xC0 != 0x80), 0)
+    return truncated[start:].decode("utf-8", errors="replace")
+
+
+class LabConfError(ValueError):
+    """A lab.conf line that could not be parsed, with its location."""
+
+    def __init__(self, message: str, path: str | Path, line: int):
+        super().__init__(f"{path}:{line}: {message}")
+        self.path = str(path)
+        self.line = line
+
+
+_EMPTY_MAPPING: Mapping[Any, str] = MappingProxyType({})
 
 
 class MachineConfig:
     """Machine config from lab.conf. collision_domains is (eth_index, domain) for deterministic interface order."""
 
+    # Most machines set only interfaces and an image. Every other directive defaults to a class
+    # attribute (None, False or an immutable empty container) that the parser replaces on the
+    # instance when the directive is set, so a parse of thousands of machines allocates little.
+    image: str | None = None
+    macs: Mapping[int, str] = _EMPTY_MAPPING
+    mem: str | None = None
+    cpus: float | None = None
+    bridged: bool = False
+    ipv6: bool | None = None
+    exec_commands: Sequence[str] = ()
+    sysctls: Mapping[str, str] = _EMPTY_MAPPING
+    envs: Mapping[str, str] = _EMPTY_MAPPING
+    ports: Sequence[str] = ()
+    # Recognised Kathara directives without a compose equivalent (shell, num_terms, ...)
+    options: Mapping[str, str] = _EMPTY_MAPPING
+
+    # Every attribute a compose service fragment is generated from, in a stable order
+    FIELDS = (
+        "name",
+        "collision_domains",
+        "image",
+        "macs",
+        "mem",
+        "cpus",
+        "bridged",
+        "ipv6",
+        "exec_commands",
+        "sysctls",
+        "envs",
+        "ports",
+        "options",
+    )
+
     def __init__(self, name: str):
         self.name = name
         self.collision_domains: list[tuple[int, str]] = []
-        self.image: str | None = None
 
     def networks_in_eth_order(self) -> list[str]:
         """Domain names in eth0, eth1, ... order for compose networks list."""
@@ -138,60 +448,279 @@ class MachineConfig:
 class LabConfig:
     machines: dict[str, MachineConfig] = field(default_factory=dict)
     metadata: dict[str, str] = field(default_factory=dict)
-
-
-def parse_lab_conf(lab_conf_path: Path) -> LabConfig:
-    machines: dict[str, MachineConfig] = {}
-    metadata: dict[str, str] = {}
-
-    if not lab_conf_path.exists():
-        return LabConfig(machines=machines, metadata=metadata)
-
-    with open(lab_conf_path, "r") as f:
-        for line in f:
-            line = line.strip()
-            if not line or line.startswith("#"):
+    errors: list[LabConfError] = field(default_factory=list)
+
+
+# Names on the left of `machine[key]=value` and `KEY=value` lines (values are split off with str.partition)
+_MACHINE_NAME = re.compile(r"[^\s\[\]=#]+")
+_META_NAME = re.compile(r"[A-Za-z_][\w.\-]*")
+_MAC = re.compile(r"[0-9A-Fa-f]{2}(?::[0-9A-Fa-f]{2}){5}")
+_MEMORY = re.compile(r"\d+(?:\.\d+)?[bkmgBKMG]?")
+_LAB_METADATA_KEYS = ("name", "description", "author", "email", "version", "web")
+_BOOLEANS = {"true": True, "yes": True, "1": True, "false": False, "no": False, "0": False}
+# Kathara directives that are accepted but have no compose equivalent
+_PASSTHROUGH_KEYS = ("shell", "num_terms", "ulimit", "privileged", "entrypoint", "args")
+
+
+def _unquote(value: str) -> str:
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in "\"'":
+        return value[1:-1]
+    return value.strip('"')
+
+
+def _add_interface(machine: MachineConfig, key: str, value: str) -> None:
+    """Add one ``machine[N]=domain[/mac]`` interface, raising ValueError for invalid ones."""
+    domain, _, mac = value.partition("/")
+    domain = domain.strip('"')
+    if not domain:
+        raise ValueError(f"empty collision domain for {machine.name}[{key}]")
+    eth_index = int(key)
+    for index, _ in machine.collision_domains:
+        if index == eth_index:
+            raise ValueError(f"duplicate interface {machine.name}[{key}]")
+    if mac:
+        if not _MAC.fullmatch(mac):
+            raise ValueError(f"invalid MAC address {mac!r} for {machine.name}[{key}]")
+        machine.macs = {**machine.macs, eth_index: mac.lower()}
+    machine.collision_domains.append((eth_index, domain))
+
+
+def _apply_machine_directive(machine: MachineConfig, key: str, value: str) -> None:
+    """Set one named ``machine[key]=value`` directive, raising ValueError for invalid ones."""
+    key = key.lower()
+    if key == "image":
+        machine.image = value
+    elif key == "mem":
+        if not _MEMORY.fullmatch(value):
+            raise ValueError(f"invalid memory limit {value!r} for {machine.name}")
+        # Kathara reads a limit without a unit as megabytes; compose would read bytes
+        machine.mem = value.lower() if value[-1].isalpha() else f"{value}m"
+    elif key == "cpus":
+        try:
+            cpus = float(value)
+        except ValueError:
+            raise ValueError(f"invalid cpus {value!r} for {machine.name}") from None
+        if cpus <= 0:
+            raise ValueError(f"cpus must be positive for {machine.name}, got {value!r}")
+        machine.cpus = cpus
+    elif key in ("bridged", "ipv6"):
+        if value.lower() not in _BOOLEANS:
+            raise ValueError(f"expected true/false for {machine.name}[{key}], got {value!r}")
+        setattr(machine, key, _BOOLEANS[value.lower()])
+    elif key == "exec":
+        machine.exec_commands = [*machine.exec_commands, value]
+    elif key in ("sysctl", "env"):
+        name, sep, setting = value.partition("=")
+        if not sep or not name.strip():
+            raise ValueError(f"expected KEY=VALUE for {machine.name}[{key}], got {value!r}")
+        if key == "sysctl":
+            machine.sysctls = {**machine.sysctls, name.strip(): setting.strip()}
+        else:
+            machine.envs = {**machine.envs, name.strip(): setting.strip()}
+    elif key == "port":
+        machine.ports = [*machine.ports, value]
+    elif key in _PASSTHROUGH_KEYS:
+        machine.options = {**machine.options, key: value}
+    else:
+        raise ValueError(f"unknown directive {machine.name}[{key}]")
+
+
+def parse_lab_conf_lines(lines: Iterable[str], source: str | Path = "lab.conf", strict: bool = False) -> LabConfig:
+    """Parse lab.conf lines in a single pass.
+
+    Args:
+        lines: Lines of a lab.conf file (e.g. an open file, consumed as a stream).
+        source: Name used in error messages.
+        strict: Raise the first LabConfError instead of recording it in
+            ``LabConfig.errors`` and skipping the line.
+    """
+    lab = LabConfig()
+    machines = lab.machines
+    metadata = lab.metadata
+
+    for lineno, raw in enumerate(lines, start=1):
+        line = raw.strip()
+        if not line or line[0] == "#":
+            continue
+        # str.partition rather than a regex per line: this loop dominates parse time on large labs
+        head, sep, value = line.partition("=")
+        name, bracket, key = head.partition("[")
+        try:
+            if not sep:
+                raise ValueError(f"cannot parse line {line!r}")
+            if value[:1] == '"' and value[-1:] == '"' and len(value) >= 2:
+                value = value[1:-1]
+            else:
+                value = _unquote(value.strip())
+            if not bracket:
+                name = name.rstrip()
+                if not _META_NAME.fullmatch(name):
+                    raise ValueError(f"cannot parse line {line!r}")
+                metadata[name.upper()] = value
                 continue
-
-            if "[" in line and "]" in line and "=" in line:
-                try:
-                    machine_name = line.split("[")[0].strip()
-                    if machine_name.isupper():
-                        bracket_content = line.split("[")[1].split("]")[0].strip()
-                        value = line.split("=", 1)[1].strip().strip('"')
-                        metadata[f"{machine_name}_{bracket_content}".upper()] = value
-                        if machine_name == "LAB" or bracket_content.lower() in (
-                            "name",
-                            "description",
-                            "author",
-                            "email",
-                            "version",
-                            "web",
-                        ):
-                            metadata[machine_name] = value
-                        continue
-
-                    bracket_content = line.split("[")[1].split("]")[0].strip()
-                    if machine_name not in machines:
-                        machines[machine_name] = MachineConfig(machine_name)
-
-                    if bracket_content.isdigit():
-                        eth_index = int(bracket_content)
-                        domain = line.split("=")[1].strip().strip('"').split("/")[0].strip('"')
-                        machines[machine_name].collision_domains.append((eth_index, domain))
-                    elif bracket_content.lower() == "image":
-                        machines[machine_name].image = line.split("=")[1].strip().strip('"')
-                except (IndexError, ValueError):
+            if key[-1:] != "]":
+                key = key.rstrip()
+                if key[-1:] != "]":
+                    raise ValueError(f"cannot parse line {line!r}")
+            key = key[:-1].strip()
+
+            machine = machines.get(name)
+            if machine is None:
+                name = name.rstrip()
+                machine = machines.get(name)
+            if machine is None:
+                if not _MACHINE_NAME.fullmatch(name):
+                    raise ValueError(f"cannot parse line {line!r}")
+                if name.isupper():
+                    metadata[f"{name}_{key}".upper()] = value
+                    if name == "LAB" or key.lower() in _LAB_METADATA_KEYS:
+                        metadata[name] = value
                     continue
-
-            elif "=" in line and "[" not in line:
-                try:
-                    key, value = line.split("=", 1)
-                    metadata[key.strip().upper()] = value.strip().strip('"')
-                except ValueError:
-                    continue
-
-    return LabConfig(machines=machines, metadata=metadata)
+                machine = machines[name] = MachineConfig(name)
+            # Inline fast paths for the lines every machine has: its first interface and its image
+            if key.isdigit():
+                if machine.collision_domains or not value or "/" in value or '"' in value:
+                    _add_interface(machine, key, value)
+                else:
+                    machine.collision_domains.append((int(key), value))
+            elif key == "image":
+                machine.image = value
+            else:
+                _apply_machine_directive(machine, key, value)
+        except ValueError as e:
+            error = LabConfError(str(e), source, lineno)
+            if strict:
+                raise error from None
+            logger.warning(f"Ignoring invalid lab.conf line: {error}")
+            lab.errors.append(error)
+
+    return lab
+
+
+def parse_lab_conf(lab_conf_path: Path, strict: bool = False) -> LabConfig:
+    """Parse a Kathara lab.conf file.
+
+    Besides interfaces (``pc1[0]="A"`` or ``pc1[0]="A/02:42:ac:11:00:02"``) and
+    ``image``, the ``mem``, ``cpus``, ``bridged``, ``ipv6``, ``exec``,
+    ``sysctl``, ``env`` and ``port`` directives are kept on the machine.
+    Invalid lines are reported with their line number: logged and collected in
+    ``LabConfig.errors``, or raised as LabConfError when *strict* is set.
+    A missing file yields an empty LabConfig.
+
+    Results are memoized per file (see ``_LabConfCache``), so the returned
+    LabConfig is shared between callers and must not be modified.
+    """
+    if not lab_conf_path.exists():
+        return LabConfig()
+    lab = _lab_conf_cache.get(lab_conf_path)
+    if strict and lab.errors:
+        raise lab.errors[0]
+    return lab
+
+
+class _LabConfCache:
+    """Process-wide LRU cache of parsed lab.conf files.
+
+    Entries are keyed by absolute path and validated on every lookup with a
+    ``stat``: an unchanged mtime and size is a hit. When either changed, the
+    file is hashed and only re-parsed if its sha256 differs from the cached
+    content (e.g. a ``touch`` or a checkout rewriting identical bytes). A path
+    without an entry is read once, hashing each line as it is fed to the
+    parser. Files are streamed rather than held in memory.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, tuple[tuple[int, int], str, LabConfig]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: Path) -> LabConfig:
+        # abspath rather than resolve(): realpath costs an lstat per path component on every lookup
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == signature:
+                self._entries.move_to_end(key)
+                return entry[2]
+
+        if entry is not None and entry[1] == (digest := _file_sha256(key)):
+            lab = entry[2]
+        else:
+            # A changed or unseen file is parsed anyway: hash it on the same pass
+            sha = hashlib.sha256()
+            with open(key, "rb") as f:
+                lab = parse_lab_conf_lines(_hashed_lines(f, sha), path)
+            digest = sha.hexdigest()
+
+        with self._lock:
+            self._entries[key] = (signature, digest, lab)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return lab
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+def _hashed_lines(f: BinaryIO, digest: Any) -> Iterator[str]:
+    """Decode *f* into lines, feeding the raw bytes to *digest* on the way.
+
+    Hashing and decoding line by line costs more than parsing the lines, so
+    both work on 4 KiB chunks (small enough that a chunk's lines add little
+    to the parse's peak memory).
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    partial = ""
+    while chunk := f.read(4 * 1024):
+        digest.update(chunk)
+        lines = (partial + decoder.decode(chunk)).split("\n")
+        partial = lines.pop()
+        yield from lines
+    partial += decoder.decode(b"", final=True)
+    if partial:
+        yield partial
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(64 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+_lab_conf_cache = _LabConfCache(LAB_CONF_CACHE_SIZE)
+
+
+def clear_lab_conf_cache() -> None:
+    """Forget every memoized lab.conf parse."""
+    _lab_conf_cache.clear()
+
+
+def machine_service_options(machine: MachineConfig) -> dict[str, Any]:
+    """Compose service keys for a machine's resource, sysctl, env and port directives."""
+    options: dict[str, Any] = {}
+    if machine.mem:
+        options["mem_limit"] = machine.mem
+    if machine.cpus is not None:
+        options["cpus"] = machine.cpus
+    sysctls = dict(machine.sysctls)
+    if machine.ipv6 is not None:
+        sysctls["net.ipv6.conf.all.disable_ipv6"] = "0" if machine.ipv6 else "1"
+    if sysctls:
+        options["sysctls"] = sysctls
+    if machine.envs:
+        options["environment"] = dict(machine.envs)
+    if machine.ports:
+        options["ports"] = list(machine.ports)
+    return options
 
 
 def get_image_config(image: str) -> dict[str, Any]:
@@ -214,6 +743,22 @@ def get_startup_delay(image: str) -> int:
     return int(get_image_config(image).get("startup_delay", 1))
 
 
+def get_memory_profile(image: str) -> int:
+    """Get the expected resident memory (MB) of one container running *image*."""
+    return int(get_image_config(image).get("memory_mb", 128))
+
+
+def parse_memory_mb(value: str | int | float) -> int:
+    """Convert a Docker/Kathara memory string (e.g. ``512m``, ``1g``, ``1024k``) to MB."""
+    if isinstance(value, (int, float)):
+        return int(value / (1024 * 1024))
+    text = str(value).strip().lower().rstrip("b")
+    units = {"k": 1 / 1024, "m": 1, "g": 1024, "t": 1024 * 1024}
+    if text and text[-1] in units:
+        return int(float(text[:-1]) * units[text[-1]])
+    return int(float(text) / (1024 * 1024))
+
+
 def get_image_services(image: str) -> list[str]:
     """Get the list of services that should be running for an image."""
     return list(get_image_config(image).get("services", []))
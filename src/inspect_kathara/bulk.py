@@ -0,0 +1,257 @@
+"""Compile compose files for every lab under a directory tree in parallel.
+
+Labs are discovered by their ``topology/lab.conf`` and compiled across a
+process pool. Workers generate offline (no Docker calls), writing each lab's
+compose.yaml; the distinct images of the whole batch are then resolved
+(pulled or built) once, in the parent. With ``--offline`` the resolution is
+skipped and an image manifest is written next to each compose file instead,
+and ``--resolve-only`` later resolves the images of those manifests. From
+async code, use ``compile_labs_async`` / ``resolve_labs_async``. Failures are reported per lab and never abort
+the batch.
+
+Usage::
+
+    inspect-kathara-compile labs/ --workers 8
+    inspect-kathara-compile labs/ --offline       # build box without Docker
+    inspect-kathara-compile labs/ --resolve-only  # eval host, before the eval
+    python -m inspect_kathara.bulk labs/
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+from inspect_kathara._util import IMAGE_PULL_CONCURRENCY, ensure_kathara_images, parse_lab_conf
+from inspect_kathara.sandbox import image_manifest_path, lab_images, write_compose_for_lab
+
+logger = logging.getLogger(__name__)
+
+# Directories never searched for labs
+_SKIP_DIRS = {"node_modules", "__pycache__"}
+
+
+@dataclass
+class LabResult:
+    """Outcome of compiling one lab."""
+
+    lab_path: Path
+    compose_file: Path | None = None
+    images: list[str] = field(default_factory=list)
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        return self.error is None
+
+
+def discover_labs(root: Path) -> list[Path]:
+    """Lab directories (parents of ``topology/lab.conf``) under *root*, sorted by path."""
+    labs = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if not d.startswith(".") and d not in _SKIP_DIRS)
+        if "lab.conf" in filenames and os.path.basename(dirpath) == "topology":
+            labs.append(Path(dirpath).parent)
+    return sorted(labs)
+
+
+def _describe(error: BaseException) -> str:
+    return f"{type(error).__name__}: {error}"
+
+
+def _compile_lab(lab_path: Path, incremental: bool, manifest: bool) -> tuple[Path, list[str]]:
+    """Write one lab's compose.yaml (and image manifest if *manifest*) offline (runs in a worker)."""
+    compose_file = write_compose_for_lab(lab_path, incremental=incremental, offline=True, manifest=manifest)
+    return compose_file, lab_images(parse_lab_conf(lab_path / "topology" / "lab.conf"))
+
+
+def _map(executor: Executor | None, fn: Callable[..., Any], *iterables: Iterable[Any]) -> Iterator[Any]:
+    """Like ``executor.map`` but yields ``(result, error)`` per item instead of raising."""
+    if executor is None:
+        for args in zip(*iterables):
+            try:
+                yield fn(*args), None
+            except Exception as e:
+                yield None, e
+        return
+    futures = [executor.submit(fn, *args) for args in zip(*iterables)]
+    for future in futures:
+        try:
+            yield future.result(), None
+        except Exception as e:
+            yield None, e
+
+
+async def _resolve_images(images: list[str], max_parallel: int) -> dict[str, str]:
+    """Ensure each image once; return the error for every image that could not be resolved."""
+    semaphore = asyncio.Semaphore(max(1, max_parallel))
+
+    async def resolve(image: str) -> None:
+        async with semaphore:
+            await ensure_kathara_images([image])
+
+    outcomes = await asyncio.gather(*(resolve(image) for image in images), return_exceptions=True)
+    return {image: _describe(outcome) for image, outcome in zip(images, outcomes) if isinstance(outcome, BaseException)}
+
+
+def compile_labs(
+    labs: Iterable[Path],
+    workers: int | None = None,
+    incremental: bool = True,
+    offline: bool = False,
+    max_parallel_pulls: int = IMAGE_PULL_CONCURRENCY,
+) -> list[LabResult]:
+    """Compile compose.yaml for each lab directory in *labs*.
+
+    Image resolution runs its own event loop, so inside a running loop use
+    ``compile_labs_async`` (``offline`` compiles need no loop and work anywhere).
+
+    Args:
+        labs: Lab directories, each containing ``topology/lab.conf``.
+        workers: Worker processes (default: CPU count); 1 compiles in this process.
+        incremental: Reuse unchanged service fragments (see ``write_compose_for_lab``).
+        offline: Do not resolve images; write an image manifest next to each
+            compose file (``compose.images.json``) for ``resolve_labs`` instead.
+        max_parallel_pulls: Images pulled or built at once.
+
+    Returns:
+        One result per lab, in input order. Labs that fail to generate, or
+        whose images cannot be resolved, carry an error.
+    """
+    if not offline:
+        _require_no_running_loop("compile_labs")
+    results = _compile_results(labs, workers, incremental, offline)
+    if not offline:
+        asyncio.run(_resolve_results(results, max_parallel_pulls))
+    return results
+
+
+async def compile_labs_async(
+    labs: Iterable[Path],
+    workers: int | None = None,
+    incremental: bool = True,
+    offline: bool = False,
+    max_parallel_pulls: int = IMAGE_PULL_CONCURRENCY,
+) -> list[LabResult]:
+    """``compile_labs`` for callers inside an event loop (generation runs in a thread)."""
+    results = await asyncio.to_thread(_compile_results, labs, workers, incremental, offline)
+    if not offline:
+        await _resolve_results(results, max_parallel_pulls)
+    return results
+
+
+def _compile_results(labs: Iterable[Path], workers: int | None, incremental: bool, manifest: bool) -> list[LabResult]:
+    """Generate every lab's compose file offline across the process pool."""
+    results = [LabResult(Path(lab)) for lab in labs]
+    workers = workers or os.cpu_count() or 1
+    executor: Executor | None = None
+    if workers > 1 and len(results) > 1:
+        executor = ProcessPoolExecutor(max_workers=min(workers, len(results)))
+    try:
+        paths = [result.lab_path for result in results]
+        outputs = _map(executor, _compile_lab, paths, [incremental] * len(paths), [manifest] * len(paths))
+        for result, (output, error) in zip(results, outputs):
+            if error is not None:
+                result.error = _describe(error)
+            else:
+                result.compose_file, result.images = output
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return results
+
+
+async def _resolve_results(results: list[LabResult], max_parallel: int) -> None:
+    """Resolve the distinct images of all successful results once, failing labs whose images are unavailable."""
+    distinct = list(dict.fromkeys(image for result in results if result.ok for image in result.images))
+    failed_images = await _resolve_images(distinct, max_parallel)
+    for result in results:
+        missing = [image for image in result.images if image in failed_images]
+        if result.ok and missing:
+            result.error = f"image {missing[0]} unavailable: {failed_images[missing[0]]}"
+
+
+def _require_no_running_loop(caller: str) -> None:
+    """Fail fast when synchronous *caller* would need ``asyncio.run`` inside a running loop."""
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    raise RuntimeError(f"{caller}() cannot resolve images inside a running event loop, await {caller}_async()")
+
+
+def _manifest_results(labs: Iterable[Path]) -> list[LabResult]:
+    """One result per compiled lab, carrying the images of its manifest."""
+    results = []
+    for lab in labs:
+        compose_file = Path(lab) / "compose.yaml"
+        result = LabResult(Path(lab), compose_file=compose_file)
+        try:
+            result.images = json.loads(image_manifest_path(compose_file).read_text())["images"]
+        except (OSError, ValueError, KeyError) as e:
+            result.error = f"no image manifest: {_describe(e)}"
+        results.append(result)
+    return results
+
+
+def resolve_labs(labs: Iterable[Path], max_parallel_pulls: int = IMAGE_PULL_CONCURRENCY) -> list[LabResult]:
+    """Resolve the images recorded in the manifests of labs compiled offline."""
+    _require_no_running_loop("resolve_labs")
+    results = _manifest_results(labs)
+    asyncio.run(_resolve_results(results, max_parallel_pulls))
+    return results
+
+
+async def resolve_labs_async(labs: Iterable[Path], max_parallel_pulls: int = IMAGE_PULL_CONCURRENCY) -> list[LabResult]:
+    """``resolve_labs`` for callers inside an event loop."""
+    results = _manifest_results(labs)
+    await _resolve_results(results, max_parallel_pulls)
+    return results
+
+
+def compile_lab_tree(root: Path, **kwargs: Any) -> list[LabResult]:
+    """Discover every lab under *root* and compile them (see ``compile_labs``)."""
+    return compile_labs(discover_labs(root), **kwargs)
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(prog="inspect-kathara-compile", description=__doc__.split("\n\n")[0])
+    parser.add_argument("roots", nargs="+", type=Path, help="directories searched for topology/lab.conf")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--full", action="store_true", help="regenerate every service instead of incrementally")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--offline", action="store_true", help="write compose files and manifests, resolve no images")
+    mode.add_argument("--resolve-only", action="store_true", help="only resolve images of existing manifests")
+    parser.add_argument("--max-parallel-pulls", type=int, default=IMAGE_PULL_CONCURRENCY, help="concurrent pulls")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.WARNING, format="%(levelname)s %(message)s")
+
+    labs = [lab for root in args.roots for lab in discover_labs(root)]
+    if args.resolve_only:
+        results = resolve_labs(labs, max_parallel_pulls=args.max_parallel_pulls)
+    else:
+        results = compile_labs(
+            labs,
+            workers=args.workers,
+            incremental=not args.full,
+            offline=args.offline,
+            max_parallel_pulls=args.max_parallel_pulls,
+        )
+    failures = [result for result in results if not result.ok]
+    for result in failures:
+        print(f"FAILED {result.lab_path}: {result.error}", file=sys.stderr)
+    action = "Resolved images of" if args.resolve_only else "Compiled"
+    print(f"{action} {len(results) - len(failures)}/{len(results)} labs ({len(failures)} failed)")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -25,7 +25,7 @@ from typing import Any, TypedDict
 
 import yaml  # type: ignore[import-untyped]
 
-from inspect_kathara._util import parse_lab_conf
+from inspect_kathara._util import YAML_DUMPER, machine_service_options, parse_lab_conf
 
 logger = logging.getLogger(__name__)
 
@@ -157,13 +157,23 @@ def generate_compose_from_lab_conf(
 
         if is_router:
             service["sysctls"] = ROUTER_SYSCTLS.copy()
+        for key, value in machine_service_options(config).items():
+            if key == "sysctls":
+                service.setdefault("sysctls", {}).update(value)
+            else:
+                service[key] = value
+        if config.exec_commands:
+            commands = " && ".join([c.replace("$", "$$") for c in config.exec_commands] + ["tail -f /dev/null"])
+            service["command"] = ["sh", "-c", commands]
 
         # Connect to collision domain networks with explicit interface_name (Compose spec)
         if config.collision_domains:
-            service["networks"] = {
-                domain: {"interface_name": f"eth{eth_index}"}
-                for eth_index, domain in sorted(config.collision_domains, key=lambda x: x[0])
-            }
+            service["networks"] = {}
+            for eth_index, domain in sorted(config.collision_domains, key=lambda x: x[0]):
+                attachment = {"interface_name": f"eth{eth_index}"}
+                if eth_index in config.macs:
+                    attachment["mac_address"] = config.macs[eth_index]
+                service["networks"][domain] = attachment
 
         services[machine_name] = service
 
@@ -173,7 +183,7 @@ def generate_compose_from_lab_conf(
     }
 
     # Add header comment
-    yaml_content: str = yaml.dump(compose_dict, default_flow_style=False, sort_keys=False)
+    yaml_content: str = yaml.dump(compose_dict, default_flow_style=False, sort_keys=False, Dumper=YAML_DUMPER)
     header = f"# Auto-generated from lab.conf for lab: {lab_name}\n"
     header += "# Reference only - actual deployment uses Kathara API\n"
     header += f"# Machines: {', '.join(lab_config.machines.keys())}\n"
@@ -257,7 +267,7 @@ def generate_compose_from_topology(
     }
 
     # Add header comment
-    yaml_content: str = yaml.dump(compose_dict, default_flow_style=False, sort_keys=False)
+    yaml_content: str = yaml.dump(compose_dict, default_flow_style=False, sort_keys=False, Dumper=YAML_DUMPER)
     header = f"# Auto-generated from topology definition for lab: {lab_name}\n"
     header += "# Supports any kathara/* image from KatharaFramework/Docker-Images\n\n"
 
@@ -1,13 +1,29 @@
 from __future__ import annotations
 
 import asyncio
+import functools
+import hashlib
+import ipaddress
+import json
 import logging
+import os
+import re
+import stat
 import subprocess
-from pathlib import Path
-from typing import Any
+import tempfile
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timezone
+from pathlib import Path, PurePosixPath
+from typing import Any, AsyncIterable, AsyncIterator, Iterable
 
 import yaml  # type: ignore[import-untyped]
+from inspect_ai.util import ExecResult, OutputLimitExceededError, SandboxEnvironmentLimits
+from inspect_ai.util._sandbox.compose import COMPOSE_FILES
+from inspect_ai.util._sandbox.docker.compose import compose_ps
 from inspect_ai.util._sandbox.docker.docker import DockerSandboxEnvironment
+from inspect_ai.util._sandbox.docker.util import ComposeProject
 from inspect_ai.util._sandbox.environment import (
     SandboxEnvironment,
     SandboxEnvironmentConfigType,
@@ -15,13 +31,41 @@ from inspect_ai.util._sandbox.environment import (
 from inspect_ai.util._sandbox.registry import sandboxenv
 from typing_extensions import override
 
+from inspect_kathara._docker_api import DockerAPIClient, DockerAPIError, get_docker_client
+from inspect_kathara._leases import (
+    SubnetLease,
+    SubnetLeaseManager,
+    lease_dir,
+    network_prefixes,
+    subnet_pool,
+    subnet_prefix,
+    write_leased_compose,
+)
+from inspect_kathara._pool import WarmPool, compose_fingerprint, warm_pool_size
+from inspect_kathara._reuse import StackBaseline, capture_baseline, reset_stack, reuse_enabled
+from inspect_kathara._session import SessionError, ShellSession, sessions_enabled
+from inspect_kathara._telemetry import PhaseTimer, emit_timing
+from inspect_kathara._transfer import read_chunks, write_chunks
 from inspect_kathara._util import (
     DEFAULT_IMAGE,
+    IMAGE_PULL_CONCURRENCY,
+    MAX_FILE_SIZE,
+    STARTUP_PROLOGUE_PATH,
+    STARTUP_SCRIPT_PATH,
+    YAML_DUMPER,
+    YAML_LOADER,
+    LabConfig,
+    MachineConfig,
+    check_kathara_image_name,
+    ensure_kathara_images,
     get_frr_machines,
     get_image_services,
+    get_memory_profile,
     get_startup_delay,
     is_routing_image,
+    machine_service_options,
     parse_lab_conf,
+    parse_memory_mb,
     validate_kathara_image,
 )
 
@@ -31,59 +75,259 @@ logger = logging.getLogger(__name__)
 # Concurrency Control
 # -----------------------------------------------------------------------------
 
-# Module-level semaphore to serialize container startup across concurrent samples.
+# Module-level admission controller to bound concurrent container startup across samples.
 # This prevents Docker daemon overwhelm when multiple Kathara stacks start simultaneously.
-# The semaphore is initialized lazily to ensure it's created in the correct event loop.
-_startup_semaphore: asyncio.Semaphore | None = None
-_startup_semaphore_lock = asyncio.Lock()
+# The controller is initialized lazily to ensure it's created in the correct event loop.
+_startup_admission: _StartupAdmission | None = None
+_startup_admission_lock = asyncio.Lock()
+
+# Total startup tokens shared by concurrent sample_init calls. A stack costs the sum
+# of get_startup_delay() over its services (clamped to the budget), so several small
+# labs start together while a large FRR lab gets the daemon to itself.
+# Override with the INSPECT_KATHARA_STARTUP_BUDGET environment variable.
+DEFAULT_STARTUP_BUDGET = 40
+STARTUP_BUDGET_ENV = "INSPECT_KATHARA_STARTUP_BUDGET"
+
+# Interval (seconds) between health polls while waiting for a stack to become ready.
+# The upper bound on the wait comes from IMAGE_CONFIGS["startup_delay"] per image.
+READINESS_POLL_INTERVAL = 0.5
+
+# Tasks that share a process own separate stacks: state is scoped by task name and config,
+# matching the task_init/task_cleanup calls Inspect makes.
+_Scope = tuple[str, str]
+
+# Opt-in warm pools of pre-started stacks (INSPECT_KATHARA_WARM_POOL=<stacks per topology>).
+# Stacks reset in place at cleanup (INSPECT_KATHARA_REUSE=1) are returned to them as well.
+_warm_pools: dict[_Scope, WarmPool] = {}
+
+# Baseline state per running compose project, captured after its first sample_init (reuse mode).
+_baselines: dict[str, StackBaseline] = {}
+
+# Stale network pruning runs at most once per interval (seconds) per process.
+# Override with the INSPECT_KATHARA_PRUNE_INTERVAL environment variable.
+NETWORK_PRUNE_INTERVAL = 300.0
+PRUNE_INTERVAL_ENV = "INSPECT_KATHARA_PRUNE_INTERVAL"
+_last_network_prune: float | None = None
+
+# Parsed compose files kept in memory by _load_compose (keyed by path, mtime and size).
+COMPOSE_CACHE_SIZE = 64
+
+# Compose projects of stacks started by this process and not yet torn down, with their scope.
+_live_projects: dict[str, _Scope] = {}
+
+# Subnet lease per running compose project (see _leases), released when the stack is torn down.
+_subnet_leases: dict[str, SubnetLease] = {}
 
-# Stabilization delay (seconds) after containers start before releasing semaphore.
-# This allows services (FRR, BIND, etc.) to initialize before the next stack starts.
-STARTUP_STABILIZATION_DELAY = 5.0
+# Memory model for auto-scaling concurrency
+HOST_RESERVED_RAM_GB = 4  # Kept free for the host, dockerd and Inspect itself
+STACK_OVERHEAD_MB = 256  # Per-stack networks, containerd shims and compose bookkeeping
+DEFAULT_STACK_MEMORY_MB = 4096  # Assumed stack size until a topology is registered
+MAX_AUTO_CONCURRENCY = 16  # Upper bound on auto-scaled parallel stacks
 
-# Memory thresholds for auto-scaling concurrency
-MIN_TOTAL_RAM_GB = 16  # Minimum total RAM to allow parallel execution
-MIN_AVAILABLE_RAM_GB = 8  # Minimum available RAM to allow parallel execution
+# Estimated memory (MB) per registered topology, keyed by resolved path.
+# default_concurrency() has no task context, so tasks register the topologies
+# they use (see register_topology) and the largest one sizes the limit.
+_stack_memory_profiles: dict[str, int] = {}
 
 
-async def _get_startup_semaphore() -> asyncio.Semaphore:
-    """Get or create the startup semaphore (lazy initialization).
+class _StartupAdmission:
+    """Weighted, FIFO admission for stack startup.
 
-    The semaphore must be created within an async context to bind to the
+    Each caller acquires a number of tokens from a fixed budget and waits
+    until it is at the head of the queue and enough tokens are free, so large
+    requests are not starved by a stream of small ones.
+    """
+
+    def __init__(self, budget: int):
+        self.budget = max(1, budget)
+        self._available = self.budget
+        self._queue: deque[object] = deque()
+        self._cond = asyncio.Condition()
+
+    @property
+    def available(self) -> int:
+        return self._available
+
+    @asynccontextmanager
+    async def admit(self, tokens: int) -> AsyncIterator[int]:
+        """Hold *tokens* (clamped to ``[1, budget]``) for the duration of the block."""
+        tokens = max(1, min(tokens, self.budget))
+        ticket = object()
+        async with self._cond:
+            self._queue.append(ticket)
+            try:
+                await self._cond.wait_for(lambda: self._queue[0] is ticket and self._available >= tokens)
+            except BaseException:
+                self._queue.remove(ticket)
+                self._cond.notify_all()
+                raise
+            self._queue.popleft()
+            self._available -= tokens
+            self._cond.notify_all()
+        try:
+            yield tokens
+        finally:
+            async with self._cond:
+                self._available += tokens
+                self._cond.notify_all()
+
+
+def _scope(task_name: str, config: SandboxEnvironmentConfigType | None) -> _Scope:
+    return task_name, str(config)
+
+
+def _get_warm_pool(scope: _Scope) -> WarmPool | None:
+    """Get or create the warm pool of *scope*, or None when neither pooling nor reuse is enabled."""
+    pool = _warm_pools.get(scope)
+    if pool is None:
+        size = warm_pool_size()
+        if size > 0 or reuse_enabled():
+            pool = _warm_pools[scope] = WarmPool(size)
+    return pool
+
+
+def _stack_project(environments: dict[str, SandboxEnvironment]) -> ComposeProject:
+    """The compose project shared by all environments of one stack."""
+    return next(iter(environments.values())).as_type(DockerSandboxEnvironment)._project
+
+
+def _startup_budget() -> int:
+    """Startup token budget from the environment, or DEFAULT_STARTUP_BUDGET."""
+    value = os.environ.get(STARTUP_BUDGET_ENV)
+    if not value:
+        return DEFAULT_STARTUP_BUDGET
+    try:
+        return max(1, int(value))
+    except ValueError:
+        logger.warning(f"Ignoring invalid {STARTUP_BUDGET_ENV}={value!r}")
+        return DEFAULT_STARTUP_BUDGET
+
+
+async def _get_startup_admission() -> _StartupAdmission:
+    """Get or create the startup admission controller (lazy initialization).
+
+    The controller must be created within an async context to bind to the
     correct event loop. This function ensures thread-safe lazy creation.
     """
-    global _startup_semaphore
-    async with _startup_semaphore_lock:
-        if _startup_semaphore is None:
-            _startup_semaphore = asyncio.Semaphore(1)
-        return _startup_semaphore
+    global _startup_admission
+    async with _startup_admission_lock:
+        if _startup_admission is None:
+            _startup_admission = _StartupAdmission(_startup_budget())
+        return _startup_admission
+
 
+def _startup_cost(compose: dict[str, Any] | None) -> int | None:
+    """Startup tokens for a compose stack: the sum of per-image startup delays.
 
-def _calculate_safe_concurrency() -> int:
-    """Calculate safe concurrency based on system memory.
+    ``kathara/base`` services cost 1 each, so the cost grows with container
+    count, while FRR/BIND-style images weigh more. Returns None when the
+    compose file is unknown, which callers treat as the full budget.
+    """
+    services = (compose or {}).get("services") or {}
+    if not services:
+        return None
+    return sum(
+        get_startup_delay(svc.get("image") or DEFAULT_IMAGE) for svc in services.values() if isinstance(svc, dict)
+    )
 
-    Kathara stacks are memory-intensive:
-    - 26-38 containers per stack
-    - ~1.7GB memory per container
-    - ~4GB total per stack (after container overhead sharing)
+
+def _service_memory_mb(service: dict[str, Any]) -> int:
+    """Memory estimate for one compose service: explicit mem_limit, else the image profile."""
+    limit = service.get("mem_limit")
+    if limit:
+        try:
+            return parse_memory_mb(limit)
+        except ValueError:
+            pass
+    return get_memory_profile(service.get("image") or DEFAULT_IMAGE)
+
+
+def estimate_stack_memory(path: Path) -> int:
+    """Estimate the memory (MB) one running stack of a topology needs.
+
+    Args:
+        path: A compose file, a lab.conf file, or a lab directory containing
+            ``compose.yaml`` or ``topology/lab.conf``.
 
     Returns:
-        1 for serial execution (safest default)
-        2 if system has abundant resources (≥16GB total, ≥8GB available)
+        Sum of per-container memory profiles (``IMAGE_CONFIGS["memory_mb"]``)
+        plus ``STACK_OVERHEAD_MB``. Falls back to ``DEFAULT_STACK_MEMORY_MB``
+        when the topology cannot be read.
     """
+    path = Path(path)
+    if path.is_dir():
+        compose_file = path / "compose.yaml"
+        path = compose_file if compose_file.exists() else path / "topology" / "lab.conf"
+
+    if path.name == "lab.conf":
+        lab_config = parse_lab_conf(path)
+        if not lab_config.machines:
+            return DEFAULT_STACK_MEMORY_MB
+        # generate_compose_for_inspect adds a kathara/base "default" service
+        return (
+            STACK_OVERHEAD_MB
+            + get_memory_profile(DEFAULT_IMAGE)
+            + sum(
+                parse_memory_mb(config.mem) if config.mem else get_memory_profile(config.image or DEFAULT_IMAGE)
+                for config in lab_config.machines.values()
+            )
+        )
+
+    try:
+        compose = _load_compose(str(path))
+    except (OSError, yaml.YAMLError):
+        compose = None
+    services = (compose or {}).get("services") or {}
+    if not services:
+        return DEFAULT_STACK_MEMORY_MB
+    return STACK_OVERHEAD_MB + sum(_service_memory_mb(svc) for svc in services.values() if isinstance(svc, dict))
+
+
+def register_topology(path: Path) -> int:
+    """Register a topology used by the current task for concurrency sizing.
+
+    Call this while building the dataset (before ``inspect eval`` starts
+    sandboxes) so ``KatharaSandboxEnvironment.default_concurrency`` can size
+    the sample limit from the largest registered stack instead of the
+    conservative ``DEFAULT_STACK_MEMORY_MB``.
+
+    Returns:
+        The estimated stack memory in MB.
+    """
+    memory_mb = estimate_stack_memory(path)
+    _stack_memory_profiles[str(Path(path).resolve())] = memory_mb
+    return memory_mb
+
+
+def _calculate_safe_concurrency(stack_memory_mb: int | None = None) -> int:
+    """Calculate safe concurrency from live host memory and stack size.
+
+    The number of parallel stacks is the available RAM (minus
+    ``HOST_RESERVED_RAM_GB``) divided by the memory one stack needs,
+    clamped to ``[1, MAX_AUTO_CONCURRENCY]``.
+
+    Args:
+        stack_memory_mb: Memory per stack. Defaults to the largest registered
+            topology, or ``DEFAULT_STACK_MEMORY_MB`` if none is registered.
+
+    Returns:
+        1 for serial execution (safest default, also used without psutil)
+        up to MAX_AUTO_CONCURRENCY when the host has room for more stacks
+    """
+    if stack_memory_mb is None:
+        stack_memory_mb = max(_stack_memory_profiles.values(), default=DEFAULT_STACK_MEMORY_MB)
+    stack_memory_mb = max(stack_memory_mb, 1)
+
     try:
         import psutil
 
         mem = psutil.virtual_memory()
-        total_gb = mem.total / (1024**3)
         available_gb = mem.available / (1024**3)
+        usable_mb = (available_gb - HOST_RESERVED_RAM_GB) * 1024
+        concurrency = max(1, min(MAX_AUTO_CONCURRENCY, int(usable_mb // stack_memory_mb)))
 
-        if total_gb >= MIN_TOTAL_RAM_GB and available_gb >= MIN_AVAILABLE_RAM_GB:
-            logger.debug(f"Kathara concurrency: 2 (total={total_gb:.1f}GB, available={available_gb:.1f}GB)")
-            return 2
-
-        logger.debug(f"Kathara concurrency: 1 (total={total_gb:.1f}GB, available={available_gb:.1f}GB)")
-        return 1
+        logger.debug(f"Kathara concurrency: {concurrency} (available={available_gb:.1f}GB, stack={stack_memory_mb}MB)")
+        return concurrency
 
     except ImportError:
         logger.debug("Kathara concurrency: 1 (psutil not installed)")
@@ -98,13 +342,22 @@ def _calculate_safe_concurrency() -> int:
 # -----------------------------------------------------------------------------
 
 
-def _prune_stale_networks(prefix: str = "inspect-") -> None:
+def _prune_stale_networks(prefix: str = "inspect-", exclude_projects: set[str] | None = None) -> list[str]:
     """Remove orphaned Docker networks left by crashed runs.
 
     Kathara compose stacks allocate hardcoded /28 subnets. If a previous run
     crashed without cleanup, those networks persist and cause
     "Pool overlaps with other one on this address space" errors on re-run.
+
+    Networks of the compose projects in *exclude_projects* (stacks this
+    process is running) are never inspected or removed. The remaining
+    candidates are inspected with one batched ``docker network inspect`` and
+    the empty ones removed with one ``docker network rm``.
+
+    Returns:
+        Names of the removed networks.
     """
+    exclude = tuple(f"{project}_" for project in exclude_projects or ())
     try:
         result = subprocess.run(
             ["docker", "network", "ls", "--filter", f"name={prefix}", "--format", "{{.Name}}"],
@@ -113,50 +366,390 @@ def _prune_stale_networks(prefix: str = "inspect-") -> None:
             timeout=10,
         )
         if result.returncode != 0:
-            return
-        stale = [n for n in result.stdout.strip().splitlines() if n]
-        for net in stale:
-            # Only remove networks that have zero connected containers
-            info = subprocess.run(
-                ["docker", "network", "inspect", net, "--format", "{{len .Containers}}"],
-                capture_output=True,
-                text=True,
-                timeout=10,
-            )
-            if info.returncode == 0 and info.stdout.strip() == "0":
-                subprocess.run(["docker", "network", "rm", net], capture_output=True, timeout=10)
-                logger.debug(f"Removed stale network: {net}")
+            return []
+        candidates = [n for n in result.stdout.strip().splitlines() if n and not n.startswith(exclude)]
+        if not candidates:
+            return []
+
+        # Only remove networks that have zero connected containers
+        info = subprocess.run(
+            ["docker", "network", "inspect", *candidates, "--format", "{{.Name}} {{len .Containers}}"],
+            capture_output=True,
+            text=True,
+            timeout=30,
+        )
+        stale = []
+        for line in info.stdout.strip().splitlines():
+            name, _, containers = line.rpartition(" ")
+            if name in candidates and containers == "0":
+                stale.append(name)
+        if stale:
+            subprocess.run(["docker", "network", "rm", *stale], capture_output=True, timeout=30)
+            logger.debug(f"Removed stale networks: {', '.join(stale)}")
+        return stale
     except Exception as e:
         logger.warning(f"Failed to prune stale networks: {e}")
+        return []
 
 
-def _ensure_images_available(config: SandboxEnvironmentConfigType | None) -> None:
-    """Pre-validate Docker images before compose up.
+async def _prune_stale_networks_api(
+    client: DockerAPIClient, prefix: str = "inspect-", exclude_projects: set[str] | None = None
+) -> list[str]:
+    """Same sweep as ``_prune_stale_networks`` over the pooled Engine API connection.
+
+    Raises:
+        DockerAPIError, OSError: When the daemon cannot be queried; callers fall back to the CLI.
+    """
+    exclude = tuple(f"{project}_" for project in exclude_projects or ())
+    names = [network.get("Name", "") for network in await client.networks(prefix)]
+    candidates = [n for n in names if n.startswith(prefix) and not n.startswith(exclude)]
+    if not candidates:
+        return []
+
+    # The list endpoint does not report attached containers, so inspect each candidate
+    inspected = await asyncio.gather(*(client.inspect_network(name) for name in candidates))
+    stale = [name for name, info in zip(candidates, inspected) if not info.get("Containers")]
+    results = await asyncio.gather(*(client.remove_network(name) for name in stale), return_exceptions=True)
+    removed = [name for name, result in zip(stale, results) if not isinstance(result, BaseException)]
+    if removed:
+        logger.debug(f"Removed stale networks: {', '.join(removed)}")
+    return removed
+
+
+def _prune_interval() -> float:
+    """Minimum seconds between prunes, from INSPECT_KATHARA_PRUNE_INTERVAL or NETWORK_PRUNE_INTERVAL."""
+    value = os.environ.get(PRUNE_INTERVAL_ENV)
+    if not value:
+        return NETWORK_PRUNE_INTERVAL
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        logger.warning(f"Ignoring invalid {PRUNE_INTERVAL_ENV}={value!r}")
+        return NETWORK_PRUNE_INTERVAL
+
+
+async def _maybe_prune_stale_networks(admission: _StartupAdmission) -> None:
+    """Prune stale networks off the event loop, at most once per interval.
 
-    Parses the compose YAML referenced by *config* and calls
-    ``validate_kathara_image()`` for every ``kathara/*`` image found.
-    This triggers the pull-or-build fallback **before** Docker Compose
-    attempts to start containers, giving clear error messages.
+    Pruning holds the whole startup budget so no ``compose up`` is in flight
+    (a stack being created has networks with no containers attached yet), and
+    skips every project this process is running.
     """
+    global _last_network_prune
+    now = time.monotonic()
+    if _last_network_prune is not None and now - _last_network_prune < _prune_interval():
+        return
+    _last_network_prune = now
+
+    async with admission.admit(admission.budget):
+        client = get_docker_client()
+        if client is not None:
+            try:
+                await _prune_stale_networks_api(client, exclude_projects=set(_live_projects))
+                return
+            except (DockerAPIError, OSError) as e:
+                logger.debug(f"Docker API unavailable for network prune, using CLI: {e}")
+        await asyncio.to_thread(_prune_stale_networks, exclude_projects=set(_live_projects))
+
+
+def _compose_path(config: SandboxEnvironmentConfigType | None) -> Path | None:
+    """Compose file referenced by *config*: the file itself, or the compose file of a directory."""
     if config is None:
+        return None
+    path = Path(str(config))
+    if path.is_dir():
+        return next((path / name for name in COMPOSE_FILES if (path / name).is_file()), None)
+    return path
+
+
+def _load_compose(config: SandboxEnvironmentConfigType | None) -> dict[str, Any] | None:
+    """Load the compose file referenced by *config* (a file or a directory), or None if unavailable.
+
+    Parsed files are cached by path, mtime and size, so every sample of a
+    task shares one parse. The returned dict is shared and must not be
+    modified.
+
+    Raises:
+        yaml.YAMLError: If the file is not valid YAML.
+        OSError: If the file exists but cannot be read.
+    """
+    compose_path = _compose_path(config)
+    if compose_path is None:
+        return None
+    try:
+        stat = compose_path.stat()
+    except OSError:
+        return None
+    return _parse_compose_file(str(compose_path.resolve()), stat.st_mtime_ns, stat.st_size)
+
+
+@functools.lru_cache(maxsize=COMPOSE_CACHE_SIZE)
+def _parse_compose_file(path: str, mtime_ns: int, size: int) -> dict[str, Any] | None:
+    text = Path(path).read_text()
+    compose = None
+    if path.endswith(".json"):
+        try:
+            compose = json.loads(text)
+        except ValueError:
+            pass  # let the YAML loader report the error
+    if compose is None:
+        compose = yaml.load(text, Loader=YAML_LOADER)
+    return compose if isinstance(compose, dict) else None
+
+
+def _lease_subnets(
+    config: SandboxEnvironmentConfigType | None, compose: dict[str, Any] | None
+) -> tuple[SubnetLease | None, SandboxEnvironmentConfigType | None]:
+    """Lease non-overlapping subnets for the stack's networks.
+
+    Returns the lease and the config to start the stack from (a rewritten
+    copy of the compose file in the lease directory), or ``(None, config)``
+    when leasing is disabled or not applicable. Blocks on the host-wide lease
+    lock, so callers run it in a worker thread.
+    """
+    pool = subnet_pool()
+    if pool is None or not isinstance(config, str) or not compose:
+        return None, config
+    prefixes = network_prefixes(compose)
+    config_file = _compose_path(config)
+    if not prefixes or config_file is None:
+        return None, config
+
+    directory = lease_dir()
+    manager = SubnetLeaseManager(pool, directory)
+    try:
+        lease = manager.acquire(prefixes)
+    except (OSError, RuntimeError) as e:
+        logger.warning(f"Subnet lease unavailable, starting with the compose file's own subnets: {e}")
+        return None, config
+    try:
+        lease.compose_file = str(write_leased_compose(config_file, compose, lease, directory))
+        manager.update(lease)
+    except OSError as e:
+        manager.release(lease)
+        logger.warning(f"Could not write leased compose file to {directory}: {e}")
+        return None, config
+    return lease, lease.compose_file
+
+
+def _release_subnet_lease(lease: SubnetLease | None) -> None:
+    pool = subnet_pool()
+    if lease is None or pool is None:
         return
-    compose_path = Path(str(config))
-    if not compose_path.exists():
+    try:
+        SubnetLeaseManager(pool, lease_dir()).release(lease)
+    except OSError as e:
+        logger.warning(f"Failed to release subnet lease {lease.block}: {e}")
+
+
+async def _ensure_images_available(compose: dict[str, Any] | None) -> None:
+    """Pre-validate Docker images before compose up.
+
+    Resolves every ``kathara/*`` image in *compose* against the process-wide
+    image inventory in one pass, pulling or building missing images with
+    bounded parallelism. This triggers the pull-or-build fallback **before**
+    Docker Compose attempts to start containers, giving clear error messages.
+    """
+    if compose is None:
         return
     try:
-        with open(compose_path) as f:
-            compose = yaml.safe_load(f)
-        services = compose.get("services", {})
-        seen: set[str] = set()
-        for svc in services.values():
-            image = svc.get("image", "")
-            if image.startswith("kathara/") and image not in seen:
-                seen.add(image)
-                validate_kathara_image(image)
+        services = compose.get("services") or {}
+        await ensure_kathara_images(svc.get("image") or "" for svc in services.values() if isinstance(svc, dict))
     except Exception as e:
         logger.warning(f"Image pre-validation failed (will retry at compose up): {e}")
 
 
+# -----------------------------------------------------------------------------
+# Readiness
+# -----------------------------------------------------------------------------
+
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(h|ms|us|ns|m|s)")
+_DURATION_UNITS = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 1e-3, "us": 1e-6, "ns": 1e-9}
+
+
+def _duration_seconds(value: Any) -> float:
+    """Seconds in a Compose duration (``"1m30s"``, ``"500ms"``) or a bare number of seconds."""
+    if isinstance(value, (int, float)):
+        return float(value)
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in _DURATION_PART.findall(str(value)))
+
+
+def _first_probe_delay(healthcheck: dict[str, Any]) -> float:
+    """Seconds from container start until Docker first runs *healthcheck*."""
+    if healthcheck.get("start_interval") and _engine_supports_start_interval():
+        return _duration_seconds(healthcheck["start_interval"])
+    return _duration_seconds(healthcheck.get("interval") or DOCKER_DEFAULT_HEALTHCHECK_INTERVAL)
+
+
+def _readiness_bounds(compose: dict[str, Any] | None) -> dict[str, float]:
+    """Map each healthchecked service to its readiness upper bound in seconds.
+
+    Only services carrying a ``healthcheck`` (emitted by
+    ``generate_compose_for_inspect`` for images with ``services``) are gated;
+    everything else is considered ready as soon as its container runs. The
+    bound is the image's ``startup_delay``, raised to the healthcheck's first
+    probe when that comes later: no service can report healthy before it.
+    """
+    if not compose:
+        return {}
+    bounds: dict[str, float] = {}
+    for name, svc in (compose.get("services") or {}).items():
+        if not isinstance(svc, dict) or not isinstance(svc.get("healthcheck"), dict):
+            continue
+        if svc["healthcheck"].get("disable"):
+            continue
+        startup_delay = float(get_startup_delay(svc.get("image") or DEFAULT_IMAGE))
+        bounds[name] = max(startup_delay, _first_probe_delay(svc["healthcheck"]))
+    return bounds
+
+
+async def _wait_for_services_ready(project: ComposeProject, bounds: dict[str, float]) -> dict[str, float]:
+    """Wait until every service in *bounds* reports healthy.
+
+    Polls ``docker compose ps`` until each gated service is healthy or its
+    own bound has elapsed, and returns once no service is left to wait for.
+    A service that is still not healthy when its bound expires is logged
+    (not raised) right then, matching the previous fixed-delay behaviour.
+
+    Returns:
+        Seconds until each service was first seen healthy.
+    """
+    if not bounds:
+        return {}
+
+    start = time.monotonic()
+    ready: dict[str, float] = {}
+    waiting = dict(bounds)
+    while True:
+        try:
+            for container in await compose_ps(project=project, all=True):
+                service = container.get("Service", "")
+                if service in waiting and container.get("Health") == "healthy":
+                    ready[service] = time.monotonic() - start
+                    del waiting[service]
+        except Exception as e:
+            logger.debug(f"Readiness poll failed: {e}")
+
+        elapsed = time.monotonic() - start
+        expired = sorted(service for service, bound in waiting.items() if elapsed >= bound)
+        for service in expired:
+            logger.warning(f"Service {service} not healthy after {waiting.pop(service):.0f}s")
+        if not waiting:
+            return ready
+        await asyncio.sleep(READINESS_POLL_INTERVAL)
+
+
+def _startup_stages(compose: dict[str, Any] | None) -> dict[str, int]:
+    """Startup stage of each service: 0 without ``depends_on``, else one past its latest dependency."""
+    services = (compose or {}).get("services") or {}
+    stages: dict[str, int] = {}
+
+    def stage(name: str, path: tuple[str, ...] = ()) -> int:
+        if name not in stages:
+            depends_on = (services.get(name) or {}).get("depends_on") or {}
+            path = (*path, name)
+            dependencies = [dep for dep in depends_on if dep in services and dep not in path]
+            stages[name] = 1 + max((stage(dep, path) for dep in dependencies), default=-1)
+        return stages[name]
+
+    for name in services:
+        stage(name)
+    return stages
+
+
+def _parse_docker_time(value: str) -> float | None:
+    """Epoch seconds of a Docker RFC 3339 timestamp (nanosecond precision, ``Z`` suffix)."""
+    if not value or value.startswith("0001-"):
+        return None
+    base, _, fraction = value.rstrip("Z").partition(".")
+    try:
+        seconds = datetime.fromisoformat(base).replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+    return seconds + (float(f"0.{fraction}") if fraction.isdigit() else 0.0)
+
+
+async def _container_start_times(project: ComposeProject) -> dict[str, float]:
+    """Earliest container start time (epoch seconds) of each service in *project*."""
+    containers = {c["ID"]: c.get("Service", "") for c in await compose_ps(project=project, all=True) if c.get("ID")}
+    if not containers:
+        return {}
+    started: dict[str, str] = {}
+    client = get_docker_client()
+    if client is not None:
+        try:
+            details = await asyncio.gather(*(client.inspect_container(cid) for cid in containers))
+            started = {cid: (d.get("State") or {}).get("StartedAt", "") for cid, d in zip(containers, details)}
+        except (DockerAPIError, OSError) as e:
+            logger.debug(f"Docker API unavailable for container inspect, using CLI: {e}")
+    if not started:
+        result = await asyncio.to_thread(
+            subprocess.run,
+            ["docker", "inspect", "--format", "{{.Id}} {{.State.StartedAt}}", *containers],
+            capture_output=True,
+            text=True,
+        )
+        for line in result.stdout.splitlines():
+            full_id, _, started_at = line.partition(" ")
+            cid = next((cid for cid in containers if full_id.startswith(cid)), None)
+            if cid is not None:
+                started[cid] = started_at
+
+    times: dict[str, float] = {}
+    for cid, service in containers.items():
+        start = _parse_docker_time(started.get(cid, ""))
+        if start is not None:
+            times[service] = min(start, times.get(service, start))
+    return times
+
+
+async def _stage_durations(
+    project: ComposeProject, stages: dict[str, int], up_started: float, ready_at: float
+) -> dict[str, float]:
+    """Seconds each startup stage took, from the start of ``compose up`` until the stack was ready.
+
+    Compose starts a stage's containers once the previous stage is healthy,
+    so a stage ends when the first container of the next stage starts; the
+    last stage ends when the stack became ready.
+    """
+    try:
+        starts = await _container_start_times(project)
+    except Exception as e:
+        logger.debug(f"Failed to read container start times: {e}")
+        return {}
+    stage_starts: dict[int, float] = {}
+    for service, start in starts.items():
+        if service in stages:
+            stage_starts[stages[service]] = min(start, stage_starts.get(stages[service], start))
+
+    durations: dict[str, float] = {}
+    begin = up_started
+    for number in sorted(set(stages.values())):
+        end = min((stage_starts[later] for later in stage_starts if later > number), default=ready_at)
+        durations[f"stage_{number}"] = max(0.0, end - begin)
+        begin = end
+    return durations
+
+
+class _StackGeneration:
+    """Count of possibly state-changing operations (``exec``, file writes) on any container of a stack.
+
+    Routing state is distributed: a command on one router can change the
+    routes of all the others, so state read from any container is only
+    known to be current while this count is unchanged.
+    """
+
+    def __init__(self) -> None:
+        self.value = 0
+
+
+async def _close_sessions(environments: dict[str, SandboxEnvironment]) -> None:
+    """Stop the shell sessions of a stack's environments (see ``_session``)."""
+    sessions = [env.close_session() for env in environments.values() if isinstance(env, KatharaSandboxEnvironment)]
+    await asyncio.gather(*sessions, return_exceptions=True)
+
+
 # -----------------------------------------------------------------------------
 # Kathara Sandbox Environment
 # -----------------------------------------------------------------------------
@@ -167,17 +760,42 @@ class KatharaSandboxEnvironment(DockerSandboxEnvironment):
     """Docker sandbox with conservative concurrency for Kathara network topologies.
 
     Kathara labs spin up large container stacks (26-38 containers per sample,
-    ~1.7GB memory each). This environment provides:
+    96-512MB memory each depending on the image, see ``IMAGE_CONFIGS``). This
+    environment provides:
 
-    1. **Memory-based concurrency**: Defaults to 1 (serial) unless system has
-       ≥16GB total RAM and ≥8GB available, then allows 2 parallel stacks.
+    1. **Topology-aware concurrency**: Parallel stacks are sized from live
+       available RAM and the memory profile of the registered topology
+       (machine count and image mix), falling back to 1 (serial) without psutil.
 
-    2. **Startup serialization**: Even when Inspect allows parallel samples,
-       container startup is serialized via semaphore to prevent Docker daemon
-       overwhelm from simultaneous `compose up` calls.
+    2. **Weighted startup admission**: Even when Inspect allows parallel
+       samples, each `compose up` must first acquire tokens proportional to
+       its services' startup cost from a shared budget, so small labs start
+       together while large ones cannot overwhelm the Docker daemon.
 
-    3. **Stabilization delay**: After containers start, a brief delay allows
-       services (FRR, BIND, etc.) to initialize before releasing the semaphore.
+    3. **Health-gated readiness**: After containers start, the tokens are
+       held only until every healthchecked service (FRR, BIND, etc.) reports
+       healthy, bounded by the image's ``startup_delay``.
+
+    4. **Warm pool (opt-in)**: With ``INSPECT_KATHARA_WARM_POOL=N``, up to N
+       started, health-verified stacks per compose file are kept ready in the
+       background and handed to samples that share the topology.
+
+    5. **Stack reuse (opt-in)**: With ``INSPECT_KATHARA_REUSE=1``, a stack is
+       restored to the baseline captured after it started (iptables, sysctls,
+       routes, FRR config) at cleanup and reused, falling back to full
+       recreation when the restored state does not verify.
+
+    6. **Shell sessions (opt-in)**: With ``INSPECT_KATHARA_SESSIONS=1``,
+       ``exec`` runs through one long-lived shell per container (see
+       ``_session``) instead of a ``docker exec`` per command.
+
+    7. **Streaming file transfer**: ``read_file_chunks``/``write_file_chunks``
+       move large files (pcaps, logs) in bounded memory, optionally gzipped,
+       and ``read_file_range`` reads only part of a file (see ``_transfer``).
+
+    8. **State generation**: ``generation`` counts the ``exec`` calls and file
+       writes on any container of the stack, so network state read with
+       ``exec_read_only`` (see ``snapshot``) can be cached until it may have changed.
 
     Usage in dataset.yaml:
         sandbox: [kathara, "data_center/dc_clos_bg/compose.yaml"]
@@ -186,22 +804,39 @@ class KatharaSandboxEnvironment(DockerSandboxEnvironment):
         inspect eval --max-sandboxes 2  # Force parallel if you have resources
 
     The "kathara" sandbox type is functionally identical to "docker" except
-    for the conservative concurrency defaults and serialized startup.
+    for the conservative concurrency defaults and admission-controlled startup.
     All DockerSandboxEnvironment features (exec, read_file, write_file, etc.)
     work unchanged.
     """
 
+    def __init__(
+        self,
+        service: str,
+        project: ComposeProject,
+        working_dir: str,
+        sessions: bool = False,
+        stack_generation: _StackGeneration | None = None,
+    ) -> None:
+        super().__init__(service, project, working_dir)
+        self._sessions = sessions
+        self._session: ShellSession | None = None
+        self._container: str | None = None
+        self._stack_generation = stack_generation or _StackGeneration()
+        self._snapshots: dict[tuple[str, ...], tuple[int, Any]] = {}
+
     @classmethod
     def default_concurrency(cls) -> int | None:
-        """Calculate safe concurrency based on system memory.
+        """Calculate safe concurrency based on system memory and topology size.
 
-        Kathara stacks are memory-intensive (~4GB per stack). This method:
-        - Returns 1 (serial) by default for safety
-        - Returns 2 if system has ≥16GB total RAM and ≥8GB available
+        Stack memory is estimated from topologies registered with
+        ``register_topology`` (per-image ``memory_mb`` profiles), or
+        ``DEFAULT_STACK_MEMORY_MB`` if none were registered. This method:
+        - Returns 1 (serial) when psutil is missing or memory is tight
+        - Returns up to MAX_AUTO_CONCURRENCY when available RAM allows
         - Can be overridden via --max-sandboxes CLI flag
 
         Returns:
-            1 or 2 based on available system resources
+            Number of stacks that fit in available memory
         """
         return _calculate_safe_concurrency()
 
@@ -213,51 +848,383 @@ class KatharaSandboxEnvironment(DockerSandboxEnvironment):
         config: SandboxEnvironmentConfigType | None,
         metadata: dict[str, str],
     ) -> dict[str, SandboxEnvironment]:
-        """Create sandbox with serialized startup to prevent Docker overwhelm.
+        """Create sandbox with weighted startup admission to prevent Docker overwhelm.
 
         Even when Inspect schedules multiple samples in parallel (based on
-        max_sandboxes), this method serializes the actual `compose up` calls.
-        This prevents the Docker daemon from being overwhelmed by 50+ containers
-        starting simultaneously.
+        max_sandboxes), the actual `compose up` calls are admitted against a
+        shared token budget (``INSPECT_KATHARA_STARTUP_BUDGET``). Each stack
+        costs the sum of its services' startup delays, so the Docker daemon
+        never has more than a budget's worth of containers starting at once.
+
+        After containers start, the tokens are held until every service
+        with a healthcheck reports healthy (bounded per image by
+        ``startup_delay``), so labs without services release them immediately.
+
+        When the warm pool is enabled, a pre-started stack with the same
+        compose fingerprint is checked out instead and the pool is refilled
+        in the background.
 
-        After containers start, a stabilization delay allows services to
-        initialize before releasing the semaphore for the next sample.
+        The time spent in each phase is logged and attached to the sample
+        (see ``_telemetry``).
         """
-        semaphore = await _get_startup_semaphore()
+        timer = PhaseTimer("sample_init", attributes={"task": task_name, "config": str(config)})
+        pool = _get_warm_pool(_scope(task_name, config))
+        key = compose_fingerprint(config, metadata) if pool is not None else None
+        if pool is not None and key is not None:
+            with timer.phase("pool_checkout"):
+                environments = pool.checkout(key)
+            # Background refills only log their timings: they belong to no sample
+            pool.refill(key, lambda: cls._start_stack(task_name, config, metadata))
+            if environments is not None:
+                timer.attributes["source"] = "warm_pool"
+                emit_timing(timer)
+                return environments
+
+        environments = await cls._start_stack(task_name, config, metadata, timer)
+        emit_timing(timer)
+        return environments
 
-        async with semaphore:
-            logger.debug(f"Starting Kathara stack for task '{task_name}'")
-            _prune_stale_networks()
-            _ensure_images_available(config)
-            environments = await super().sample_init(task_name, config, metadata)
+    @classmethod
+    async def _start_stack(
+        cls,
+        task_name: str,
+        config: SandboxEnvironmentConfigType | None,
+        metadata: dict[str, str],
+        timer: PhaseTimer | None = None,
+    ) -> dict[str, SandboxEnvironment]:
+        """Start one stack under startup admission and wait for it to be ready.
 
-            # Allow services to stabilize before releasing semaphore
-            # This gives FRR, BIND, and other services time to initialize
-            logger.debug(f"Waiting {STARTUP_STABILIZATION_DELAY}s for services to stabilize")
-            await asyncio.sleep(STARTUP_STABILIZATION_DELAY)
+        Phases are recorded on *timer* when given; otherwise (background
+        warm-pool starts) they are only logged.
+        """
+        attach = timer is not None
+        timer = timer or PhaseTimer("prestart")
+        admission = await _get_startup_admission()
+        with timer.phase("load_compose"):
+            try:
+                compose = _load_compose(config)
+            except (OSError, yaml.YAMLError) as e:
+                logger.debug(f"Could not load compose file for {config}: {e}")
+                compose = None
+        cost = _startup_cost(compose) or admission.budget
+
+        # Pulls and builds run before admission so they never hold startup tokens
+        with timer.phase("ensure_images"):
+            await _ensure_images_available(compose)
+        with timer.phase("prune_networks"):
+            await _maybe_prune_stale_networks(admission)
+
+        with timer.phase("subnet_lease"):
+            lease, stack_config = await asyncio.to_thread(_lease_subnets, config, compose)
+
+        admission_started = time.monotonic()
+        async with admission.admit(cost) as tokens:
+            timer.phases["admission_wait"] = time.monotonic() - admission_started
+            timer.attributes.update(startup_tokens=tokens, source="compose_up")
+            logger.debug(f"Starting Kathara stack for task '{task_name}' ({tokens}/{admission.budget} startup tokens)")
+            up_started = time.time()
+            try:
+                with timer.phase("compose_up"):
+                    environments = await super().sample_init(task_name, stack_config, metadata)
+            except BaseException:
+                await asyncio.to_thread(_release_subnet_lease, lease)
+                raise
+            sessions = sessions_enabled()
+            generation = _StackGeneration()
+            environments = {name: cls._from_docker(env, sessions, generation) for name, env in environments.items()}
+
+            # Hold the tokens until FRR, BIND and other services are healthy
+            project = _stack_project(environments)
+            timer.attributes["project"] = project.name
+            _live_projects[project.name] = _scope(task_name, config)
+            if lease is not None:
+                _subnet_leases[project.name] = lease
+            with timer.phase("readiness"):
+                timer.services.update(await _wait_for_services_ready(project, _readiness_bounds(compose)))
+
+            # Staged stacks (depends_on): how long each stage took within compose up + readiness
+            stages = _startup_stages(compose)
+            if len(set(stages.values())) > 1:
+                timer.stages.update(await _stage_durations(project, stages, up_started, time.time()))
+
+        if reuse_enabled():
+            key = compose_fingerprint(config, metadata)
+            if key is not None:
+                try:
+                    with timer.phase("capture_baseline"):
+                        _baselines[project.name] = await capture_baseline(key, environments, compose)
+                except Exception as e:
+                    logger.warning(f"Failed to capture baseline, stack will not be reused: {e}")
 
         logger.debug(f"Kathara stack ready for task '{task_name}'")
+        if not attach:
+            emit_timing(timer, attach=False)
         return environments
 
+    @override
+    @classmethod
+    async def sample_cleanup(
+        cls,
+        task_name: str,
+        config: SandboxEnvironmentConfigType | None,
+        environments: dict[str, SandboxEnvironment],
+        interrupted: bool,
+    ) -> None:
+        """Reset the stack to its baseline for reuse, or tear it down.
+
+        In reuse mode the stack is restored in place (iptables, sysctls,
+        startup command, FRR config) and returned to the warm pool when the
+        restored state verifies against the baseline. Otherwise, or when
+        verification fails, the stack is removed as usual and the next sample
+        starts a fresh one.
+
+        Docker postpones the removal of interrupted stacks to task cleanup, so
+        their subnet lease (and the leased compose file ``compose down`` runs
+        against) is kept until then.
+        """
+        timer = PhaseTimer("sample_cleanup", attributes={"task": task_name, "interrupted": interrupted})
+        if environments:
+            project = _stack_project(environments)
+            timer.attributes["project"] = project.name
+            baseline = _baselines.pop(project.name, None)
+            pool = _get_warm_pool(_scope(task_name, config))
+            if baseline is not None and pool is not None and not interrupted and reuse_enabled():
+                with timer.phase("reset"):
+                    reset = await reset_stack(environments, baseline)
+                if reset:
+                    _baselines[project.name] = baseline
+                    pool.checkin(baseline.key, environments)
+                    logger.debug(f"Reset Kathara stack '{project.name}' for reuse")
+                    emit_timing(timer)
+                    return
+                logger.info(f"Kathara stack '{project.name}' failed baseline verification, recreating")
+            if not interrupted:
+                _live_projects.pop(project.name, None)
+            await _close_sessions(environments)
+        with timer.phase("compose_down"):
+            await super().sample_cleanup(task_name, config, environments, interrupted)
+        if environments and not interrupted:
+            lease = _subnet_leases.pop(_stack_project(environments).name, None)
+            await asyncio.to_thread(_release_subnet_lease, lease)
+        emit_timing(timer)
 
-# -----------------------------------------------------------------------------
-# Compose Generator Utilities
-# -----------------------------------------------------------------------------
+    @override
+    async def exec(
+        self,
+        cmd: list[str],
+        input: str | bytes | None = None,
+        cwd: str | None = None,
+        env: dict[str, str] | None = None,
+        user: str | None = None,
+        timeout: int | None = None,
+        timeout_retry: bool = True,
+        concurrency: bool = True,
+    ) -> ExecResult[str]:
+        """Run *cmd* through this container's shell session, or a regular ``docker exec``.
+
+        Only environments created with sessions enabled use a session.
+        Commands for another *user*, commands issued while the session is
+        busy with a previous one, and commands whose session shell died are
+        run with ``docker exec`` instead.
+
+        Any command may change the state of the stack's network, so each one
+        advances ``generation`` (use ``exec_read_only`` for commands that do not).
+        """
+        self._stack_generation.value += 1
+        return await self.exec_read_only(cmd, input, cwd, env, user, timeout, timeout_retry, concurrency)
+
+    async def exec_read_only(
+        self,
+        cmd: list[str],
+        input: str | bytes | None = None,
+        cwd: str | None = None,
+        env: dict[str, str] | None = None,
+        user: str | None = None,
+        timeout: int | None = None,
+        timeout_retry: bool = True,
+        concurrency: bool = True,
+    ) -> ExecResult[str]:
+        """``exec`` for commands that only inspect the container (does not advance ``generation``)."""
+        if self._sessions and user is None and not (self._session is not None and self._session.busy):
+            session = self._session or await self._start_session()
+            final_cwd = PurePosixPath(self._working_dir) / (cwd or "")
+            try:
+                return await session.run(cmd, input=input, cwd=str(final_cwd), env=env, timeout=timeout)
+            except SessionError as e:
+                logger.debug(f"Shell session of '{self._service}' failed, using docker exec: {e}")
+        return await super().exec(cmd, input, cwd, env, user, timeout, timeout_retry, concurrency)
+
+    @property
+    def generation(self) -> int:
+        """Number of possibly state-changing operations (``exec``, file writes) run on the stack so far.
+
+        Shared by all containers of the stack. State read from the container
+        (see ``snapshot``) is unchanged by commands while this number is
+        unchanged; routing protocols may still converge in the meantime.
+        """
+        return self._stack_generation.value
+
+    async def _container_id(self) -> str:
+        if self._container is None:
+            containers = await compose_ps(project=self._project)
+            self._container = next(c["ID"] for c in containers if c.get("Service") == self._service)
+        return self._container
+
+    async def _start_session(self) -> ShellSession:
+        self._session = ShellSession(
+            ["docker", "exec", "-i", await self._container_id(), "sh"],
+            output_limit=SandboxEnvironmentLimits.MAX_EXEC_OUTPUT_SIZE,
+        )
+        return self._session
 
-ROUTER_CAPABILITIES = ["NET_ADMIN", "SYS_ADMIN"]
-HOST_CAPABILITIES = ["NET_ADMIN"]
-ROUTER_SYSCTLS = {"net.ipv4.ip_forward": "1"}
+    @classmethod
+    def _from_docker(
+        cls, env: SandboxEnvironment, sessions: bool = False, stack_generation: _StackGeneration | None = None
+    ) -> KatharaSandboxEnvironment:
+        """Kathara environment for the same container as a Docker environment."""
+        docker_env = env.as_type(DockerSandboxEnvironment)
+        return cls(docker_env._service, docker_env._project, docker_env._working_dir, sessions, stack_generation)
+
+    async def read_file_chunks(
+        self, file: str, offset: int = 0, length: int | None = None, compress: bool = False
+    ) -> AsyncIterator[bytes]:
+        """Stream *file* from the container in chunks, without holding it in memory.
+
+        Args:
+            file: Path in the container (relative paths resolve against the working directory).
+            offset: First byte to read; negative offsets count from the end of the file.
+            length: Bytes to read from *offset* (default: to the end of the file).
+            compress: Gzip the stream inside the container (decompressed on arrival).
+
+        Raises:
+            FileNotFoundError: If the file does not exist.
+        """
+        container = await self._container_id()
+        async for chunk in read_chunks(container, self.container_file(file), offset, length, compress):
+            yield chunk
 
+    async def read_file_range(self, file: str, offset: int = 0, length: int | None = None) -> bytes:
+        """Bytes *offset* to *offset* + *length* of *file* (e.g. ``offset=-2**20`` for the last MiB).
 
-class _LiteralStr(str):
-    """String wrapper so PyYAML dumps it as a literal block scalar (|)."""
+        Raises:
+            FileNotFoundError: If the file does not exist.
+            OutputLimitExceededError: If the range exceeds ``MAX_FILE_SIZE``.
+        """
+        data = bytearray()
+        async for chunk in self.read_file_chunks(file, offset, length):
+            data += chunk
+            if len(data) > MAX_FILE_SIZE:
+                raise OutputLimitExceededError(f"{MAX_FILE_SIZE // 2**20} MiB", truncated_output=None)
+        return bytes(data)
+
+    async def write_file_chunks(
+        self, file: str, chunks: AsyncIterable[bytes] | Iterable[bytes], compress: bool = False
+    ) -> int:
+        """Stream *chunks* into *file* in the container, creating parent directories.
 
+        Returns:
+            Bytes written.
+        """
+        self._stack_generation.value += 1
+        return await write_chunks(await self._container_id(), self.container_file(file), chunks, compress)
+
+    async def download_file(
+        self, file: str, destination: Path, offset: int = 0, length: int | None = None, compress: bool = False
+    ) -> int:
+        """Copy (a range of) *file* from the container to the local *destination*; returns bytes copied."""
+        copied = 0
+        with open(destination, "wb") as out:
+            async for chunk in self.read_file_chunks(file, offset, length, compress):
+                out.write(chunk)
+                copied += len(chunk)
+        return copied
+
+    async def close_session(self) -> None:
+        """Stop this container's shell session, if one was started."""
+        if self._session is not None:
+            session, self._session = self._session, None
+            await session.close()
+
+    @override
+    @classmethod
+    async def task_cleanup(cls, task_name: str, config: SandboxEnvironmentConfigType | None, cleanup: bool) -> None:
+        """Tear down idle warm-pool stacks before the regular Docker task cleanup.
+
+        Only the pool, baselines and leases of this task and config are
+        released; other tasks running in the process keep theirs. Subnet
+        leases of stacks left running (``cleanup=False``) stay held so their
+        block is not handed to another stack; they are reclaimed once this
+        process has exited.
+        """
+        scope = _scope(task_name, config)
+        pool = _warm_pools.pop(scope, None)
+        if pool is not None:
+            for environments in await pool.drain():
+                await _close_sessions(environments)
+                if cleanup:
+                    await super().sample_cleanup(task_name, config, environments, False)
+        projects = [project for project, owner in _live_projects.items() if owner == scope]
+        for project in projects:
+            _baselines.pop(project, None)
+            _live_projects.pop(project, None)
+        await super().task_cleanup(task_name, config, cleanup)
+        for project in projects:
+            lease = _subnet_leases.pop(project, None)
+            if cleanup:
+                await asyncio.to_thread(_release_subnet_lease, lease)
 
-def _literal_str_representer(dumper, data):
-    return dumper.represent_scalar("tag:yaml.org,2002:str", str(data), style="|")
 
+# -----------------------------------------------------------------------------
+# Compose Generator Utilities
+# -----------------------------------------------------------------------------
 
-yaml.add_representer(_LiteralStr, _literal_str_representer, Dumper=yaml.SafeDumper)
+ROUTER_CAPABILITIES = ["NET_ADMIN", "SYS_ADMIN"]
+HOST_CAPABILITIES = ["NET_ADMIN"]
+ROUTER_SYSCTLS = {"net.ipv4.ip_forward": "1"}
+# Non-internal network joined by machines with `bridged=true` in lab.conf
+BRIDGED_NETWORK = "bridged"
+# Output formats of generated compose files (Compose reads JSON as YAML)
+COMPOSE_FORMATS = ("yaml", "json")
+# Bump whenever generated compose output changes, invalidating incremental state
+COMPOSE_GENERATOR_VERSION = 7
+# Generated scripts live in .kathara next to the compose file and are mounted read-only
+# under /kathara: one shared prologue, plus one content-addressed startup script per
+# distinct script
+SCRIPT_DIR = ".kathara"
+
+# Healthchecks of service images (INSPECT_KATHARA_HEALTHCHECK, read at generation):
+#   readiness  - probe every second until the container is first healthy, then every 10 minutes
+#   liveness   - as readiness, then keep probing every minute to notice daemons dying
+#   continuous - probe every 2s for the container's lifetime
+# The fast first probes need start_interval (Docker Engine 25+, API 1.44). Older engines
+# ignore it and run the first probe after one interval, so when the engine does not report
+# API 1.44 (or cannot be asked) readiness and liveness probe every HEALTHCHECK_FALLBACK_INTERVAL.
+HEALTHCHECK_ENV = "INSPECT_KATHARA_HEALTHCHECK"
+HEALTHCHECK_MODES = ("readiness", "liveness", "continuous")
+DEFAULT_HEALTHCHECK_MODE = "readiness"
+# Window in which readiness probes run every start_interval; only failures after it count
+HEALTHCHECK_START_PERIOD = "120s"
+HEALTHCHECK_START_INTERVAL = "1s"
+LIVENESS_INTERVAL = "60s"
+# Interval once ready in readiness mode: nothing waits on later probes
+READINESS_IDLE_INTERVAL = "600s"
+HEALTHCHECK_FALLBACK_INTERVAL = "2s"
+# Docker's interval when a healthcheck does not set one
+DOCKER_DEFAULT_HEALTHCHECK_INTERVAL = "30s"
+START_INTERVAL_API_VERSION = (1, 44)
+
+# Run by every generated service: reset the addresses and routes Docker assigned,
+# copy the machine's config files, run its startup script, then keep the container
+# alive. KATHARA_STARTUP_ONCE=1 skips the final sleep (used to re-run it on reset).
+_STARTUP_PROLOGUE = f"""\
+#!/bin/bash
+# Generated by inspect-kathara, shared by every service of the lab
+for d in $(ls /sys/class/net | grep -v lo); do ip addr flush dev "$d"; done
+for d in $(ls /sys/class/net | grep -v lo); do ip route flush dev "$d"; done
+if [ -d /tmp/config ]; then cp -r /tmp/config/* /; fi
+if [ -f {STARTUP_SCRIPT_PATH} ]; then . {STARTUP_SCRIPT_PATH}; fi
+[ -n "$KATHARA_STARTUP_ONCE" ] || exec sleep infinity
+"""
 
 
 def _find_startup_file(
@@ -291,48 +1258,86 @@ def _get_startup_script(
     startup_file = _find_startup_file(lab_path, machine_name, startup_pattern)
     if startup_file is None:
         return None
+    return startup_file.read_text()
 
-    lines = startup_file.read_text().strip().split("\n")
-    commands = [line.strip() for line in lines if line.strip() and not line.strip().startswith("#")]
-    return " && ".join(commands) if commands else None
 
+def _write_script(output_dir: Path, relative: str, content: str) -> None:
+    """Write a generated script under *output_dir*'s SCRIPT_DIR unless it already holds *content*."""
+    path = output_dir / SCRIPT_DIR / relative
+    try:
+        if path.read_text() == content:
+            return
+    except OSError:
+        path.parent.mkdir(parents=True, exist_ok=True)
+    _atomic_write(path, content)
 
-def generate_compose_for_inspect(
-    lab_path: Path,
-    startup_configs: dict[str, str] | None = None,
-    default_machine: str | None = None,
-    startup_pattern: str | None = None,
-) -> str:
-    lab_conf_path = lab_path / "topology" / "lab.conf"
-    if not lab_conf_path.exists():
-        raise FileNotFoundError(f"lab.conf not found at {lab_conf_path}")
 
-    lab_config = parse_lab_conf(lab_conf_path)
-    if not lab_config.machines:
-        raise ValueError(f"No machines found in {lab_conf_path}")
+def _write_startup_prologue(output_dir: Path) -> None:
+    _write_script(output_dir, "prologue.sh", _STARTUP_PROLOGUE)
+
+
+def _startup_script_file(output_dir: Path, script: str) -> str:
+    """Store *script* content-addressed and return its path relative to *output_dir*."""
+    relative = f"startup/{hashlib.sha256(script.encode()).hexdigest()[:16]}.sh"
+    _write_script(output_dir, relative, script)
+    return f"{SCRIPT_DIR}/{relative}"
+
+
+_STARTUP_SCRIPT_REF = re.compile(re.escape(SCRIPT_DIR) + r"/startup/[0-9a-f]+\.sh")
+
+
+def _prune_startup_scripts(output_dir: Path) -> None:
+    """Delete startup scripts no compose file in *output_dir* mounts any more (superseded by edits).
+
+    Every compose, JSON or sidecar file at the top of *output_dir* is scanned
+    for references, so outputs sharing its SCRIPT_DIR keep each other's scripts.
+    """
+    script_dir = output_dir / SCRIPT_DIR / "startup"
+    if not script_dir.is_dir():
+        return
+    referenced: set[str] = set()
+    for path in output_dir.iterdir():
+        if path.suffix in (".yaml", ".yml", ".json") and path.is_file():
+            try:
+                referenced.update(_STARTUP_SCRIPT_REF.findall(path.read_text(errors="replace")))
+            except OSError:
+                return  # unknown references: keep everything
+    for script in script_dir.glob("*.sh"):
+        if f"{SCRIPT_DIR}/startup/{script.name}" not in referenced:
+            script.unlink(missing_ok=True)
+            logger.debug(f"Removed unreferenced startup script {script}")
+
+
+def _scripts_present(output_dir: Path, fragment: str) -> bool:
+    """True when every startup script a cached service fragment mounts still exists."""
+    return all((output_dir / ref).is_file() for ref in _STARTUP_SCRIPT_REF.findall(fragment))
+
+
+def _mount_source(path: Path, output_dir: Path) -> str:
+    """Bind-mount source for *path* relative to *output_dir*, which Compose resolves it against."""
+    relative = Path(os.path.relpath(path, output_dir)).as_posix()
+    return relative if relative.startswith("../") else f"./{relative}"
 
-    if default_machine and default_machine not in lab_config.machines:
-        raise ValueError(f"Default machine '{default_machine}' not found in lab.conf")
 
-    all_domains: set[str] = set()
+def _compose_networks(lab_config: LabConfig) -> dict[str, Any]:
+    """Networks for every collision domain (plus the bridged network if any machine uses it)."""
+    members: dict[str, int] = {}
     for machine in lab_config.machines.values():
-        all_domains.update(domain for _, domain in machine.collision_domains)
+        for _, domain in machine.collision_domains:
+            members[domain] = members.get(domain, 0) + 1
 
-    # Assign each network a dedicated /28 subnet to avoid exhausting Docker's
-    # default address pools ("all predefined address pools have been fully subnetted").
-    # Base 10.128.0.0; each collision domain gets one /28 (16 addresses).
-    sorted_domains = sorted(all_domains)
-    services: dict[str, Any] = {}
+    # Assign each network a dedicated subnet to avoid exhausting Docker's default
+    # address pools ("all predefined address pools have been fully subnetted").
+    # Base 10.128.0.0; each collision domain gets the smallest aligned subnet that
+    # fits its machines (a /28 of 16 addresses for up to 13 machines).
     networks: dict[str, Any] = {}
-    for idx, domain in enumerate(sorted_domains):
-        subnet_addr = 0x0A80_0000 + idx * 16  # 10.128.0.0 + idx*16
-        a, b, c, d = (
-            (subnet_addr >> 24) & 0xFF,
-            (subnet_addr >> 16) & 0xFF,
-            (subnet_addr >> 8) & 0xFF,
-            subnet_addr & 0xFF,
-        )
-        subnet = f"{a}.{b}.{c}.{d}/28"
+    offset = 0
+    for domain in sorted(members):
+        prefix = subnet_prefix(members[domain])
+        size = 2 ** (32 - prefix)
+        offset = -(-offset // size) * size  # keep the subnet aligned to its size
+        subnet = str(ipaddress.IPv4Network((0x0A80_0000 + offset, prefix)))
+        offset += size
         networks[domain] = {
             "driver": "bridge",
             "internal": True,
@@ -343,97 +1348,385 @@ def generate_compose_for_inspect(
                 "config": [{"subnet": subnet}],
             },
         }
-    # add a default machine
-    services["default"] = {
-        "image": DEFAULT_IMAGE,
+    if any(machine.bridged for machine in lab_config.machines.values()):
+        networks[BRIDGED_NETWORK] = {"driver": "bridge"}
+    return networks
+
+
+def _healthcheck_mode() -> str:
+    """Healthcheck mode of generated services, from INSPECT_KATHARA_HEALTHCHECK."""
+    value = os.environ.get(HEALTHCHECK_ENV, "").strip().lower()
+    if not value:
+        return DEFAULT_HEALTHCHECK_MODE
+    if value not in HEALTHCHECK_MODES:
+        logger.warning(f"Ignoring invalid {HEALTHCHECK_ENV}={value!r}, expected one of {HEALTHCHECK_MODES}")
+        return DEFAULT_HEALTHCHECK_MODE
+    return value
+
+
+def _service_probe(expected_services: list[str]) -> str:
+    """One shell probe that every expected daemon is running, from a single ``ps``.
+
+    Patterns are bracketed (``[z]ebra``) so they do not match the probe's own
+    command line, which contains them literally. Shell variables are written
+    ``$$`` so Compose interpolation leaves them to the shell.
+    """
+    patterns = " ".join(f"'[{svc[0]}]{svc[1:]}'" for svc in expected_services)
+    return f'p=$$(ps -eo args=) && for s in {patterns}; do case "$$p" in *$$s*) ;; *) exit 1 ;; esac; done'
+
+
+@functools.lru_cache(maxsize=1)
+def _engine_supports_start_interval() -> bool:
+    """Whether the Docker Engine honours the healthcheck ``start_interval`` (API 1.44+).
+
+    Asked once per process; an engine that cannot be reached counts as too old,
+    so generated healthchecks fall back to a short interval that works everywhere.
+    """
+    try:
+        result = subprocess.run(
+            ["docker", "version", "--format", "{{.Server.APIVersion}}"],
+            capture_output=True,
+            text=True,
+            timeout=10,
+        )
+        version = tuple(int(part) for part in result.stdout.strip().split("."))
+    except (OSError, subprocess.SubprocessError, ValueError):
+        return False
+    return result.returncode == 0 and version >= START_INTERVAL_API_VERSION
+
+
+def _probes_start_interval(offline: bool) -> bool:
+    """Whether generated healthchecks use ``start_interval``.
+
+    Offline generation makes no Docker calls and cannot know the engine that
+    will run the compose file, so it writes the fallback interval.
+    """
+    return not offline and _engine_supports_start_interval()
+
+
+def _healthcheck(expected_services: list[str], mode: str, start_interval: bool = True) -> dict[str, Any]:
+    """Compose healthcheck verifying *expected_services* run, probing as often as *mode* needs.
+
+    Without *start_interval* support the first probe only comes after one
+    interval, so readiness and liveness probe every HEALTHCHECK_FALLBACK_INTERVAL.
+    """
+    healthcheck: dict[str, Any] = {"test": ["CMD-SHELL", _service_probe(expected_services)], "timeout": "5s"}
+    if mode == "continuous":
+        healthcheck.update(interval="2s", retries=10, start_period="5s")
+    elif not start_interval:
+        healthcheck.update(interval=HEALTHCHECK_FALLBACK_INTERVAL, retries=3, start_period=HEALTHCHECK_START_PERIOD)
+    else:
+        # Docker probes every start_interval until the first success within start_period,
+        # then every interval
+        healthcheck.update(
+            interval=LIVENESS_INTERVAL if mode == "liveness" else READINESS_IDLE_INTERVAL,
+            retries=3,
+            start_period=HEALTHCHECK_START_PERIOD,
+            start_interval=HEALTHCHECK_START_INTERVAL,
+        )
+    return healthcheck
+
+
+def _machine_service(
+    lab_path: Path,
+    machine_name: str,
+    config: MachineConfig,
+    startup_configs: dict[str, str] | None,
+    startup_pattern: str | None,
+    offline: bool = False,
+    depends_on: dict[str, Any] | None = None,
+    output_dir: Path | None = None,
+) -> dict[str, Any]:
+    """Compose service for one lab.conf machine (validates its image unless *offline*).
+
+    Scripts are written under *output_dir* (default *lab_path*), the directory
+    of the compose file, and mounts are relative to it.
+    """
+    output_dir = output_dir or lab_path
+    image = config.image or DEFAULT_IMAGE
+    if offline:
+        check_kathara_image_name(image)
+    else:
+        validate_kathara_image(image)
+    is_router = is_routing_image(image)
+
+    service: dict[str, Any] = {
+        "image": image,
         "x-local": True,
         "init": True,
-        "hostname": "default",
-        "cap_add": ROUTER_CAPABILITIES,
-        "command": "sleep infinity",
+        "hostname": machine_name,
+        "cap_add": list(ROUTER_CAPABILITIES if is_router else HOST_CAPABILITIES),
+        "privileged": True,
     }
 
-    machine_names = list(lab_config.machines.keys())
-    for idx, machine_name in enumerate(machine_names):
-        config = lab_config.machines[machine_name]
+    if is_router:
+        service["sysctls"] = ROUTER_SYSCTLS.copy()
+    # lab.conf mem/cpus/sysctl/env/port/ipv6 directives
+    for key, value in machine_service_options(config).items():
+        if key == "sysctls":
+            service.setdefault("sysctls", {}).update(value)
+        else:
+            service[key] = value
+
+    # Connect to collision-domain networks with explicit interface_name (Compose spec)
+    if config.collision_domains:
+        service["networks"] = {}
+        for eth_index, domain in sorted(config.collision_domains, key=lambda x: x[0]):
+            attachment = {"interface_name": f"eth{eth_index}"}
+            if eth_index in config.macs:
+                attachment["mac_address"] = config.macs[eth_index]
+            service["networks"][domain] = attachment
+    if config.bridged:
+        # Kathara's bridged interface reaches the host network after the lab interfaces
+        service.setdefault("networks", {})[BRIDGED_NETWORK] = {}
+
+    # Add health check for images with services (e.g., named for bind, frr for routers)
+    expected_services = get_image_services(image)
+    if expected_services:
+        service["healthcheck"] = _healthcheck(expected_services, _healthcheck_mode(), _probes_start_interval(offline))
+
+    # Config files are copied into place by the prologue; the startup script is
+    # mounted as a file, so it is never re-quoted or interpolated by Compose
+    volumes = [f"./{SCRIPT_DIR}/prologue.sh:{STARTUP_PROLOGUE_PATH}:ro"]
+    config_dir = lab_path / "topology" / machine_name
+    if config_dir.exists() and config_dir.is_dir():
+        volumes.append(f"{_mount_source(config_dir, output_dir)}:/tmp/config:ro")
+    script_lines = []
+    startup_script = _get_startup_script(lab_path, machine_name, startup_configs, startup_pattern)
+    if startup_script and startup_script.strip():
+        script_lines.append(startup_script.rstrip("\n"))
+    script_lines.extend(config.exec_commands)
+    if script_lines:
+        script = _startup_script_file(output_dir, "\n".join(script_lines) + "\n")
+        volumes.append(f"./{script}:{STARTUP_SCRIPT_PATH}:ro")
+    service["volumes"] = volumes
+    service["command"] = ["bash", "-l", STARTUP_PROLOGUE_PATH]
+    if depends_on:
+        service["depends_on"] = depends_on
+    return service
+
+
+def _startup_stage(image: str) -> int:
+    """0 for routers and service images (started first), 1 for plain hosts."""
+    return 0 if is_routing_image(image) or get_image_services(image) else 1
+
+
+def _startup_dependencies(lab_config: LabConfig) -> dict[str, dict[str, Any]]:
+    """``depends_on`` of each machine: hosts wait for the routers and service machines on their collision domains.
+
+    Dependencies with a healthcheck (images with ``services``) are awaited
+    until healthy, others until started. Hosts sharing no collision domain
+    with a router or service machine start right away, so the entries grow
+    with the size of each domain rather than with the square of the lab.
+    """
+    first: dict[str, str] = {}
+    by_domain: dict[str, list[str]] = {}
+    for name, config in lab_config.machines.items():
         image = config.image or DEFAULT_IMAGE
-        validate_kathara_image(image)
-        is_router = is_routing_image(image)
-        startup_command = None
-        copy_command = None
-
-        service: dict[str, Any] = {
-            "image": image,
-            "x-local": True,
-            "init": True,
-            "hostname": machine_name,
-            "cap_add": ROUTER_CAPABILITIES if is_router else HOST_CAPABILITIES,
-            "privileged": True,
+        if _startup_stage(image) == 0:
+            first[name] = "service_healthy" if get_image_services(image) else "service_started"
+            for _, domain in config.collision_domains:
+                by_domain.setdefault(domain, []).append(name)
+    dependencies: dict[str, dict[str, Any]] = {}
+    if not first:
+        return dependencies
+    for name, config in lab_config.machines.items():
+        if name in first:
+            continue
+        depends_on = {
+            dependency: {"condition": first[dependency]}
+            for _, domain in config.collision_domains
+            for dependency in by_domain.get(domain, ())
         }
+        if depends_on:
+            dependencies[name] = depends_on
+    return dependencies
 
-        if is_router:
-            service["sysctls"] = ROUTER_SYSCTLS.copy()
-
-        # Connect to collision-domain networks with explicit interface_name (Compose spec)
-        if config.collision_domains:
-            service["networks"] = {
-                domain: {"interface_name": f"eth{eth_index}"}
-                for eth_index, domain in sorted(config.collision_domains, key=lambda x: x[0])
-            }
-
-        startup_script = _get_startup_script(lab_path, machine_name, startup_configs, startup_pattern)
-        if startup_script:
-            # Use space instead of && if script ends with & (background process)
-            startup_command = startup_script.rstrip()
-
-        # Add health check for images with services (e.g., named for bind, frr for routers)
-        expected_services = get_image_services(image)
-        if expected_services:
-            # Health check verifies all expected services are running
-            check_cmd = " && ".join(f"pgrep -f {svc}" for svc in expected_services)
-            service["healthcheck"] = {
-                "test": ["CMD-SHELL", check_cmd],
-                "interval": "2s",
-                "timeout": "5s",
-                "retries": 10,
-                "start_period": "5s",
-            }
-
-        # Add volumes and copy configuration files
-        config_dir = lab_path / "topology" / machine_name
-        if config_dir.exists() and config_dir.is_dir():
-            service.setdefault("volumes", [])
-            service["volumes"].append(f"./{config_dir.relative_to(lab_path).as_posix()}:/tmp/config:ro")
-            copy_command = "cp -r /tmp/config/* /;"
-
-        # Compose commands: build as multiline for readable YAML (command: |- ...)
-        cmd_lines = [
-            "bash -lc '",
-            'for d in $(ls /sys/class/net | grep -v lo); do ip addr flush dev "$$d"; done;',
-            'for d in $(ls /sys/class/net | grep -v lo); do ip route flush dev "$$d"; done;',
-        ]
-        if copy_command:
-            cmd_lines.append(copy_command)
-        if startup_command:
-            # Put each " && "-separated part on its own line when possible
-            for part in startup_command.split(" && "):
-                cmd_lines.append(part.strip())
-        cmd_lines.append("sleep infinity")
-        cmd_lines.append("'")
-        service["command"] = _LiteralStr("\n".join(cmd_lines))
-
-        services[machine_name] = service
-
-    yaml_content: str = yaml.dump(
-        {"services": services, "networks": networks},
-        default_flow_style=False,
-        sort_keys=False,
-        Dumper=yaml.SafeDumper,
-    )
+
+def _dump_yaml(data: dict[str, Any]) -> str:
+    dumped: str = yaml.dump(data, default_flow_style=False, sort_keys=False, Dumper=YAML_DUMPER)
+    return dumped
+
+
+def _service_fragment(name: str, service: dict[str, Any], output_format: str = "yaml") -> str:
+    """YAML of one service, indented to sit under the top-level ``services:`` key (or a JSON member)."""
+    if output_format == "json":
+        return f"{json.dumps(name)}: {json.dumps(service)}"
+    return "".join(f"  {line}" if line.strip() else line for line in _dump_yaml({name: service}).splitlines(True))
+
+
+# Service every generated stack starts the agent in
+_DEFAULT_SERVICE: dict[str, Any] = {
+    "image": DEFAULT_IMAGE,
+    "x-local": True,
+    "init": True,
+    "hostname": "default",
+    "cap_add": ROUTER_CAPABILITIES,
+    "command": "sleep infinity",
+}
+
+
+def _load_lab_for_compose(lab_path: Path, default_machine: str | None) -> LabConfig:
+    lab_conf_path = lab_path / "topology" / "lab.conf"
+    if not lab_conf_path.exists():
+        raise FileNotFoundError(f"lab.conf not found at {lab_conf_path}")
+
+    lab_config = parse_lab_conf(lab_conf_path)
+    if not lab_config.machines:
+        raise ValueError(f"No machines found in {lab_conf_path}")
+
+    if default_machine and default_machine not in lab_config.machines:
+        raise ValueError(f"Default machine '{default_machine}' not found in lab.conf")
+    return lab_config
+
+
+def _render_compose(lab_config: LabConfig, fragments: dict[str, str], output_format: str = "yaml") -> str:
+    """Assemble compose YAML (or JSON) from per-machine service fragments."""
+    networks = _compose_networks(lab_config)
+    if output_format == "json":
+        members = [_service_fragment("default", _DEFAULT_SERVICE, "json")]
+        members.extend(fragments[name] for name in lab_config.machines)
+        return '{"services": {' + ", ".join(members) + '}, "networks": ' + json.dumps(networks) + "}\n"
+    domains = [name for name in networks if name != BRIDGED_NETWORK]
     header = "# Auto-generated from Kathara lab.conf\n"
-    header += f"# Machines: {', '.join(machine_names)}\n# Networks: {', '.join(sorted(all_domains))}\n"
+    header += f"# Machines: {', '.join(lab_config.machines)}\n# Networks: {', '.join(domains)}\n"
     header += "# Per-network x-interface-name = eth0, eth1, ... (from lab.conf machine[0], machine[1], ...)\n\n"
-    return header + yaml_content  # compose
+    services = _service_fragment("default", _DEFAULT_SERVICE) + "".join(fragments[name] for name in lab_config.machines)
+    return header + "services:\n" + services + _dump_yaml({"networks": networks})
+
+
+def generate_compose_for_inspect(
+    lab_path: Path,
+    startup_configs: dict[str, str] | None = None,
+    default_machine: str | None = None,
+    startup_pattern: str | None = None,
+    offline: bool = False,
+    output_format: str = "yaml",
+    output_dir: Path | None = None,
+) -> str:
+    """Generate compose YAML for a lab.
+
+    Besides returning the compose file, this writes the scripts its services
+    mount into ``.kathara/`` under *output_dir*, the directory the compose
+    file will be written to (default *lab_path*). Bind-mount sources are
+    relative to that directory, as Compose resolves them.
+
+    With *offline*, images are not validated (no Docker calls): generation
+    only reads the lab, and images are resolved separately before the eval
+    (see ``lab_images`` and ``ensure_image_manifests``).
+
+    ``output_format="json"`` emits compact JSON instead, which Compose reads
+    as well and which is faster to write and parse for machine-consumed files.
+    """
+    if output_format not in COMPOSE_FORMATS:
+        raise ValueError(f"Unknown compose format {output_format!r}, expected one of {COMPOSE_FORMATS}")
+    lab_config = _load_lab_for_compose(lab_path, default_machine)
+    output_dir = output_dir or lab_path
+    _write_startup_prologue(output_dir)
+    dependencies = _startup_dependencies(lab_config)
+    fragments = {
+        name: _service_fragment(
+            name,
+            _machine_service(
+                lab_path, name, config, startup_configs, startup_pattern, offline, dependencies.get(name), output_dir
+            ),
+            output_format,
+        )
+        for name, config in lab_config.machines.items()
+    }
+    return _render_compose(lab_config, fragments, output_format)  # compose
+
+
+def lab_images(lab_config: LabConfig) -> list[str]:
+    """Distinct images a lab's generated compose needs, including the default service's."""
+    images = [_DEFAULT_SERVICE["image"], *(machine.image or DEFAULT_IMAGE for machine in lab_config.machines.values())]
+    return list(dict.fromkeys(images))
+
+
+def image_manifest_path(output_path: Path) -> Path:
+    """Image manifest written next to an offline-generated compose file (``compose.images.json``)."""
+    return output_path.with_name(f"{output_path.stem}.images.json")
+
+
+def _write_image_manifest(output_path: Path, lab_config: LabConfig) -> None:
+    manifest = {"compose": output_path.name, "images": lab_images(lab_config)}
+    _write_if_changed(image_manifest_path(output_path), json.dumps(manifest, indent=2) + "\n")
+
+
+async def ensure_image_manifests(manifests: Iterable[Path], max_parallel: int = IMAGE_PULL_CONCURRENCY) -> list[str]:
+    """Make every image listed in the given manifests available, in one batch.
+
+    The distinct images of all manifests are checked against one image
+    listing and the missing ones pulled or built with at most
+    *max_parallel* at once (see ``ensure_kathara_images``).
+
+    Returns:
+        The distinct images that were checked.
+    """
+    images: list[str] = []
+    for manifest in manifests:
+        images.extend(json.loads(Path(manifest).read_text())["images"])
+    return await ensure_kathara_images(images, max_parallel=max_parallel)
+
+
+def _file_signature(path: Path) -> list[Any]:
+    try:
+        stat = path.stat()
+    except OSError:
+        return [str(path), None]
+    return [str(path), stat.st_mtime_ns, stat.st_size]
+
+
+def _machine_fingerprint(
+    lab_path: Path,
+    config: MachineConfig,
+    startup_configs: dict[str, str] | None,
+    startup_pattern: str | None,
+    depends_on: dict[str, Any] | None = None,
+    start_interval: bool = True,
+    offline: bool = False,
+    output_dir: Path | None = None,
+) -> str:
+    """Hash of everything one machine's service fragment is generated from.
+
+    Besides the machine's own inputs this covers the generation options that
+    change the fragment or what generating it does: *offline* (a fragment
+    generated offline never validated its image), the healthcheck settings,
+    and where mounts are relative to.
+    """
+    inputs: list[Any] = [
+        repr([getattr(config, name) for name in MachineConfig.FIELDS]),
+        depends_on,
+        _healthcheck_mode(),
+        start_interval,
+        offline,
+        os.path.relpath(lab_path, output_dir or lab_path),
+    ]
+    if startup_configs and config.name in startup_configs:
+        inputs.append(["inline", startup_configs[config.name]])
+    else:
+        startup_file = _find_startup_file(lab_path, config.name, startup_pattern)
+        inputs.append(_file_signature(startup_file) if startup_file else None)
+    config_dir = lab_path / "topology" / config.name
+    if config_dir.is_dir():
+        for root, dirs, files in os.walk(config_dir):
+            dirs.sort()
+            inputs.extend(_file_signature(Path(root) / name) for name in sorted(files))
+    return hashlib.sha256(json.dumps(inputs, default=str).encode()).hexdigest()
+
+
+def _compose_state_path(output_path: Path) -> Path:
+    return output_path.with_name(f".{output_path.name}.kathara.json")
+
+
+def _load_compose_state(state_path: Path) -> dict[str, Any]:
+    try:
+        state = json.loads(state_path.read_text())
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(state, dict) or state.get("version") != COMPOSE_GENERATOR_VERSION:
+        return {}
+    return state
 
 
 def write_compose_for_lab(
@@ -443,19 +1736,146 @@ def write_compose_for_lab(
     default_machine: str | None = None,
     subnet_base: str | None = None,
     startup_pattern: str | None = None,
+    incremental: bool = False,
+    offline: bool = False,
+    manifest: bool | None = None,
 ) -> Path:
-    compose_content = generate_compose_for_inspect(
-        lab_path,
-        startup_configs=startup_configs,
-        default_machine=default_machine,
-        startup_pattern=startup_pattern,
-    )
+    """Generate compose.yaml for a lab and write it (only if its content changed).
+
+    An *output_path* ending in ``.json`` is written as JSON compose. The
+    scripts it mounts are written to ``.kathara/`` next to it, and scripts no
+    compose file in that directory references any more are deleted.
+
+    With *offline*, images are not validated and a manifest of the images
+    the compose needs is written next to it (``compose.images.json``), to be
+    resolved in one batch with ``ensure_image_manifests`` before the eval.
+    *manifest* overrides whether the manifest is written (default: *offline*).
+
+    With *incremental*, a sidecar (``.compose.yaml.kathara.json``) records a
+    fingerprint of every machine's inputs (lab.conf directives, startup file,
+    config directory) and its generated service fragment. Unchanged machines
+    reuse their fragment without re-reading startup files or re-validating
+    images, and when nothing changed at all the output is left untouched.
+    """
     output_path = output_path or lab_path / "compose.yaml"
-    output_path.write_text(compose_content)
-    logger.info(f"Generated compose.yaml at {output_path}")
+    output_dir = output_path.parent
+    output_format = "json" if output_path.suffix == ".json" else "yaml"
+    lab_config = _load_lab_for_compose(lab_path, default_machine)
+    if manifest if manifest is not None else offline:
+        _write_image_manifest(output_path, lab_config)
+    if not incremental:
+        compose_content = generate_compose_for_inspect(
+            lab_path,
+            startup_configs=startup_configs,
+            default_machine=default_machine,
+            startup_pattern=startup_pattern,
+            offline=offline,
+            output_format=output_format,
+            output_dir=output_dir,
+        )
+        _write_if_changed(output_path, compose_content)
+        _prune_startup_scripts(output_dir)
+        return output_path
+
+    _write_startup_prologue(output_dir)
+    state_path = _compose_state_path(output_path)
+    state = _load_compose_state(state_path)
+    if state.get("format", "yaml") != output_format:
+        state = {}
+    cached: dict[str, Any] = state.get("machines", {})
+    dependencies = _startup_dependencies(lab_config)
+    start_interval = _probes_start_interval(offline)
+    fingerprints = {
+        name: _machine_fingerprint(
+            lab_path,
+            config,
+            startup_configs,
+            startup_pattern,
+            dependencies.get(name),
+            start_interval=start_interval,
+            offline=offline,
+            output_dir=output_dir,
+        )
+        for name, config in lab_config.machines.items()
+    }
+    stack_key = hashlib.sha256(
+        json.dumps([list(lab_config.machines), sorted(fingerprints.values())]).encode()
+    ).hexdigest()
+    if (
+        state.get("stack") == stack_key
+        and state.get("output") == _file_signature(output_path)
+        and all(_scripts_present(output_dir, entry["fragment"]) for entry in cached.values())
+    ):
+        logger.debug(f"compose.yaml at {output_path} is up to date")
+        return output_path
+
+    fragments: dict[str, str] = {}
+    regenerated = 0
+    for name, config in lab_config.machines.items():
+        entry = cached.get(name)
+        if entry and entry.get("fingerprint") == fingerprints[name] and _scripts_present(output_dir, entry["fragment"]):
+            fragments[name] = entry["fragment"]
+        else:
+            service = _machine_service(
+                lab_path, name, config, startup_configs, startup_pattern, offline, dependencies.get(name), output_dir
+            )
+            fragments[name] = _service_fragment(name, service, output_format)
+            regenerated += 1
+
+    _write_if_changed(output_path, _render_compose(lab_config, fragments, output_format))
+    state = {
+        "version": COMPOSE_GENERATOR_VERSION,
+        "format": output_format,
+        "stack": stack_key,
+        "output": _file_signature(output_path),
+        "machines": {name: {"fingerprint": fingerprints[name], "fragment": fragments[name]} for name in fragments},
+    }
+    _atomic_write(state_path, json.dumps(state))
+    _prune_startup_scripts(output_dir)
+    logger.debug(f"Regenerated {regenerated}/{len(fragments)} services for {output_path}")
     return output_path
 
 
+def _write_if_changed(output_path: Path, content: str) -> None:
+    """Write *content* unless the file already holds it (keeps its mtime for Compose)."""
+    try:
+        if output_path.read_text() == content:
+            logger.debug(f"compose.yaml at {output_path} is unchanged")
+            return
+    except OSError:
+        pass
+    _atomic_write(output_path, content)
+    logger.info(f"Generated compose.yaml at {output_path}")
+
+
+def _umask() -> int:
+    # The umask can only be read by setting it
+    mask = os.umask(0o022)
+    os.umask(mask)
+    return mask
+
+
+def _atomic_write(path: Path, content: str) -> None:
+    """Replace *path* with *content* so readers never see a partially written file.
+
+    The file keeps the mode of the file it replaces, and new files get the
+    usual ``0o666 & ~umask`` (``mkstemp`` would leave them at 0600).
+    """
+    try:
+        mode = stat.S_IMODE(path.stat().st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~_umask()
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w") as f:
+            f.write(content)
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
 def get_machine_service_mapping(lab_path: Path) -> dict[str, str]:
     lab_conf_path = lab_path / "topology" / "lab.conf"
     if not lab_conf_path.exists():
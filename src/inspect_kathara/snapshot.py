@@ -0,0 +1,317 @@
+"""Structured snapshot of network state across the machines of a stack.
+
+Scorers that check routing state otherwise run ``vtysh -c 'show ip route'``,
+``ip route``, ``iptables-save`` and ``sysctl`` one command and one machine at
+a time. ``network_snapshot`` runs a set of named probes as one script per
+container, all containers in parallel, and parses each probe's output into
+Python objects (JSON from ``ip -j`` and ``vtysh ... json``, tables for
+``iptables-save``, a dict for sysctls)::
+
+    snapshot = await network_snapshot(probes=["frr_routes", "iptables"])
+    routes = snapshot["r1"].data("frr_routes")  # parsed `show ip route json`
+    forwarding = snapshot.data("sysctl")          # {service: {key: value}}
+
+Results of probes that only change when something runs in a container
+(addresses, iptables, sysctls, FRR config) are cached for ``kathara``
+environments and reused until the stack's ``generation`` changes, i.e. until
+an ``exec`` or file write on *any* container of the stack: a command on one
+router can change the state of all the others. Probes of state that routing
+protocols keep changing on their own (routes, neighbours, ``frr_*`` protocol
+state) are read again on every snapshot unless the caller opts in with
+``cache_converging=True``, e.g. for a scorer that takes several snapshots of
+an already converged network in quick succession.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Callable, Collection, Iterable, Mapping
+
+from inspect_ai.util import ExecResult
+from inspect_ai.util._sandbox.context import sandbox_environments_context_var
+from inspect_ai.util._sandbox.environment import SandboxEnvironment
+
+from inspect_kathara.fanout import DEFAULT_MAX_IN_FLIGHT
+from inspect_kathara.sandbox import KatharaSandboxEnvironment
+
+# Timeout (seconds) of one container's probe script
+SNAPSHOT_TIMEOUT = 60
+
+# Line printed before and after each probe's output (the latter with its exit status)
+_MARKER = "__KATHARA_PROBE__"
+_SECTION = re.compile(rf"^{_MARKER} (\S+)\n(.*?)\n{_MARKER} (\d+)$", re.DOTALL | re.MULTILINE)
+
+# Kernel settings reported by the sysctl probe
+_SYSCTL_KEYS = "forwarding|rp_filter|accept_redirects|send_redirects|proxy_arp"
+
+
+def parse_json(output: str) -> Any:
+    return json.loads(output)
+
+
+def parse_iptables(output: str) -> dict[str, dict[str, Any]]:
+    """Tables of ``iptables-save`` output: ``{table: {"policies": {chain: policy}, "rules": [...]}}``."""
+    tables: dict[str, dict[str, Any]] = {}
+    table: dict[str, Any] | None = None
+    for line in output.splitlines():
+        line = line.strip()
+        if line.startswith("*"):
+            table = tables.setdefault(line[1:], {"policies": {}, "rules": []})
+        elif table is None or not line or line.startswith("#") or line == "COMMIT":
+            continue
+        elif line.startswith(":"):
+            chain, policy = (line[1:].split() + ["-"])[:2]
+            table["policies"][chain] = policy
+        else:
+            table["rules"].append(line)
+    return tables
+
+
+def parse_sysctl(output: str) -> dict[str, str]:
+    """``key = value`` lines as a dict."""
+    values = {}
+    for line in output.splitlines():
+        key, sep, value = line.partition("=")
+        if sep:
+            values[key.strip()] = value.strip()
+    return values
+
+
+def parse_text(output: str) -> str:
+    return output
+
+
+@dataclass(frozen=True)
+class Probe:
+    """A named shell command reading some state, and the parser of its output."""
+
+    name: str
+    command: str
+    parse: Callable[[str], Any] = parse_text
+    vtysh: bool = False
+    """Whether the command needs ``vtysh`` (skipped for services known to lack it)."""
+    converges: bool = False
+    """Whether the state changes as routing protocols converge, without any command being run."""
+
+
+PROBES: dict[str, Probe] = {
+    probe.name: probe
+    for probe in [
+        Probe("routes", "ip -j route show", parse_json, converges=True),
+        Probe("routes6", "ip -j -6 route show", parse_json, converges=True),
+        Probe("addresses", "ip -j addr show", parse_json),
+        Probe("neighbors", "ip -j neigh show", parse_json, converges=True),
+        Probe("iptables", "iptables-save", parse_iptables),
+        Probe(
+            "sysctl",
+            f"sysctl -a | grep -E '^net\\.ipv[46]\\.(ip_forward|conf\\.[^ ]+\\.({_SYSCTL_KEYS})) ' || [ $? -eq 1 ]",
+            parse_sysctl,
+        ),
+        Probe("frr_routes", "vtysh -c 'show ip route json'", parse_json, vtysh=True, converges=True),
+        Probe("frr_bgp", "vtysh -c 'show bgp summary json'", parse_json, vtysh=True, converges=True),
+        Probe("frr_ospf", "vtysh -c 'show ip ospf neighbor json'", parse_json, vtysh=True, converges=True),
+        Probe("frr_config", "vtysh -c 'show running-config'", parse_text, vtysh=True),
+    ]
+}
+
+DEFAULT_PROBES = ("routes", "addresses", "iptables", "sysctl", "frr_routes")
+
+
+@dataclass
+class ProbeResult:
+    """Output of one probe on one service."""
+
+    name: str
+    returncode: int
+    output: str
+    data: Any = None
+    error: str | None = None
+
+    @property
+    def ok(self) -> bool:
+        """True when the command succeeded and its output parsed."""
+        return self.returncode == 0 and self.error is None
+
+
+@dataclass
+class ServiceState:
+    """Probe results of one service."""
+
+    service: str
+    probes: dict[str, ProbeResult] = field(default_factory=dict)
+    error: str | None = None
+    seconds: float = 0.0
+    generation: int | None = None
+    """Stack ``generation`` the state was read at (None outside ``kathara`` environments)."""
+
+    def data(self, probe: str) -> Any:
+        """Parsed output of *probe*, or None when it failed or did not run."""
+        result = self.probes.get(probe)
+        return result.data if result is not None and result.ok else None
+
+
+@dataclass
+class NetworkSnapshot:
+    """Probe results of every service in a snapshot."""
+
+    services: dict[str, ServiceState]
+    cached: list[str] = field(default_factory=list)
+    """Services whose state was served entirely from the cache (no exec)."""
+    seconds: float = 0.0
+
+    def __getitem__(self, service: str) -> ServiceState:
+        return self.services[service]
+
+    def data(self, probe: str) -> dict[str, Any]:
+        """Parsed output of *probe* by service, for the services where it succeeded."""
+        return {
+            service: state.probes[probe].data
+            for service, state in self.services.items()
+            if probe in state.probes and state.probes[probe].ok
+        }
+
+    @property
+    def failed(self) -> list[str]:
+        """Services whose probes could not be run at all."""
+        return [service for service, state in self.services.items() if state.error is not None]
+
+
+def probe_script(probes: Iterable[Probe]) -> str:
+    """One shell script running every probe, each output framed by ``_MARKER`` lines."""
+    return "\n".join(
+        f"echo '{_MARKER} {probe.name}'\n{{ {probe.command}\n}} </dev/null 2>/dev/null\nprintf '\\n{_MARKER} %s\\n' $?"
+        for probe in probes
+    )
+
+
+def parse_probes(output: str, probes: Iterable[Probe]) -> dict[str, ProbeResult]:
+    """Split the output of ``probe_script`` and parse each probe's section."""
+    sections = {match[1]: (int(match[3]), match[2]) for match in _SECTION.finditer(output)}
+    results = {}
+    for probe in probes:
+        if probe.name not in sections:
+            results[probe.name] = ProbeResult(probe.name, -1, "", error="no output")
+            continue
+        returncode, text = sections[probe.name]
+        result = results[probe.name] = ProbeResult(probe.name, returncode, text)
+        if returncode != 0:
+            result.error = "vtysh not available" if probe.vtysh and returncode == 127 else f"exit status {returncode}"
+            continue
+        try:
+            result.data = probe.parse(text)
+        except ValueError as e:
+            result.error = f"unparseable output: {e}"
+    return results
+
+
+def _resolve_probes(probes: Iterable[str | Probe]) -> list[Probe]:
+    resolved = []
+    for probe in probes:
+        if isinstance(probe, str):
+            if probe not in PROBES:
+                raise ValueError(f"Unknown probe {probe!r} (known: {', '.join(PROBES)})")
+            probe = PROBES[probe]
+        resolved.append(probe)
+    return resolved
+
+
+async def network_snapshot(
+    services: Iterable[str] | None = None,
+    probes: Iterable[str | Probe] = DEFAULT_PROBES,
+    vtysh_services: Collection[str] | None = None,
+    max_in_flight: int = DEFAULT_MAX_IN_FLIGHT,
+    timeout: int | None = SNAPSHOT_TIMEOUT,
+    refresh: bool = False,
+    cache_converging: bool = False,
+    environments: Mapping[str, SandboxEnvironment] | None = None,
+) -> NetworkSnapshot:
+    """Read the state of many services with one exec per service, all in parallel.
+
+    Args:
+        services: Services to probe (default: every sandbox of the sample).
+        probes: Names from ``PROBES`` or custom ``Probe`` objects.
+        vtysh_services: Services that have ``vtysh``, e.g. from
+            ``get_frr_services``; vtysh probes are skipped on all others.
+            By default they run everywhere and report ``vtysh not available``
+            where the command is missing.
+        max_in_flight: Execs running at once.
+        timeout: Timeout in seconds of each service's probe script.
+        refresh: Probe even services with a current cached state.
+        cache_converging: Also cache probes of state that changes as routing
+            protocols converge (``Probe.converges``); their cached results
+            may then lag behind the network.
+        environments: Sandboxes by service name (default: the current
+            sample's sandboxes).
+
+    Returns:
+        The state of each service, in the order of *services*. Services that
+        cannot be probed (unknown service, exec failure, timeout) have their
+        ``error`` set; nothing is raised.
+    """
+    started = time.monotonic()
+    selected = _resolve_probes(probes)
+    if environments is None:
+        environments = sandbox_environments_context_var.get({})
+    names = list(services) if services is not None else list(environments)
+    semaphore = asyncio.Semaphore(max(1, max_in_flight))
+    snapshot = NetworkSnapshot({name: ServiceState(name) for name in names})
+
+    async def probe(service: str) -> None:
+        state = snapshot.services[service]
+        service_probes = [p for p in selected if not p.vtysh or vtysh_services is None or service in vtysh_services]
+        env = environments.get(service)
+        if env is None:
+            state.error = f"unknown service {service!r}"
+            return
+        kathara = _kathara_environment(env)
+        cacheable = [p for p in service_probes if kathara is not None and (cache_converging or not p.converges)]
+        key = tuple(f"{p.name}:{p.command}" for p in cacheable)
+        cached: dict[str, ProbeResult] = {}
+        if kathara is not None and cacheable and not refresh:
+            entry = kathara._snapshots.get(key)
+            if entry is not None and entry[0] == kathara.generation:
+                cached = entry[1]
+        pending = [p for p in service_probes if p.name not in cached]
+        if not pending:
+            state.probes = {p.name: cached[p.name] for p in service_probes}
+            state.generation = kathara.generation if kathara is not None else None
+            snapshot.cached.append(service)
+            return
+        async with semaphore:
+            state_started = time.monotonic()
+            generation = kathara.generation if kathara is not None else None
+            try:
+                cmd = ["sh", "-c", probe_script(pending)]
+                result: ExecResult[str]
+                if kathara is not None:
+                    result = await kathara.exec_read_only(cmd, timeout=timeout)
+                else:
+                    result = await env.exec(cmd, timeout=timeout)
+                fresh = parse_probes(result.stdout, pending)
+                state.probes = {p.name: cached.get(p.name) or fresh[p.name] for p in service_probes}
+            except TimeoutError:
+                state.error = f"timed out after {timeout}s"
+            except Exception as e:
+                state.error = f"{type(e).__name__}: {e}"
+            finally:
+                state.seconds = time.monotonic() - state_started
+        # Cache only state that no concurrent exec on the stack may have changed while it was read
+        if kathara is not None and state.error is None and kathara.generation == generation:
+            state.generation = generation
+            if cacheable and not cached:
+                kathara._snapshots[key] = (generation, {p.name: state.probes[p.name] for p in cacheable})
+
+    await asyncio.gather(*(probe(service) for service in names))
+    snapshot.seconds = time.monotonic() - started
+    return snapshot
+
+
+def _kathara_environment(env: SandboxEnvironment) -> KatharaSandboxEnvironment | None:
+    try:
+        return env.as_type(KatharaSandboxEnvironment)
+    except TypeError:
+        return None
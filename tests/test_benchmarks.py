@@ -0,0 +1,62 @@
+"""Tests for the synthetic lab generator and regression check in benchmarks/."""
+
+from benchmarks.runner import BenchResult, compare, median_results, run_benchmarks
+from benchmarks.synthetic import generate_topology, write_lab
+from inspect_kathara._util import parse_lab_conf
+from inspect_kathara.compose_generator import validate_topology
+
+
+class TestSyntheticLabs:
+    """Tests for synthetic lab generation."""
+
+    def test_lab_conf_round_trips_through_parser(self, tmp_path):
+        lab_path = write_lab(tmp_path, machines=50, image_mix="mixed", fanout=5)
+        lab = parse_lab_conf(lab_path / "topology" / "lab.conf")
+
+        assert len(lab.machines) == 50
+        assert lab.metadata["LAB_NAME"] == "synthetic-50-mixed"
+        # segment heads join the next collision domain
+        assert lab.machines["m0"].networks_in_eth_order() == ["cd0", "cd1"]
+        assert lab.machines["m1"].networks_in_eth_order() == ["cd0"]
+        assert (lab_path / "topology" / "m0.startup").exists()
+
+    def test_topology_is_valid(self):
+        topology = generate_topology(machines=200, image_mix="routers", fanout=8)
+        assert validate_topology(topology) == []
+        assert len(topology["machines"]) == 200
+
+
+class TestRegressionCheck:
+    """Tests for baseline comparison."""
+
+    def _result(self, machines_per_second: float, peak_memory_kb: float) -> BenchResult:
+        seconds = 100 / machines_per_second
+        return BenchResult("parse_lab_conf", 100, "mixed", 1, seconds, machines_per_second, peak_memory_kb)
+
+    def test_flags_slowdown_and_memory_growth(self):
+        baseline = {"parse_lab_conf/mixed/100": {"machines_per_second": 1000.0, "peak_memory_kb": 100.0}}
+
+        assert compare([self._result(900, 110)], baseline, tolerance=0.3) == []
+        regressions = compare([self._result(500, 200)], baseline, tolerance=0.3)
+        assert len(regressions) == 2
+
+    def test_small_memory_peaks_get_absolute_slack(self):
+        baseline = {"parse_lab_conf/mixed/100": {"machines_per_second": 1000.0, "peak_memory_kb": 1.0}}
+        assert compare([self._result(1000, 3)], baseline, tolerance=0.3) == []
+
+    def test_median_round_is_reported(self):
+        rounds = [[self._result(rate, memory)] for rate, memory in ((1000, 100), (10, 900), (800, 120))]
+        (result,) = median_results(rounds)
+        assert (result.machines_per_second, result.peak_memory_kb, result.runs) == (800, 120, 3)
+
+    def test_unknown_cases_are_ignored(self):
+        assert compare([self._result(1, 1e9)], {}) == []
+
+    def test_small_run_covers_every_target(self):
+        results = run_benchmarks(sizes=(5,), image_mixes=("hosts",), min_seconds=0)
+        assert {result.name for result in results} == {
+            "parse_lab_conf",
+            "generate_compose_for_inspect",
+            "generate_compose_from_topology",
+            "validate_topology",
+        }
@@ -0,0 +1,107 @@
+"""Tests for inspect_kathara.bulk module."""
+
+from pathlib import Path
+from unittest import mock
+
+import pytest
+import yaml
+
+from inspect_kathara.bulk import compile_labs, compile_labs_async, discover_labs, main
+
+
+def _lab(root: Path, name: str, lab_conf: str) -> Path:
+    lab_path = root / name
+    (lab_path / "topology").mkdir(parents=True)
+    (lab_path / "topology" / "lab.conf").write_text(lab_conf)
+    return lab_path
+
+
+class TestDiscoverLabs:
+    """Tests for lab discovery."""
+
+    def test_finds_nested_labs_and_skips_hidden_dirs(self, tmp_path):
+        first = _lab(tmp_path, "a", 'pc1[0]="lan"\n')
+        second = _lab(tmp_path, "group/b", 'pc1[0]="lan"\n')
+        _lab(tmp_path, ".cache/c", 'pc1[0]="lan"\n')
+        (tmp_path / "d").mkdir()
+        (tmp_path / "d" / "lab.conf").write_text('pc1[0]="lan"\n')
+
+        assert discover_labs(tmp_path) == [first, second]
+
+
+class TestCompileLabs:
+    """Tests for bulk compilation."""
+
+    def test_resolves_each_image_once_and_reports_failures(self, tmp_path):
+        good = _lab(tmp_path, "good", 'r1[0]="lan"\nr1[image]="kathara/frr"\npc1[0]="lan"\n')
+        other = _lab(tmp_path, "other", 'r1[0]="lan"\nr1[image]="kathara/frr"\n')
+        empty = _lab(tmp_path, "empty", "# no machines\n")
+        broken = _lab(tmp_path, "broken", 'r1[0]="lan"\nr1[image]="kathara/missing"\n')
+
+        async def ensure(images):
+            if "kathara/missing" in images:
+                raise RuntimeError("pull failed")
+            return images
+
+        with (
+            mock.patch("inspect_kathara.bulk.ensure_kathara_images", side_effect=ensure) as ensure_images,
+            mock.patch("inspect_kathara._util.subprocess.run") as run,
+        ):
+            results = compile_labs([good, other, empty, broken], workers=1)
+
+        resolved = sorted(call.args[0][0] for call in ensure_images.call_args_list)
+        assert resolved == ["kathara/base", "kathara/frr", "kathara/missing"]
+        run.assert_not_called()
+        assert [result.ok for result in results] == [True, True, False, False]
+        assert "No machines" in results[2].error
+        assert "kathara/missing" in results[3].error
+        compose = yaml.safe_load((good / "compose.yaml").read_text())
+        assert set(compose["services"]) == {"default", "r1", "pc1"}
+
+    def test_process_pool_matches_serial_output(self, tmp_path):
+        lab_conf = 'pc1[0]="lan"\nr1[0]="lan"\nr1[image]="kathara/frr"\n'
+        labs = [_lab(tmp_path, f"lab{i}", lab_conf) for i in range(3)]
+        with mock.patch("inspect_kathara.bulk.ensure_kathara_images", mock.AsyncMock()):
+            results = compile_labs(labs, workers=2)
+            pooled = [(lab / "compose.yaml").read_text() for lab in labs]
+            compile_labs(labs, workers=1, incremental=False)
+
+        assert all(result.ok for result in results)
+        assert pooled == [(lab / "compose.yaml").read_text() for lab in labs]
+        # written atomically: no temporary files are left behind
+        files = sorted(path.name for path in labs[0].iterdir())
+        # the image manifest is only written by offline compiles
+        assert files == [".compose.yaml.kathara.json", ".kathara", "compose.yaml", "topology"]
+
+    def test_offline_compile_then_resolve_manifests(self, tmp_path):
+        _lab(tmp_path, "a", 'r1[0]="lan"\nr1[image]="kathara/frr"\n')
+        _lab(tmp_path, "b", 'pc1[0]="lan"\n')
+        ensure = mock.AsyncMock()
+        with mock.patch("inspect_kathara.bulk.ensure_kathara_images", ensure):
+            assert main([str(tmp_path), "--workers", "1", "--offline"]) == 0
+            ensure.assert_not_called()
+
+            assert main([str(tmp_path), "--resolve-only"]) == 0
+
+        assert sorted(call.args[0][0] for call in ensure.call_args_list) == ["kathara/base", "kathara/frr"]
+
+    async def test_async_variant_runs_inside_an_event_loop(self, tmp_path):
+        lab = _lab(tmp_path, "a", 'r1[0]="lan"\nr1[image]="kathara/frr"\n')
+        ensure = mock.AsyncMock()
+        with mock.patch("inspect_kathara.bulk.ensure_kathara_images", ensure):
+            with pytest.raises(RuntimeError, match="compile_labs_async"):
+                compile_labs([lab], workers=1)
+            results = await compile_labs_async([lab], workers=1)
+
+        assert [result.ok for result in results] == [True]
+        assert sorted(call.args[0][0] for call in ensure.call_args_list) == ["kathara/base", "kathara/frr"]
+
+    def test_command_exit_status(self, tmp_path, capsys):
+        _lab(tmp_path, "good", 'pc1[0]="lan"\n')
+        _lab(tmp_path, "bad", 'pc1[0]="lan"\npc1[image]="nginx"\n')
+        with mock.patch("inspect_kathara.bulk.ensure_kathara_images", mock.AsyncMock()):
+            assert main([str(tmp_path), "--workers", "1"]) == 1
+
+        captured = capsys.readouterr()
+        assert "Compiled 1/2 labs (1 failed)" in captured.out
+        assert "Only kathara/* images allowed" in captured.err
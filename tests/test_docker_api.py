@@ -0,0 +1,176 @@
+"""Tests for the pooled Docker Engine API client."""
+
+import asyncio
+import hashlib
+import json
+import tempfile
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from inspect_kathara._docker_api import DockerAPIClient, DockerAPIError, docker_socket_path
+from inspect_kathara._util import _ImageInventory, ensure_kathara_images
+from inspect_kathara.sandbox import _prune_stale_networks_api
+
+
+class FakeDaemon:
+    """Unix-socket HTTP server answering requests from a ``(method, path) -> response`` table."""
+
+    def __init__(self, routes: dict[tuple[str, str], tuple[int, object]], chunked: bool = False):
+        self.routes = routes
+        self.chunked = chunked
+        self.requests: list[tuple[str, str]] = []
+        self.connections = 0
+        self._dir = tempfile.TemporaryDirectory()
+        self.socket_path = str(Path(self._dir.name) / "docker.sock")
+        self._server: asyncio.AbstractServer | None = None
+
+    async def __aenter__(self) -> "FakeDaemon":
+        self._server = await asyncio.start_unix_server(self._handle, path=self.socket_path)
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        assert self._server is not None
+        self._server.close()
+        await self._server.wait_closed()
+        self._dir.cleanup()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, target, _ = request_line.decode().split(" ", 2)
+                length = 0
+                while (line := await reader.readline()) not in (b"\r\n", b""):
+                    key, _, value = line.decode().partition(":")
+                    if key.lower() == "content-length":
+                        length = int(value)
+                await reader.readexactly(length)
+                path = target.split("?")[0]
+                self.requests.append((method, target))
+                status, payload = self.routes.get((method, path), (404, {"message": "no such route"}))
+                body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+                writer.write(self._response(status, body))
+                await writer.drain()
+        finally:
+            writer.close()
+
+    def _response(self, status: int, body: bytes) -> bytes:
+        if status == 204:
+            return b"HTTP/1.1 204 No Content\r\n\r\n"
+        head = f"HTTP/1.1 {status} X\r\nContent-Type: application/json\r\n"
+        if self.chunked:
+            half = len(body) // 2
+            chunks = b"".join(f"{len(c):x}\r\n".encode() + c + b"\r\n" for c in (body[:half], body[half:]) if c)
+            return (head + "Transfer-Encoding: chunked\r\n\r\n").encode() + chunks + b"0\r\n\r\n"
+        return (head + f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+
+
+class TestDockerAPIClient:
+    """Tests for request framing and connection reuse."""
+
+    @pytest.mark.parametrize("chunked", [False, True])
+    async def test_requests_reuse_one_connection(self, chunked):
+        images = [{"RepoTags": ["kathara/frr:latest"]}, {"RepoTags": ["localhost:5000/kathara/base:1"]}]
+        async with FakeDaemon({("GET", "/images/json"): (200, images)}, chunked=chunked) as daemon:
+            client = DockerAPIClient(daemon.socket_path)
+            for _ in range(3):
+                repositories = await client.image_repositories()
+            await client.close()
+
+        assert repositories == {"kathara/frr", "localhost:5000/kathara/base"}
+        assert daemon.connections == 1
+        assert client.connections_opened == 1
+
+    async def test_error_status_raises(self):
+        async with FakeDaemon({}) as daemon:
+            client = DockerAPIClient(daemon.socket_path)
+            with pytest.raises(DockerAPIError) as excinfo:
+                await client.get_json("/networks/missing")
+            await client.close()
+
+        assert excinfo.value.status == 404
+        assert "no such route" in str(excinfo.value)
+
+    async def test_pull_reports_in_band_errors(self):
+        stream = b'{"status":"Pulling"}\r\n{"error":"manifest unknown"}\r\n'
+        async with FakeDaemon({("POST", "/images/create"): (200, stream)}) as daemon:
+            client = DockerAPIClient(daemon.socket_path)
+            with pytest.raises(DockerAPIError, match="manifest unknown"):
+                await client.pull("kathara/nika-frr")
+            await client.close()
+
+        assert daemon.requests == [("POST", "/images/create?fromImage=kathara%2Fnika-frr&tag=latest")]
+
+    async def test_missing_socket_raises_oserror(self):
+        client = DockerAPIClient("/nonexistent/docker.sock")
+        with pytest.raises(OSError):
+            await client.image_repositories()
+
+    def test_socket_path_from_docker_host(self):
+        with mock.patch.dict("os.environ", {"DOCKER_HOST": "unix:///run/user/1000/docker.sock"}):
+            assert docker_socket_path() == "/run/user/1000/docker.sock"
+        with mock.patch.dict("os.environ", {"DOCKER_HOST": "tcp://10.0.0.1:2375"}):
+            assert docker_socket_path() is None
+
+    def test_socket_path_follows_active_context(self, tmp_path, monkeypatch):
+        for name, host in (("rootless", "unix:///run/user/1000/docker.sock"), ("remote", "ssh://build-host")):
+            meta = tmp_path / "contexts" / "meta" / hashlib.sha256(name.encode()).hexdigest()
+            meta.mkdir(parents=True)
+            (meta / "meta.json").write_text(json.dumps({"Name": name, "Endpoints": {"docker": {"Host": host}}}))
+        (tmp_path / "config.json").write_text(json.dumps({"currentContext": "rootless"}))
+        monkeypatch.setenv("DOCKER_CONFIG", str(tmp_path))
+        monkeypatch.delenv("DOCKER_HOST", raising=False)
+        monkeypatch.delenv("DOCKER_CONTEXT", raising=False)
+
+        assert docker_socket_path() == "/run/user/1000/docker.sock"
+        for context, expected in (("remote", None), ("missing", None), ("default", "/var/run/docker.sock")):
+            monkeypatch.setenv("DOCKER_CONTEXT", context)
+            assert docker_socket_path() == expected
+        monkeypatch.setenv("DOCKER_HOST", "unix:///tmp/d.sock")
+        assert docker_socket_path() == "/tmp/d.sock"
+
+
+class TestDockerAPIConsumers:
+    """Tests for image resolution and network pruning through the API."""
+
+    async def test_ensure_images_lists_and_pulls_without_cli(self):
+        routes = {
+            ("GET", "/images/json"): (200, [{"RepoTags": ["kathara/base:latest"]}]),
+            ("POST", "/images/create"): (200, b'{"status":"Downloaded"}\r\n'),
+        }
+        inventory = _ImageInventory(ttl=60)
+        async with FakeDaemon(routes) as daemon:
+            client = DockerAPIClient(daemon.socket_path)
+            with (
+                mock.patch("inspect_kathara._util._image_inventory", inventory),
+                mock.patch("inspect_kathara._util.get_docker_client", return_value=client),
+                mock.patch("subprocess.run") as run,
+            ):
+                await ensure_kathara_images(["kathara/base", "kathara/frr"])
+            await client.close()
+
+        run.assert_not_called()
+        assert inventory.is_available("kathara/frr")
+        assert [method for method, _ in daemon.requests] == ["GET", "POST"]
+
+    async def test_prune_removes_only_empty_unowned_networks(self):
+        names = ["inspect-old-iaaaaa1_lan", "inspect-old-iaaaaa1_wan", "inspect-live_lan"]
+        networks = [{"Name": name} for name in names]
+        routes = {
+            ("GET", "/networks"): (200, networks),
+            ("GET", "/networks/inspect-old-iaaaaa1_lan"): (200, {"Containers": {}}),
+            ("GET", "/networks/inspect-old-iaaaaa1_wan"): (200, {"Containers": {"abc": {}}}),
+            ("DELETE", "/networks/inspect-old-iaaaaa1_lan"): (204, b""),
+        }
+        async with FakeDaemon(routes) as daemon:
+            client = DockerAPIClient(daemon.socket_path)
+            removed = await _prune_stale_networks_api(client, exclude_projects={"inspect-live"})
+            await client.close()
+
+        assert removed == ["inspect-old-iaaaaa1_lan"]
+        assert ("GET", "/networks/inspect-live_lan") not in daemon.requests
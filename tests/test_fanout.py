@@ -0,0 +1,88 @@
+"""Tests for inspect_kathara.fanout module."""
+
+import asyncio
+from unittest import mock
+
+from inspect_ai.util import ExecResult
+
+from inspect_kathara.fanout import exec_many
+
+
+class _FakeSandbox:
+    """Sandbox whose exec sleeps, tracking how many calls overlap."""
+
+    running = 0
+    peak = 0
+
+    def __init__(self, delay: float = 0.0, result: ExecResult | None = None, error: Exception | None = None):
+        self.delay = delay
+        self.result = result or ExecResult(success=True, returncode=0, stdout="ok", stderr="")
+        self.error = error
+        self.calls: list[tuple[list[str], int | None]] = []
+
+    async def exec(self, cmd, user=None, timeout=None):
+        self.calls.append((cmd, timeout))
+        _FakeSandbox.running += 1
+        _FakeSandbox.peak = max(_FakeSandbox.peak, _FakeSandbox.running)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            _FakeSandbox.running -= 1
+        if self.error:
+            raise self.error
+        return self.result
+
+
+class TestExecMany:
+    """Tests for concurrent exec across services."""
+
+    def setup_method(self):
+        _FakeSandbox.running = _FakeSandbox.peak = 0
+
+    async def test_runs_concurrently_within_limit(self):
+        environments = {f"pc{i}": _FakeSandbox(delay=0.05) for i in range(6)}
+        outcomes = await exec_many({name: "true" for name in environments}, max_in_flight=3, environments=environments)
+
+        assert list(outcomes) == list(environments)
+        assert all(outcome.ok and outcome.output == "ok" for outcome in outcomes.values())
+        assert all(outcome.seconds >= 0.04 for outcome in outcomes.values())
+        assert _FakeSandbox.peak == 3
+        assert environments["pc0"].calls == [(["sh", "-c", "true"], None)]
+
+    async def test_failures_are_reported_per_service(self):
+        failed = ExecResult(success=False, returncode=1, stdout="", stderr="unreachable")
+        environments = {
+            "pc1": _FakeSandbox(result=failed),
+            "pc2": _FakeSandbox(error=TimeoutError()),
+            "r1": _FakeSandbox(error=RuntimeError("container gone")),
+        }
+        outcomes = await exec_many(
+            {"pc1": ["ping", "r1"], "pc2": "sleep 60", "r1": "true"}, timeout=5, environments=environments
+        )
+
+        assert not outcomes["pc1"].ok and outcomes["pc1"].output == "unreachable"
+        assert outcomes["pc2"].timed_out and outcomes["pc2"].error == "timed out after 5s"
+        assert outcomes["r1"].error == "RuntimeError: container gone"
+        assert environments["pc1"].calls == [(["ping", "r1"], 5)]
+
+    async def test_deadline_cancels_slow_and_queued_commands(self):
+        environments = {"fast": _FakeSandbox(), "slow": _FakeSandbox(delay=5), "queued": _FakeSandbox()}
+        outcomes = await exec_many(
+            {"slow": "sleep 5", "fast": "true", "queued": "true"},
+            max_in_flight=1,
+            deadline=0.1,
+            environments=environments,
+        )
+
+        assert outcomes["slow"].timed_out and outcomes["queued"].timed_out
+        assert environments["queued"].calls == []
+        # the per-exec timeout is capped by the time left until the deadline
+        assert environments["slow"].calls[0][1] == 1
+
+    async def test_defaults_to_sample_sandboxes(self):
+        env = _FakeSandbox()
+        with mock.patch("inspect_kathara.fanout.sandbox", return_value=env) as sandbox:
+            outcomes = await exec_many({"r1": "true"})
+
+        sandbox.assert_called_once_with("r1")
+        assert outcomes["r1"].ok
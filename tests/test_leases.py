@@ -0,0 +1,197 @@
+"""Tests for inspect_kathara._leases module."""
+
+import ipaddress
+import json
+
+import pytest
+import yaml
+
+from inspect_kathara._leases import (
+    SubnetLeaseManager,
+    block_prefix,
+    network_prefixes,
+    pack_subnets,
+    subnet_pool,
+    subnet_prefix,
+    write_leased_compose,
+)
+
+COMPOSE = {
+    "services": {
+        "r1": {"image": "x", "networks": {"lan": {"ipv4_address": "10.128.0.2"}, "wan": None}},
+        "pc1": {"image": "x", "networks": ["lan"]},
+    },
+    "networks": {
+        "lan": {"driver": "bridge", "ipam": {"config": [{"subnet": "10.128.0.0/28"}]}},
+        "wan": None,
+        "outside": {"external": True},
+    },
+}
+
+
+class TestSubnetSizing:
+    """Tests for prefix sizing and packing."""
+
+    def test_subnet_prefix_fits_members(self):
+        assert subnet_prefix(1) == 28
+        assert subnet_prefix(13) == 28
+        assert subnet_prefix(14) == 27
+        assert subnet_prefix(200) == 24
+
+    def test_network_prefixes_skip_external_networks(self):
+        assert network_prefixes(COMPOSE) == {"lan": 28, "wan": 28}
+
+    def test_static_address_grows_subnet(self):
+        compose = yaml.safe_load(yaml.safe_dump(COMPOSE))
+        compose["services"]["r1"]["networks"]["lan"]["ipv4_address"] = "10.128.0.40"
+        assert network_prefixes(compose)["lan"] == 26
+
+    def test_pack_keeps_subnets_aligned(self):
+        block = ipaddress.IPv4Network("10.0.0.0/24")
+        subnets = pack_subnets(block, {"a": 28, "b": 26, "c": 28})
+        assert subnets == {"b": "10.0.0.0/26", "a": "10.0.0.64/28", "c": "10.0.0.80/28"}
+        assert block_prefix({"a": 28, "b": 26, "c": 28}) == 25
+
+    def test_pool_can_be_disabled(self, monkeypatch):
+        monkeypatch.setenv("INSPECT_KATHARA_SUBNET_POOL", "off")
+        assert subnet_pool() is None
+        monkeypatch.setenv("INSPECT_KATHARA_SUBNET_POOL", "172.30.0.0/16")
+        assert subnet_pool() == ipaddress.IPv4Network("172.30.0.0/16")
+
+
+class TestSubnetLeaseManager:
+    """Tests for lease allocation across stacks and processes."""
+
+    def _manager(self, tmp_path, pool="10.200.0.0/24"):
+        return SubnetLeaseManager(ipaddress.IPv4Network(pool), tmp_path)
+
+    def test_concurrent_leases_do_not_overlap(self, tmp_path):
+        manager = self._manager(tmp_path)
+        first = manager.acquire({"lan": 28, "wan": 28})
+        second = manager.acquire({"lan": 28, "wan": 28})
+
+        subnets = [ipaddress.IPv4Network(s) for s in [*first.subnets.values(), *second.subnets.values()]]
+        assert not any(a.overlaps(b) for i, a in enumerate(subnets) for b in subnets[i + 1 :])
+
+    def test_released_block_is_reused(self, tmp_path):
+        manager = self._manager(tmp_path)
+        first = manager.acquire({"lan": 28})
+        manager.release(first)
+        assert manager.acquire({"lan": 28}).block == first.block
+
+    def test_leases_of_dead_processes_are_reclaimed(self, tmp_path):
+        manager = self._manager(tmp_path, pool="10.200.0.0/28")
+        stale = manager.acquire({"lan": 28})
+        lease_file = tmp_path / f"{stale.id}.json"
+        lease_file.write_text(json.dumps({**json.loads(lease_file.read_text()), "pid": 2**22 + 1}))
+
+        assert manager.acquire({"lan": 28}).block == stale.block
+        assert not lease_file.exists()
+
+    def test_exhausted_pool_raises(self, tmp_path):
+        manager = self._manager(tmp_path, pool="10.200.0.0/28")
+        manager.acquire({"lan": 28})
+        with pytest.raises(RuntimeError, match="No free"):
+            manager.acquire({"lan": 28})
+        with pytest.raises(RuntimeError, match="larger than subnet pool"):
+            manager.acquire({"lan": 27})
+
+
+class TestWriteLeasedCompose:
+    """Tests for rewriting compose files onto leased subnets."""
+
+    def test_rewrites_subnets_and_static_addresses(self, tmp_path):
+        config = tmp_path / "compose.yaml"
+        lease = self._lease(tmp_path)
+
+        path = write_leased_compose(config, COMPOSE, lease, tmp_path / "leases")
+        leased = yaml.safe_load(path.read_text())
+
+        assert path.parent == tmp_path / "leases" and path.name == f"{lease.id}.compose.yaml"
+        assert leased["networks"]["lan"]["ipam"]["config"] == [{"subnet": lease.subnets["lan"]}]
+        assert leased["networks"]["wan"]["ipam"]["config"] == [{"subnet": lease.subnets["wan"]}]
+        assert leased["networks"]["outside"] == {"external": True}
+        lan = ipaddress.IPv4Network(lease.subnets["lan"])
+        assert leased["services"]["r1"]["networks"]["lan"]["ipv4_address"] == str(lan.network_address + 2)
+        # the original compose is left untouched
+        assert COMPOSE["networks"]["lan"]["ipam"]["config"] == [{"subnet": "10.128.0.0/28"}]
+
+    def test_ipv6_entries_are_kept_and_ipv4_entry_moved(self, tmp_path):
+        compose = {
+            "services": {"r1": {"image": "x", "networks": ["dual", "v6only", "v6first"]}},
+            "networks": {
+                "dual": {
+                    "enable_ipv6": True,
+                    "ipam": {
+                        "config": [
+                            {"subnet": "fd00:1::/64"},
+                            {
+                                "subnet": "10.128.0.0/24",
+                                "gateway": "10.128.0.1",
+                                "ip_range": "10.128.0.16/28",
+                                "aux_addresses": {"printer": "10.128.0.40"},
+                            },
+                        ]
+                    },
+                },
+                "v6only": {"enable_ipv6": True, "enable_ipv4": False, "ipam": {"config": [{"subnet": "fd00:2::/64"}]}},
+                "v6first": {"enable_ipv6": True, "ipam": {"config": [{"subnet": "fd00:3::/64"}]}},
+            },
+        }
+        prefixes = network_prefixes(compose)
+        # IPv4-disabled networks are not leased; the dual-stack one grows to fit its aux address
+        assert set(prefixes) == {"dual", "v6first"} and prefixes["dual"] == 26
+
+        manager = SubnetLeaseManager(ipaddress.IPv4Network("10.200.0.0/24"), tmp_path / "leases")
+        lease = manager.acquire(prefixes)
+        path = write_leased_compose(tmp_path / "compose.yaml", compose, lease, tmp_path / "leases")
+        networks = yaml.safe_load(path.read_text())["networks"]
+
+        dual = ipaddress.IPv4Network(lease.subnets["dual"])
+        assert networks["dual"]["ipam"]["config"] == [
+            {"subnet": "fd00:1::/64"},
+            {
+                "subnet": str(dual),
+                "gateway": str(dual.network_address + 1),
+                "ip_range": f"{dual.network_address + 16}/28",
+                "aux_addresses": {"printer": str(dual.network_address + 40)},
+            },
+        ]
+        assert networks["v6only"] == compose["networks"]["v6only"]
+        v6first = networks["v6first"]["ipam"]["config"]
+        assert v6first == [{"subnet": lease.subnets["v6first"]}, {"subnet": "fd00:3::/64"}]
+
+    def test_relative_host_paths_point_into_the_original_directory(self, tmp_path):
+        config = tmp_path / "lab" / "compose.yaml"
+        compose = {
+            "services": {
+                "r1": {
+                    "image": "x",
+                    "volumes": ["./.kathara/startup/r1.sh:/startup.sh:ro", "/etc/hosts:/hosts", "data:/data"],
+                    "env_file": ["vars.env"],
+                },
+                "pc1": {
+                    "build": {"context": "images/pc"},
+                    "volumes": [{"type": "bind", "source": "shared", "target": "/shared"}],
+                },
+            },
+            "networks": COMPOSE["networks"],
+        }
+        path = write_leased_compose(config, compose, self._lease(tmp_path), tmp_path / "leases")
+        services = yaml.safe_load(path.read_text())["services"]
+
+        lab = tmp_path / "lab"
+        assert services["r1"]["volumes"] == [
+            f"{lab}/.kathara/startup/r1.sh:/startup.sh:ro",
+            "/etc/hosts:/hosts",
+            "data:/data",
+        ]
+        assert services["r1"]["env_file"] == [str(lab / "vars.env")]
+        assert services["pc1"]["build"]["context"] == str(lab / "images/pc")
+        assert services["pc1"]["volumes"][0]["source"] == str(lab / "shared")
+        # the original compose is left untouched
+        assert compose["services"]["r1"]["env_file"] == ["vars.env"]
+
+    def _lease(self, tmp_path):
+        manager = SubnetLeaseManager(ipaddress.IPv4Network("10.200.0.0/24"), tmp_path / "leases")
+        return manager.acquire(network_prefixes(COMPOSE))
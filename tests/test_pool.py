@@ -0,0 +1,168 @@
+"""Tests for inspect_kathara._pool module."""
+
+import asyncio
+from unittest import mock
+
+from inspect_kathara._pool import WarmPool, compose_fingerprint, warm_pool_size
+from inspect_kathara.sandbox import KatharaSandboxEnvironment
+
+
+class TestComposeFingerprint:
+    """Tests for compose_fingerprint."""
+
+    def test_same_file_same_fingerprint(self, tmp_path):
+        compose_file = tmp_path / "compose.yaml"
+        compose_file.write_text("services:\n  default:\n    image: kathara/base\n")
+
+        assert compose_fingerprint(str(compose_file), {}) == compose_fingerprint(str(compose_file), {"x": "1"})
+
+    def test_content_change_changes_fingerprint(self, tmp_path):
+        compose_file = tmp_path / "compose.yaml"
+        compose_file.write_text("services:\n  default:\n    image: kathara/base\n")
+        before = compose_fingerprint(str(compose_file), {})
+        compose_file.write_text("services:\n  default:\n    image: kathara/frr\n")
+
+        assert compose_fingerprint(str(compose_file), {}) != before
+
+    def test_metadata_interpolation_is_not_poolable(self, tmp_path):
+        compose_file = tmp_path / "compose.yaml"
+        compose_file.write_text("services:\n  default:\n    image: kathara/${SAMPLE_METADATA_IMAGE}\n")
+
+        assert compose_fingerprint(str(compose_file), {"image": "frr"}) is None
+
+    def test_missing_file_is_not_poolable(self, tmp_path):
+        assert compose_fingerprint(str(tmp_path / "missing.yaml"), {}) is None
+        assert compose_fingerprint(None, {}) is None
+
+    def test_pool_size_from_environment(self):
+        with mock.patch.dict("os.environ", {"INSPECT_KATHARA_WARM_POOL": "3"}):
+            assert warm_pool_size() == 3
+        with mock.patch.dict("os.environ", {"INSPECT_KATHARA_WARM_POOL": "many"}):
+            assert warm_pool_size() == 0
+
+
+class TestWarmPool:
+    """Tests for WarmPool."""
+
+    async def test_refill_then_checkout(self):
+        pool = WarmPool(size=2)
+        factory = mock.AsyncMock(side_effect=[{"default": "a"}, {"default": "b"}])
+
+        assert pool.checkout("lab") is None
+        pool.refill("lab", factory)
+        await asyncio.sleep(0)
+
+        assert pool.ready_count("lab") == 2
+        assert pool.checkout("lab") == {"default": "a"}
+        assert pool.ready_count("lab") == 1
+
+    async def test_refill_counts_pending_stacks(self):
+        pool = WarmPool(size=2)
+        started = asyncio.Event()
+
+        async def slow_factory():
+            await started.wait()
+            return {"default": "x"}
+
+        pool.refill("lab", slow_factory)
+        pool.refill("lab", slow_factory)
+        assert len(pool._tasks) == 2
+
+        started.set()
+        await asyncio.gather(*pool._tasks)
+        assert pool.ready_count("lab") == 2
+
+    async def test_failed_start_is_dropped(self):
+        pool = WarmPool(size=1)
+        pool.refill("lab", mock.AsyncMock(side_effect=RuntimeError("compose up failed")))
+        await asyncio.gather(*pool._tasks)
+
+        assert pool.ready_count("lab") == 0
+        pool.refill("lab", mock.AsyncMock(return_value={"default": "y"}))
+        await asyncio.gather(*pool._tasks)
+        assert pool.ready_count("lab") == 1
+
+    async def test_drain_waits_for_refills_and_returns_idle(self):
+        pool = WarmPool(size=1)
+        pool.checkin("done", {"default": "idle"})
+        started = asyncio.Event()
+
+        async def slow_factory():
+            await started.wait()
+            return {"default": "late"}
+
+        pool.refill("slow", slow_factory)
+        await asyncio.sleep(0)
+        drain = asyncio.create_task(pool.drain())
+        await asyncio.sleep(0)
+        started.set()
+
+        # the stack still being started is handed back for teardown instead of leaking
+        assert await drain == [{"default": "idle"}, {"default": "late"}]
+        assert pool.ready_count("done") == 0
+        pool.refill("slow", slow_factory)
+        assert not pool._tasks
+
+
+class TestSampleInitWithPool:
+    """Tests for warm pool checkout in KatharaSandboxEnvironment.sample_init."""
+
+    async def test_checks_out_warm_stack(self, tmp_path):
+        compose_file = tmp_path / "compose.yaml"
+        compose_file.write_text("services:\n  default:\n    image: kathara/base\n")
+        pool = WarmPool(size=1)
+        pool.checkin(compose_fingerprint(str(compose_file), {}), {"default": "warm"})
+
+        with (
+            mock.patch("inspect_kathara.sandbox._get_warm_pool", return_value=pool),
+            mock.patch.object(KatharaSandboxEnvironment, "_start_stack", return_value={"default": "cold"}) as start,
+        ):
+            environments = await KatharaSandboxEnvironment.sample_init("task", str(compose_file), {})
+            await asyncio.gather(*pool._tasks)
+
+        assert environments == {"default": "warm"}
+        # the checked-out stack is replaced in the background
+        assert start.call_count == 1
+        assert pool.ready_count(compose_fingerprint(str(compose_file), {})) == 1
+
+    async def test_starts_cold_when_pool_disabled(self, tmp_path):
+        compose_file = tmp_path / "compose.yaml"
+        compose_file.write_text("services:\n  default:\n    image: kathara/base\n")
+
+        with (
+            mock.patch("inspect_kathara.sandbox._get_warm_pool", return_value=None),
+            mock.patch.object(KatharaSandboxEnvironment, "_start_stack", return_value={"default": "cold"}) as start,
+        ):
+            environments = await KatharaSandboxEnvironment.sample_init("task", str(compose_file), {})
+
+        assert environments == {"default": "cold"}
+        start.assert_awaited_once()
+
+
+class TestTaskCleanup:
+    """Tests for task-scoped pool and stack state in KatharaSandboxEnvironment.task_cleanup."""
+
+    async def test_only_the_tasks_own_state_is_released(self):
+        pools = {("a", "lab"): WarmPool(size=1), ("b", "lab"): WarmPool(size=1)}
+        pools[("a", "lab")].checkin("key", {"default": "idle-a"})
+        live = {"stack-a": ("a", "lab"), "stack-b": ("b", "lab")}
+        baselines = {"stack-a": mock.MagicMock(), "stack-b": mock.MagicMock()}
+        leases = {"stack-a": mock.MagicMock(), "stack-b": mock.MagicMock()}
+
+        with (
+            mock.patch("inspect_kathara.sandbox._warm_pools", pools),
+            mock.patch("inspect_kathara.sandbox._live_projects", live),
+            mock.patch("inspect_kathara.sandbox._baselines", baselines),
+            mock.patch("inspect_kathara.sandbox._subnet_leases", leases),
+            mock.patch("inspect_kathara.sandbox._close_sessions", mock.AsyncMock()),
+            mock.patch("inspect_kathara.sandbox._release_subnet_lease") as release,
+            mock.patch("inspect_kathara.sandbox.DockerSandboxEnvironment.sample_cleanup") as sample_cleanup,
+            mock.patch("inspect_kathara.sandbox.DockerSandboxEnvironment.task_cleanup"),
+        ):
+            await KatharaSandboxEnvironment.task_cleanup("a", "lab", True)
+
+        assert list(pools) == [("b", "lab")]
+        assert list(live) == ["stack-b"] and list(baselines) == ["stack-b"] and list(leases) == ["stack-b"]
+
+        assert sample_cleanup.call_args.args[2] == {"default": "idle-a"}
+        release.assert_called_once()
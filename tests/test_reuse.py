@@ -0,0 +1,176 @@
+"""Tests for inspect_kathara._reuse module."""
+
+from unittest import mock
+
+from inspect_ai.util import ExecResult
+
+from inspect_kathara._reuse import (
+    ServiceBaseline,
+    StackBaseline,
+    parse_state,
+    reset_script,
+    reset_stack,
+    reuse_enabled,
+    startup_command_from_service,
+)
+
+BASELINE_STATE = """#iptables
+*filter
+:INPUT ACCEPT [0:0]
+:FORWARD ACCEPT [0:0]
+COMMIT
+#sysctl
+net.ipv4.ip_forward = 1
+#addr
+eth0 inet 10.0.1.1/24
+#route
+10.0.1.0/24 dev eth0 proto kernel scope link src 10.0.1.1
+"""
+
+
+def _env(*outputs: str) -> mock.MagicMock:
+    env = mock.MagicMock()
+    env.exec = mock.AsyncMock(
+        side_effect=[ExecResult(success=True, returncode=0, stdout=out, stderr="") for out in outputs]
+    )
+    return env
+
+
+class TestParseState:
+    """Tests for parse_state."""
+
+    def test_sections(self):
+        sections = parse_state(BASELINE_STATE)
+        assert set(sections) == {"iptables", "sysctl", "addr", "route"}
+        assert sections["sysctl"] == "net.ipv4.ip_forward = 1"
+        assert ":FORWARD ACCEPT [0:0]" in sections["iptables"]
+
+
+class TestStartupCommand:
+    """Tests for startup_command_from_service."""
+
+    def test_generated_command(self):
+        service = {
+            "command": "bash -lc '\n"
+            'for d in $(ls /sys/class/net | grep -v lo); do ip addr flush dev "$$d"; done;\n'
+            "ip addr add 10.0.1.1/24 dev eth0\n"
+            "sleep infinity\n'"
+        }
+        script = startup_command_from_service(service)
+
+        assert script is not None
+        assert 'ip addr flush dev "$d"' in script
+        assert script.endswith("ip addr add 10.0.1.1/24 dev eth0")
+
+    def test_mounted_prologue(self):
+        service = {"command": ["bash", "-l", "/kathara/prologue.sh"]}
+        assert startup_command_from_service(service) == "KATHARA_STARTUP_ONCE=1 bash -l /kathara/prologue.sh"
+
+    def test_chained_command(self):
+        service = {"command": ["sh", "-c", "ip link set eth0 up && sleep infinity"]}
+        assert startup_command_from_service(service) == "ip link set eth0 up"
+
+    def test_non_shell_command(self):
+        assert startup_command_from_service({"command": "sleep infinity"}) is None
+        assert startup_command_from_service({}) is None
+
+
+class TestResetScript:
+    """Tests for reset_script."""
+
+    def test_startup_before_iptables_restore(self):
+        baseline = ServiceBaseline(state=BASELINE_STATE, startup_command="ip addr add 10.0.1.1/24 dev eth0", vtysh=True)
+        script = reset_script(baseline)
+
+        assert script.index("ip addr add") < script.index("frr-reload") < script.index("iptables-restore")
+        assert "sysctl -q -w" in script
+
+    def test_no_frr_reload_without_vtysh(self):
+        script = reset_script(ServiceBaseline(state=BASELINE_STATE))
+        assert "vtysh" not in script
+
+
+class TestResetStack:
+    """Tests for reset_stack."""
+
+    async def test_verified_reset(self):
+        env = _env("", BASELINE_STATE)
+        baseline = StackBaseline(key="k", services={"router": ServiceBaseline(state=BASELINE_STATE)})
+
+        assert await reset_stack({"router": env}, baseline) is True
+        assert env.exec.await_count == 2
+
+    async def test_state_mismatch_fails_verification(self):
+        drifted = BASELINE_STATE.replace("ip_forward = 1", "ip_forward = 0")
+        baseline = StackBaseline(key="k", services={"router": ServiceBaseline(state=BASELINE_STATE)})
+
+        assert await reset_stack({"router": _env("", drifted)}, baseline) is False
+
+    async def test_exec_error_fails_verification(self):
+        env = mock.MagicMock()
+        env.exec = mock.AsyncMock(side_effect=RuntimeError("container gone"))
+        baseline = StackBaseline(key="k", services={"router": ServiceBaseline(state=BASELINE_STATE)})
+
+        assert await reset_stack({"router": env}, baseline) is False
+
+    async def test_unknown_service_fails_verification(self):
+        baseline = StackBaseline(key="k", services={})
+        assert await reset_stack({"pc1": _env()}, baseline) is False
+
+    def test_reuse_flag(self):
+        with mock.patch.dict("os.environ", {"INSPECT_KATHARA_REUSE": "1"}):
+            assert reuse_enabled() is True
+        with mock.patch.dict("os.environ", {"INSPECT_KATHARA_REUSE": ""}):
+            assert reuse_enabled() is False
+
+
+class TestSampleCleanupReuse:
+    """Tests for stack reuse in KatharaSandboxEnvironment.sample_cleanup."""
+
+    async def test_verified_stack_returns_to_pool(self):
+        from inspect_kathara._pool import WarmPool
+        from inspect_kathara.sandbox import KatharaSandboxEnvironment
+
+        pool = WarmPool(size=0)
+        project = mock.MagicMock()
+        project.name = "inspect-task-iabc123"
+        baseline = StackBaseline(key="lab", services={})
+        environments = {"default": mock.MagicMock()}
+
+        with (
+            mock.patch.dict("os.environ", {"INSPECT_KATHARA_REUSE": "1"}),
+            mock.patch.dict("inspect_kathara.sandbox._baselines", {project.name: baseline}),
+            mock.patch("inspect_kathara.sandbox._get_warm_pool", return_value=pool),
+            mock.patch("inspect_kathara.sandbox._stack_project", return_value=project),
+            mock.patch("inspect_kathara.sandbox.reset_stack", return_value=True),
+            mock.patch("inspect_ai.util._sandbox.docker.docker.project_cleanup") as cleanup,
+        ):
+            await KatharaSandboxEnvironment.sample_cleanup("task", None, environments, interrupted=False)
+
+        cleanup.assert_not_called()
+        assert pool.checkout("lab") is environments
+
+    async def test_failed_verification_tears_down(self):
+        from inspect_kathara._pool import WarmPool
+        from inspect_kathara.sandbox import KatharaSandboxEnvironment
+
+        pool = WarmPool(size=0)
+        project = mock.MagicMock()
+        project.name = "inspect-task-iabc123"
+        baselines = {project.name: StackBaseline(key="lab", services={})}
+
+        with (
+            mock.patch.dict("os.environ", {"INSPECT_KATHARA_REUSE": "1"}),
+            mock.patch("inspect_kathara.sandbox._baselines", baselines),
+            mock.patch("inspect_kathara.sandbox._get_warm_pool", return_value=pool),
+            mock.patch("inspect_kathara.sandbox._stack_project", return_value=project),
+            mock.patch("inspect_kathara.sandbox.reset_stack", return_value=False),
+            mock.patch(
+                "inspect_ai.util._sandbox.docker.docker.DockerSandboxEnvironment.sample_cleanup"
+            ) as docker_cleanup,
+        ):
+            await KatharaSandboxEnvironment.sample_cleanup("task", None, {"default": mock.MagicMock()}, False)
+            assert project.name not in baselines
+
+        docker_cleanup.assert_awaited_once()
+        assert pool.checkout("lab") is None
@@ -1,5 +1,9 @@
 """Tests for inspect_kathara.sandbox module."""
 
+import asyncio
+import json
+import os
+import re
 import subprocess
 import tempfile
 from pathlib import Path
@@ -7,13 +11,36 @@ from unittest import mock
 
 import pytest
 import yaml
+from inspect_ai.util import ExecResult
+from inspect_ai.util._sandbox.docker.docker import DockerSandboxEnvironment
 
-from inspect_kathara._util import validate_kathara_image
+from benchmarks.synthetic import write_lab
+from inspect_kathara._session import ShellSession
+from inspect_kathara._telemetry import PhaseTimer
+from inspect_kathara._util import get_memory_profile, validate_kathara_image
 from inspect_kathara.sandbox import (
+    DEFAULT_STACK_MEMORY_MB,
+    MAX_AUTO_CONCURRENCY,
+    STACK_OVERHEAD_MB,
     KatharaSandboxEnvironment,
     _calculate_safe_concurrency,
+    _load_compose,
+    _maybe_prune_stale_networks,
+    _parse_docker_time,
+    _prune_stale_networks,
+    _readiness_bounds,
+    _stage_durations,
+    _startup_budget,
+    _startup_cost,
+    _startup_stages,
+    _StartupAdmission,
+    _wait_for_services_ready,
+    ensure_image_manifests,
+    estimate_stack_memory,
     generate_compose_for_inspect,
     get_machine_service_mapping,
+    register_topology,
+    write_compose_for_lab,
 )
 
 
@@ -21,9 +48,9 @@ class TestKatharaSandboxEnvironment:
     """Tests for KatharaSandboxEnvironment."""
 
     def test_default_concurrency_returns_valid_value(self):
-        """Verify concurrency returns 1 or 2 based on system resources."""
+        """Verify concurrency is within the auto-scaling bounds."""
         result = KatharaSandboxEnvironment.default_concurrency()
-        assert result in (1, 2), f"Expected 1 or 2, got {result}"
+        assert 1 <= result <= MAX_AUTO_CONCURRENCY, f"Expected 1..{MAX_AUTO_CONCURRENCY}, got {result}"
 
     def test_inherits_from_docker_sandbox(self):
         """Verify KatharaSandboxEnvironment inherits from DockerSandboxEnvironment."""
@@ -32,74 +59,531 @@ class TestKatharaSandboxEnvironment:
         assert issubclass(KatharaSandboxEnvironment, DockerSandboxEnvironment)
 
 
-class TestConcurrencyCalculation:
-    """Tests for memory-based concurrency calculation."""
-
-    def test_returns_2_with_abundant_memory(self):
-        """Returns 2 when system has ≥16GB total and ≥8GB available."""
-        mock_mem = mock.MagicMock()
-        mock_mem.total = 32 * (1024**3)  # 32GB total
-        mock_mem.available = 16 * (1024**3)  # 16GB available
+def _mock_memory(available_gb: float, total_gb: float = 128) -> mock.MagicMock:
+    mock_mem = mock.MagicMock()
+    mock_mem.total = total_gb * (1024**3)
+    mock_mem.available = available_gb * (1024**3)
+    return mock_mem
 
-        with mock.patch("psutil.virtual_memory", return_value=mock_mem):
-            assert _calculate_safe_concurrency() == 2
 
-    def test_returns_1_with_low_total_memory(self):
-        """Returns 1 when total memory is below 16GB."""
-        mock_mem = mock.MagicMock()
-        mock_mem.total = 8 * (1024**3)  # 8GB total (below threshold)
-        mock_mem.available = 6 * (1024**3)  # 6GB available
+class TestConcurrencyCalculation:
+    """Tests for memory-based concurrency calculation."""
 
-        with mock.patch("psutil.virtual_memory", return_value=mock_mem):
-            assert _calculate_safe_concurrency() == 1
+    def test_default_stack_size_without_registered_topology(self):
+        """Uses DEFAULT_STACK_MEMORY_MB when no topology is registered."""
+        with (
+            mock.patch.dict("inspect_kathara.sandbox._stack_memory_profiles", clear=True),
+            mock.patch("psutil.virtual_memory", return_value=_mock_memory(available_gb=16)),
+        ):
+            # (16GB - 4GB reserved) / 4GB per stack
+            assert _calculate_safe_concurrency() == 3
+
+    def test_small_stacks_scale_with_memory(self):
+        """Small stacks on a large host run many in parallel, capped at MAX_AUTO_CONCURRENCY."""
+        with mock.patch("psutil.virtual_memory", return_value=_mock_memory(available_gb=100)):
+            assert _calculate_safe_concurrency(stack_memory_mb=1024) == MAX_AUTO_CONCURRENCY
+            assert _calculate_safe_concurrency(stack_memory_mb=12 * 1024) == 8
+
+    def test_largest_registered_topology_sizes_limit(self):
+        with (
+            mock.patch.dict("inspect_kathara.sandbox._stack_memory_profiles", {"a": 1024, "b": 8192}, clear=True),
+            mock.patch("psutil.virtual_memory", return_value=_mock_memory(available_gb=36)),
+        ):
+            assert _calculate_safe_concurrency() == 4
 
     def test_returns_1_with_low_available_memory(self):
-        """Returns 1 when available memory is below 8GB."""
-        mock_mem = mock.MagicMock()
-        mock_mem.total = 32 * (1024**3)  # 32GB total
-        mock_mem.available = 4 * (1024**3)  # 4GB available (below threshold)
-
-        with mock.patch("psutil.virtual_memory", return_value=mock_mem):
-            assert _calculate_safe_concurrency() == 1
+        """Returns 1 when available memory does not fit a single stack."""
+        with mock.patch("psutil.virtual_memory", return_value=_mock_memory(available_gb=4)):
+            assert _calculate_safe_concurrency(stack_memory_mb=4096) == 1
 
     def test_returns_1_when_psutil_not_installed(self):
         """Returns 1 (serial) when psutil is not available."""
         with mock.patch.dict("sys.modules", {"psutil": None}):
-            # Force reimport to trigger ImportError path
-            import importlib
-
-            from inspect_kathara import sandbox
-
-            importlib.reload(sandbox)
-
-            # The function should gracefully handle missing psutil
-            # Note: Due to caching, we mock the import directly
-            with mock.patch("inspect_kathara.sandbox._calculate_safe_concurrency") as mock_calc:
-                mock_calc.return_value = 1
-                assert mock_calc() == 1
+            assert _calculate_safe_concurrency(stack_memory_mb=512) == 1
 
     def test_returns_1_on_psutil_exception(self):
         """Returns 1 when psutil raises an exception."""
         with mock.patch("psutil.virtual_memory", side_effect=RuntimeError("Memory check failed")):
             assert _calculate_safe_concurrency() == 1
 
-    def test_boundary_exactly_at_thresholds(self):
-        """Returns 2 when exactly at memory thresholds."""
-        mock_mem = mock.MagicMock()
-        mock_mem.total = 16 * (1024**3)  # Exactly 16GB
-        mock_mem.available = 8 * (1024**3)  # Exactly 8GB
 
-        with mock.patch("psutil.virtual_memory", return_value=mock_mem):
-            assert _calculate_safe_concurrency() == 2
+class TestEstimateStackMemory:
+    """Tests for topology memory estimation."""
+
+    def test_estimate_from_lab_conf(self, tmp_path):
+        (tmp_path / "topology").mkdir()
+        lab_conf = 'pc1[0]="lan1"\nrouter[0]="lan1"\nrouter[image]="kathara/frr"\n'
+        (tmp_path / "topology" / "lab.conf").write_text(lab_conf)
+
+        # default + pc1 (kathara/base) + router (kathara/frr)
+        expected = STACK_OVERHEAD_MB + 2 * get_memory_profile("kathara/base") + get_memory_profile("kathara/frr")
+        assert estimate_stack_memory(tmp_path) == expected
+
+    def test_estimate_from_compose_honours_mem_limit(self, tmp_path):
+        compose = {
+            "services": {
+                "default": {"image": "kathara/base"},
+                "router": {"image": "kathara/frr", "mem_limit": "1g"},
+            }
+        }
+        compose_file = tmp_path / "compose.yaml"
+        compose_file.write_text(yaml.safe_dump(compose))
+
+        assert estimate_stack_memory(compose_file) == STACK_OVERHEAD_MB + get_memory_profile("kathara/base") + 1024
+
+    def test_unreadable_topology_uses_default(self, tmp_path):
+        assert estimate_stack_memory(tmp_path / "missing.yaml") == DEFAULT_STACK_MEMORY_MB
+
+    def test_register_topology_records_estimate(self, tmp_path):
+        compose_file = tmp_path / "compose.yaml"
+        compose_file.write_text(yaml.safe_dump({"services": {"default": {"image": "kathara/base"}}}))
+
+        with mock.patch.dict("inspect_kathara.sandbox._stack_memory_profiles", clear=True) as profiles:
+            memory_mb = register_topology(compose_file)
+            assert profiles == {str(compose_file.resolve()): memory_mb}
+
+
+class TestStartupAdmission:
+    """Tests for weighted startup admission."""
+
+    def test_cost_sums_startup_delays(self):
+        compose = {
+            "services": {
+                "default": {"image": "kathara/base"},
+                "pc1": {"image": "kathara/base"},
+                "router": {"image": "kathara/frr"},
+            }
+        }
+        assert _startup_cost(compose) == 1 + 1 + 5
+
+    def test_cost_unknown_without_services(self):
+        assert _startup_cost(None) is None
+        assert _startup_cost({"services": {}}) is None
+
+    def test_budget_from_environment(self):
+        with mock.patch.dict("os.environ", {"INSPECT_KATHARA_STARTUP_BUDGET": "12"}):
+            assert _startup_budget() == 12
+        with mock.patch.dict("os.environ", {"INSPECT_KATHARA_STARTUP_BUDGET": "lots"}):
+            assert _startup_budget() == 40
+
+    async def test_small_stacks_start_concurrently(self):
+        admission = _StartupAdmission(budget=10)
+        async with admission.admit(4), admission.admit(4):
+            assert admission.available == 2
+        assert admission.available == 10
+
+    async def test_oversized_request_is_clamped_and_exclusive(self):
+        admission = _StartupAdmission(budget=10)
+        order: list[str] = []
+
+        async def start(name: str, tokens: int, hold: float) -> None:
+            async with admission.admit(tokens):
+                order.append(f"{name}+")
+                await asyncio.sleep(hold)
+                order.append(f"{name}-")
+
+        await asyncio.gather(start("large", 500, 0.02), start("small", 1, 0))
+        assert order == ["large+", "large-", "small+", "small-"]
+
+    async def test_fifo_prevents_starvation(self):
+        admission = _StartupAdmission(budget=4)
+        order: list[str] = []
+
+        async def start(name: str, tokens: int) -> None:
+            async with admission.admit(tokens):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        first = asyncio.create_task(start("small-1", 2))
+        await asyncio.sleep(0)
+        await asyncio.gather(first, start("large", 4), start("small-2", 2))
+        assert order.index("large") < order.index("small-2")
+
+    async def test_cancelled_waiter_releases_queue(self):
+        admission = _StartupAdmission(budget=2)
+        async with admission.admit(2):
+            waiter = asyncio.create_task(admission.admit(1).__aenter__())
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+        async with admission.admit(2) as tokens:
+            assert tokens == 2
+
+
+def _completed(stdout: str = "") -> subprocess.CompletedProcess:
+    return subprocess.CompletedProcess(args=[], returncode=0, stdout=stdout, stderr="")
+
+
+class TestPruneStaleNetworks:
+    """Tests for batched stale network pruning."""
+
+    def test_batched_inspect_and_remove(self):
+        listing = "inspect-old-iaaaaaa_lan1\ninspect-old-iaaaaaa_lan2\ninspect-busy-ibbbbbb_lan1\n"
+        inspected = "inspect-old-iaaaaaa_lan1 0\ninspect-old-iaaaaaa_lan2 0\ninspect-busy-ibbbbbb_lan1 3\n"
+        with mock.patch(
+            "subprocess.run", side_effect=[_completed(listing), _completed(inspected), _completed()]
+        ) as run:
+            removed = _prune_stale_networks()
+
+        assert removed == ["inspect-old-iaaaaaa_lan1", "inspect-old-iaaaaaa_lan2"]
+        assert run.call_count == 3
+        assert run.call_args_list[1].args[0][:3] == ["docker", "network", "inspect"]
+        assert run.call_args_list[2].args[0] == ["docker", "network", "rm", *removed]
+
+    def test_live_projects_are_never_inspected(self):
+        listing = "inspect-live-iccccc1_lan1\ninspect-old-iaaaaaa_lan1\n"
+        with mock.patch(
+            "subprocess.run", side_effect=[_completed(listing), _completed("inspect-old-iaaaaaa_lan1 1\n")]
+        ) as run:
+            removed = _prune_stale_networks(exclude_projects={"inspect-live-iccccc1"})
+
+        assert removed == []
+        assert "inspect-live-iccccc1_lan1" not in run.call_args_list[1].args[0]
+
+    def test_nothing_to_inspect(self):
+        with mock.patch("subprocess.run", return_value=_completed("")) as run:
+            assert _prune_stale_networks() == []
+        assert run.call_count == 1
+
+    async def test_prune_runs_once_per_interval(self):
+        admission = _StartupAdmission(budget=4)
+        with (
+            mock.patch("inspect_kathara.sandbox._last_network_prune", None),
+            mock.patch("inspect_kathara.sandbox.get_docker_client", return_value=None),
+            mock.patch("inspect_kathara.sandbox._prune_stale_networks", return_value=[]) as prune,
+            mock.patch.dict("os.environ", {"INSPECT_KATHARA_PRUNE_INTERVAL": "3600"}),
+        ):
+            await _maybe_prune_stale_networks(admission)
+            await _maybe_prune_stale_networks(admission)
+
+        prune.assert_called_once()
+        assert admission.available == 4
+
+
+class TestReadiness:
+    """Tests for health-gated readiness after compose up."""
+
+    def test_bounds_only_include_healthchecked_services(self):
+        compose = {
+            "services": {
+                "default": {"image": "kathara/base"},
+                "router": {
+                    "image": "kathara/frr",
+                    "healthcheck": {"test": ["CMD-SHELL", "pgrep -f frr"], "interval": "2s"},
+                },
+                "dns": {
+                    "image": "kathara/bind:9.18",
+                    "healthcheck": {"test": ["CMD-SHELL", "pgrep -f named"], "interval": "2s"},
+                },
+            }
+        }
+        assert _readiness_bounds(compose) == {"router": 5.0, "dns": 3.0}
+
+    @pytest.mark.parametrize(("supported", "bound"), [(True, 5.0), (False, 600.0)])
+    def test_bounds_cover_the_first_probe(self, supported, bound):
+        healthcheck = {"test": ["CMD-SHELL", "true"], "interval": "10m", "start_interval": "1s"}
+        compose = {"services": {"router": {"image": "kathara/frr", "healthcheck": healthcheck}}}
+        with mock.patch("inspect_kathara.sandbox._engine_supports_start_interval", return_value=supported):
+            assert _readiness_bounds(compose) == {"router": bound}
+
+    def test_bounds_default_to_docker_interval(self):
+        compose = {"services": {"router": {"image": "kathara/frr", "healthcheck": {"test": ["CMD-SHELL", "true"]}}}}
+        assert _readiness_bounds(compose) == {"router": 30.0}
+
+    def test_bounds_empty_for_base_only_lab(self):
+        assert _readiness_bounds({"services": {"default": {"image": "kathara/base"}}}) == {}
+        assert _readiness_bounds(None) == {}
+
+    async def test_no_gated_services_returns_immediately(self):
+        with mock.patch("inspect_kathara.sandbox.compose_ps") as mock_ps:
+            assert await _wait_for_services_ready(mock.MagicMock(), {}) == {}
+        mock_ps.assert_not_called()
+
+    async def test_returns_once_all_services_healthy(self):
+        polls = [
+            [{"Service": "router", "Health": "starting"}, {"Service": "dns", "Health": "healthy"}],
+            [{"Service": "router", "Health": "healthy"}, {"Service": "dns", "Health": "healthy"}],
+        ]
+        with (
+            mock.patch("inspect_kathara.sandbox.compose_ps", side_effect=polls) as mock_ps,
+            mock.patch("inspect_kathara.sandbox.READINESS_POLL_INTERVAL", 0),
+        ):
+            ready = await _wait_for_services_ready(mock.MagicMock(), {"router": 5.0, "dns": 3.0})
+
+        assert set(ready) == {"router", "dns"}
+        assert mock_ps.call_count == 2
+
+    async def test_gives_up_after_upper_bound(self):
+        unhealthy = [{"Service": "router", "Health": "starting"}]
+        with (
+            mock.patch("inspect_kathara.sandbox.compose_ps", return_value=unhealthy),
+            mock.patch("inspect_kathara.sandbox.READINESS_POLL_INTERVAL", 0.01),
+        ):
+            ready = await _wait_for_services_ready(mock.MagicMock(), {"router": 0.05})
+
+        assert ready == {}
+
+    async def test_each_service_is_reported_at_its_own_bound(self, caplog):
+        polls = iter([[{"Service": "dns", "Health": "starting"}, {"Service": "router", "Health": "starting"}]] * 3)
+        healthy = [{"Service": "dns", "Health": "starting"}, {"Service": "router", "Health": "healthy"}]
+        with (
+            mock.patch("inspect_kathara.sandbox.compose_ps", side_effect=lambda **kwargs: next(polls, healthy)),
+            mock.patch("inspect_kathara.sandbox.READINESS_POLL_INTERVAL", 0.02),
+            caplog.at_level("WARNING", logger="inspect_kathara.sandbox"),
+        ):
+            ready = await _wait_for_services_ready(mock.MagicMock(), {"router": 5.0, "dns": 0.01})
+
+        # dns gave up after its own 0.01s, before router became healthy
+        assert set(ready) == {"router"}
+        assert "Service dns not healthy" in caplog.text and "router" not in caplog.text
+
+
+class TestStartupTiming:
+    """Tests for per-phase timing of stack startup."""
+
+    async def test_start_stack_records_every_phase(self):
+        project = mock.MagicMock()
+        project.name = "inspect-lab-iabc123"
+        env = mock.MagicMock()
+        env.as_type.return_value._project = project
+        timer = PhaseTimer("sample_init")
+        with (
+            mock.patch("inspect_kathara.sandbox._load_compose", return_value=None),
+            mock.patch("inspect_kathara.sandbox._ensure_images_available", mock.AsyncMock()),
+            mock.patch("inspect_kathara.sandbox._maybe_prune_stale_networks", mock.AsyncMock()),
+            mock.patch("inspect_kathara.sandbox._wait_for_services_ready", mock.AsyncMock(return_value={"r1": 1.5})),
+            mock.patch("inspect_kathara.sandbox._live_projects", {}),
+            mock.patch(
+                "inspect_kathara.sandbox.DockerSandboxEnvironment.sample_init",
+                mock.AsyncMock(return_value={"default": env}),
+            ),
+        ):
+            await KatharaSandboxEnvironment._start_stack("task", None, {}, timer)
+
+        assert set(timer.phases) == {
+            "load_compose",
+            "ensure_images",
+            "prune_networks",
+            "subnet_lease",
+            "admission_wait",
+            "compose_up",
+            "readiness",
+        }
+        assert timer.services == {"r1": 1.5}
+        assert timer.attributes["project"] == "inspect-lab-iabc123"
+
+
+class TestStagedStartup:
+    """Tests for dependency-ordered bring-up."""
+
+    def test_hosts_wait_for_routers_and_service_machines(self, tmp_path):
+        (tmp_path / "topology").mkdir()
+        (tmp_path / "topology" / "lab.conf").write_text(
+            'r1[0]="lan"\nr1[image]="kathara/frr"\ndns[0]="lan"\ndns[image]="kathara/bind"\n'
+            'r2[0]="lan"\nr2[image]="kathara/base"\nr2[ipv6]="true"\npc1[0]="lan"\n'
+        )
+        with mock.patch("inspect_kathara.sandbox.validate_kathara_image", side_effect=lambda image: image):
+            compose = yaml.safe_load(generate_compose_for_inspect(tmp_path))
+
+        services = compose["services"]
+        assert "depends_on" not in services["r1"]
+        assert "depends_on" not in services["dns"]
+        assert services["pc1"]["depends_on"] == {
+            "r1": {"condition": "service_healthy"},
+            "dns": {"condition": "service_healthy"},
+        }
+        assert _startup_stages(compose) == {"default": 0, "r1": 0, "dns": 0, "r2": 1, "pc1": 1}
+
+    def test_hosts_only_wait_for_their_collision_domains(self, tmp_path):
+        (tmp_path / "topology").mkdir()
+        (tmp_path / "topology" / "lab.conf").write_text(
+            'r1[0]="lan"\nr1[1]="wan"\nr1[image]="kathara/frr"\nr2[0]="dmz"\nr2[image]="kathara/frr"\n'
+            'pc1[0]="lan"\npc2[0]="office"\n'
+        )
+        with mock.patch("inspect_kathara.sandbox.validate_kathara_image", side_effect=lambda image: image):
+            services = yaml.safe_load(generate_compose_for_inspect(tmp_path))["services"]
+
+        assert services["pc1"]["depends_on"] == {"r1": {"condition": "service_healthy"}}
+        assert "depends_on" not in services["pc2"]
+
+    def test_dependencies_grow_linearly_with_lab_size(self, tmp_path):
+        lab_path = write_lab(tmp_path, machines=1000, image_mix="mixed")
+        with mock.patch("inspect_kathara.sandbox.validate_kathara_image", side_effect=lambda image: image):
+            compose = generate_compose_for_inspect(lab_path)
 
-    def test_boundary_just_below_thresholds(self):
-        """Returns 1 when just below memory thresholds."""
-        mock_mem = mock.MagicMock()
-        mock_mem.total = 15.9 * (1024**3)  # Just below 16GB
-        mock_mem.available = 8 * (1024**3)
+        # a few dependencies per host, not one per router of the lab
+        assert compose.count("condition:") < 2 * 1000
+        assert len(compose) < 1024 * 1024
+
+    def test_flat_lab_has_no_dependencies(self, tmp_path):
+        (tmp_path / "topology").mkdir()
+        (tmp_path / "topology" / "lab.conf").write_text('pc1[0]="lan"\npc2[0]="lan"\n')
+        with mock.patch("inspect_kathara.sandbox.validate_kathara_image", side_effect=lambda image: image):
+            compose = yaml.safe_load(generate_compose_for_inspect(tmp_path))
+
+        assert all("depends_on" not in service for service in compose["services"].values())
+        assert set(_startup_stages(compose).values()) == {0}
+
+    def test_stages_follow_longest_dependency_chain(self):
+        compose = {
+            "services": {
+                "a": {},
+                "b": {"depends_on": ["a"]},
+                "c": {"depends_on": {"a": {}, "b": {}}},
+                "d": {"depends_on": {"d": {}, "missing": {}}},
+            }
+        }
+        assert _startup_stages(compose) == {"a": 0, "b": 1, "c": 2, "d": 0}
+
+    def test_parse_docker_time(self):
+        assert _parse_docker_time("2024-01-02T03:04:05.123456789Z") == pytest.approx(1704164645.123456789)
+        assert _parse_docker_time("0001-01-01T00:00:00Z") is None
+        assert _parse_docker_time("") is None
+
+    async def test_stage_durations_from_container_start_times(self):
+        containers = [{"ID": "c1", "Service": "r1"}, {"ID": "c2", "Service": "pc1"}, {"ID": "c3", "Service": "pc2"}]
+        started = {"c1": "2024-01-01T00:00:01Z", "c2": "2024-01-01T00:00:05.5Z", "c3": "2024-01-01T00:00:06Z"}
+        client = mock.MagicMock()
+        client.inspect_container = mock.AsyncMock(side_effect=lambda cid: {"State": {"StartedAt": started[cid]}})
+        up_started = _parse_docker_time("2024-01-01T00:00:00Z")
+        with (
+            mock.patch("inspect_kathara.sandbox.compose_ps", mock.AsyncMock(return_value=containers)),
+            mock.patch("inspect_kathara.sandbox.get_docker_client", return_value=client),
+        ):
+            durations = await _stage_durations(
+                mock.MagicMock(), {"r1": 0, "pc1": 1, "pc2": 1}, up_started, up_started + 8.0
+            )
 
-        with mock.patch("psutil.virtual_memory", return_value=mock_mem):
-            assert _calculate_safe_concurrency() == 1
+        assert durations == {"stage_0": pytest.approx(5.5), "stage_1": pytest.approx(2.5)}
+
+
+class TestShellSessions:
+    """Tests for routing exec through per-container shell sessions."""
+
+    async def test_stack_environments_use_sessions_when_enabled(self, monkeypatch):
+        monkeypatch.setenv("INSPECT_KATHARA_SESSIONS", "1")
+        project = mock.MagicMock()
+        project.name = "inspect-lab-iabc123"
+        docker_env = DockerSandboxEnvironment("r1", project, "/")
+        with (
+            mock.patch("inspect_kathara.sandbox._load_compose", return_value=None),
+            mock.patch("inspect_kathara.sandbox._ensure_images_available", mock.AsyncMock()),
+            mock.patch("inspect_kathara.sandbox._maybe_prune_stale_networks", mock.AsyncMock()),
+            mock.patch("inspect_kathara.sandbox._wait_for_services_ready", mock.AsyncMock(return_value={})),
+            mock.patch("inspect_kathara.sandbox._live_projects", {}),
+            mock.patch(
+                "inspect_kathara.sandbox.DockerSandboxEnvironment.sample_init",
+                mock.AsyncMock(return_value={"r1": docker_env}),
+            ),
+        ):
+            environments = await KatharaSandboxEnvironment._start_stack("task", None, {})
+
+        env = environments["r1"]
+        assert isinstance(env, KatharaSandboxEnvironment) and env._sessions
+        assert (env._service, env._project, env._working_dir) == ("r1", project, "/")
+
+    async def test_exec_runs_in_session_unless_user_given(self, tmp_path):
+        env = KatharaSandboxEnvironment("r1", mock.MagicMock(), str(tmp_path), sessions=True)
+        env._session = ShellSession(["sh"])
+        docker_exec = mock.AsyncMock(return_value=ExecResult(True, 0, "docker", ""))
+        try:
+            with mock.patch("inspect_kathara.sandbox.DockerSandboxEnvironment.exec", docker_exec):
+                assert (await env.exec(["pwd"])).stdout == f"{tmp_path}\n"
+                assert (await env.exec(["pwd"], user="frr")).stdout == "docker"
+        finally:
+            await env.close_session()
+
+        docker_exec.assert_awaited_once()
+        assert env._session is None
+
+
+class TestSubnetLeasing:
+    """Tests for starting stacks on leased subnets."""
+
+    async def test_stack_starts_from_leased_copy_and_releases_it(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("INSPECT_KATHARA_LEASE_DIR", str(tmp_path / "leases"))
+        monkeypatch.setenv("INSPECT_KATHARA_SUBNET_POOL", "10.200.0.0/16")
+        config = tmp_path / "compose.yaml"
+        config.write_text(
+            "services:\n  r1:\n    image: x\n    networks: [lan]\n"
+            "networks:\n  lan:\n    ipam:\n      config:\n        - subnet: 10.128.0.0/28\n"
+        )
+        project = mock.MagicMock()
+        project.name = "inspect-lab-iabc123"
+        env = mock.MagicMock()
+        env.as_type.return_value._project = project
+        sample_init = mock.AsyncMock(return_value={"default": env})
+        with (
+            mock.patch("inspect_kathara.sandbox._ensure_images_available", mock.AsyncMock()),
+            mock.patch("inspect_kathara.sandbox._maybe_prune_stale_networks", mock.AsyncMock()),
+            mock.patch("inspect_kathara.sandbox._wait_for_services_ready", mock.AsyncMock(return_value={})),
+            mock.patch("inspect_kathara.sandbox._live_projects", {}),
+            mock.patch("inspect_kathara.sandbox.DockerSandboxEnvironment.sample_init", sample_init),
+            mock.patch("inspect_kathara.sandbox.DockerSandboxEnvironment.sample_cleanup", mock.AsyncMock()),
+        ):
+            environments = await KatharaSandboxEnvironment._start_stack("task", str(config), {})
+            leased = Path(sample_init.call_args.args[1])
+            # the copy lives with the leases, not in the dataset tree
+            assert leased.parent == tmp_path / "leases" and list(tmp_path.glob(".compose*")) == []
+            assert "10.200.0.0/28" in leased.read_text()
+
+            await KatharaSandboxEnvironment.sample_cleanup("task", str(config), environments, False)
+
+        assert not leased.exists()
+        assert list((tmp_path / "leases").glob("*.json")) == []
+
+    async def test_interrupted_stack_keeps_its_lease_until_task_cleanup(self, tmp_path, monkeypatch):
+        monkeypatch.setenv("INSPECT_KATHARA_LEASE_DIR", str(tmp_path / "leases"))
+        monkeypatch.setenv("INSPECT_KATHARA_SUBNET_POOL", "10.200.0.0/16")
+        config = tmp_path / "compose.yaml"
+        config.write_text("services:\n  r1:\n    image: x\n    networks: [lan]\nnetworks:\n  lan: {}\n")
+        project = mock.MagicMock()
+        project.name = "inspect-lab-iabc123"
+        env = mock.MagicMock()
+        env.as_type.return_value._project = project
+        sample_init = mock.AsyncMock(return_value={"default": env})
+        docker_task_cleanup = mock.AsyncMock()
+        with (
+            mock.patch("inspect_kathara.sandbox._ensure_images_available", mock.AsyncMock()),
+            mock.patch("inspect_kathara.sandbox._maybe_prune_stale_networks", mock.AsyncMock()),
+            mock.patch("inspect_kathara.sandbox._wait_for_services_ready", mock.AsyncMock(return_value={})),
+            mock.patch("inspect_kathara.sandbox._live_projects", {}) as live,
+            mock.patch("inspect_kathara.sandbox.DockerSandboxEnvironment.sample_init", sample_init),
+            mock.patch("inspect_kathara.sandbox.DockerSandboxEnvironment.sample_cleanup", mock.AsyncMock()),
+            mock.patch("inspect_kathara.sandbox.DockerSandboxEnvironment.task_cleanup", docker_task_cleanup),
+        ):
+            environments = await KatharaSandboxEnvironment._start_stack("task", str(config), {})
+            leased = Path(sample_init.call_args.args[1])
+            await KatharaSandboxEnvironment.sample_cleanup("task", str(config), environments, True)
+
+            # compose down is postponed: the block and the compose file it runs against stay
+            assert leased.exists() and len(list((tmp_path / "leases").glob("*.json"))) == 1
+            assert project.name in live
+
+            await KatharaSandboxEnvironment.task_cleanup("task", str(config), True)
+
+        docker_task_cleanup.assert_awaited_once()
+        assert not leased.exists() and list((tmp_path / "leases").glob("*.json")) == []
+
+    def test_large_collision_domain_gets_larger_subnet(self, tmp_path):
+        (tmp_path / "topology").mkdir()
+        lab_conf = "".join(f'pc{i}[0]="big"\n' for i in range(20)) + 'pc0[1]="small"\n'
+        (tmp_path / "topology" / "lab.conf").write_text(lab_conf)
+        with mock.patch("inspect_kathara.sandbox.validate_kathara_image", side_effect=lambda image: image):
+            compose = yaml.safe_load(generate_compose_for_inspect(tmp_path))
+
+        subnets = {name: network["ipam"]["config"][0]["subnet"] for name, network in compose["networks"].items()}
+        assert subnets == {"big": "10.128.0.0/27", "small": "10.128.0.32/28"}
+
+
+def _startup_script(lab_path: Path, service: dict) -> str | None:
+    """Content of the startup script mounted into a generated service."""
+    for volume in service.get("volumes", []):
+        source, target, _ = volume.split(":")
+        if target == "/kathara/startup.sh":
+            return (lab_path / source).read_text()
+    return None
 
 
 class TestGenerateComposeForInspect:
@@ -141,6 +625,40 @@ router[image]="kathara/frr"
         # Default machine should be first and mapped to "default" service
         assert "default:" in compose
 
+    def test_lab_conf_directives_flow_into_services(self, tmp_path):
+        lab_conf = """
+r1[0]="lan1/02:42:AC:11:00:02"
+r1[1]="lan2"
+r1[image]="kathara/frr"
+r1[mem]="512m"
+r1[cpus]="0.5"
+r1[sysctl]="net.ipv4.conf.all.rp_filter=0"
+r1[env]="ROLE=edge"
+r1[ipv6]="true"
+r1[bridged]="true"
+r1[exec]="echo $HOSTNAME > /tmp/up"
+"""
+        (tmp_path / "topology").mkdir()
+        (tmp_path / "topology" / "lab.conf").write_text(lab_conf)
+
+        with mock.patch("inspect_kathara.sandbox.validate_kathara_image", side_effect=lambda image: image):
+            compose = yaml.safe_load(generate_compose_for_inspect(tmp_path))
+
+        r1 = compose["services"]["r1"]
+        assert r1["mem_limit"] == "512m"
+        assert r1["cpus"] == 0.5
+        assert r1["environment"] == {"ROLE": "edge"}
+        assert r1["sysctls"] == {
+            "net.ipv4.ip_forward": "1",
+            "net.ipv4.conf.all.rp_filter": "0",
+            "net.ipv6.conf.all.disable_ipv6": "0",
+        }
+        assert r1["networks"]["lan1"] == {"interface_name": "eth0", "mac_address": "02:42:ac:11:00:02"}
+        assert "bridged" in r1["networks"]
+        assert "internal" not in compose["networks"]["bridged"]
+        assert r1["command"] == ["bash", "-l", "/kathara/prologue.sh"]
+        assert _startup_script(tmp_path, r1) == "echo $HOSTNAME > /tmp/up\n"
+
     def test_generate_missing_lab_conf_raises(self):
         with tempfile.TemporaryDirectory() as tmpdir:
             lab_path = Path(tmpdir)
@@ -170,7 +688,7 @@ router[image]="kathara/frr"
             compose = generate_compose_for_inspect(lab_path)
             compose_dict = yaml.safe_load(compose)
 
-        assert "Hello, World!" in compose_dict["services"]["pc1"]["command"]
+            assert _startup_script(lab_path, compose_dict["services"]["pc1"]) == startup_script + "\n"
 
     def test_generate_with_copy_config_files(self):
         lab_conf = """
@@ -191,7 +709,268 @@ router[image]="kathara/frr"
             compose = generate_compose_for_inspect(lab_path)
             compose_dict = yaml.safe_load(compose)
             assert "volumes" in compose_dict["services"]["pc1"]
-            assert "cp -r /tmp/config/*" in compose_dict["services"]["pc1"]["command"]
+            assert "./topology/pc1:/tmp/config:ro" in compose_dict["services"]["pc1"]["volumes"]
+            assert "cp -r /tmp/config/*" in (lab_path / ".kathara" / "prologue.sh").read_text()
+
+    def test_startup_scripts_are_shared_and_kept_verbatim(self, tmp_path):
+        (tmp_path / "topology").mkdir()
+        (tmp_path / "topology" / "lab.conf").write_text('pc1[0]="lan"\npc2[0]="lan"\npc3[0]="lan"\n')
+        script = '# comment\nip addr add 10.0.0.1/24 dev eth0 && echo "it\'s up" > /tmp/up\n'
+        for name in ("pc1", "pc2"):
+            (tmp_path / "topology" / f"{name}.startup").write_text(script)
+
+        with mock.patch("inspect_kathara.sandbox.validate_kathara_image", side_effect=lambda image: image):
+            services = yaml.safe_load(generate_compose_for_inspect(tmp_path))["services"]
+
+        assert _startup_script(tmp_path, services["pc1"]) == script
+        assert services["pc1"]["volumes"] == services["pc2"]["volumes"]
+        assert _startup_script(tmp_path, services["pc3"]) is None
+        assert len(list((tmp_path / ".kathara" / "startup").iterdir())) == 1
+
+    @pytest.mark.parametrize(
+        ("mode", "supported", "interval", "start_interval"),
+        [
+            (None, True, "600s", "1s"),
+            ("liveness", True, "60s", "1s"),
+            ("continuous", True, "2s", None),
+            (None, False, "2s", None),
+            ("liveness", False, "2s", None),
+        ],
+    )
+    def test_healthcheck_modes(self, tmp_path, monkeypatch, mode, supported, interval, start_interval):
+        if mode:
+            monkeypatch.setenv("INSPECT_KATHARA_HEALTHCHECK", mode)
+        monkeypatch.setattr("inspect_kathara.sandbox._engine_supports_start_interval", lambda: supported)
+        (tmp_path / "topology").mkdir()
+        (tmp_path / "topology" / "lab.conf").write_text('r1[0]="lan"\nr1[image]="kathara/quagga"\npc1[0]="lan"\n')
+        with mock.patch("inspect_kathara.sandbox.validate_kathara_image", side_effect=lambda image: image):
+            services = yaml.safe_load(generate_compose_for_inspect(tmp_path))["services"]
+
+        healthcheck = services["r1"]["healthcheck"]
+        assert healthcheck["interval"] == interval
+        assert healthcheck.get("start_interval") == start_interval
+        # one ps for all of quagga's daemons
+        probe = healthcheck["test"][1]
+        assert probe.count("ps ") == 1 and "pgrep" not in probe
+        assert all(f"'[{daemon[0]}]{daemon[1:]}'" in probe for daemon in ("zebra", "ospfd", "bgpd", "ripd"))
+        assert "healthcheck" not in services["pc1"]
+
+    @pytest.mark.parametrize(
+        ("running", "healthy"), [("zebra ospfd bgpd ripd", True), ("zebra ospfd bgpd", False), ("", False)]
+    )
+    def test_healthcheck_probe_survives_compose_interpolation(self, tmp_path, running, healthy):
+        (tmp_path / "topology").mkdir()
+        (tmp_path / "topology" / "lab.conf").write_text('r1[0]="lan"\nr1[image]="kathara/quagga"\n')
+        with mock.patch("inspect_kathara.sandbox.validate_kathara_image", side_effect=lambda image: image):
+            services = yaml.safe_load(generate_compose_for_inspect(tmp_path))["services"]
+        # Compose turns $$ into $ and substitutes (unset) $VAR / ${VAR} with ""
+        probe = re.sub(
+            r"\$(\$|\{\w+\}|\w+)", lambda m: "$" if m[1] == "$" else "", services["r1"]["healthcheck"]["test"][1]
+        )
+
+        bin_dir = tmp_path / "bin"
+        bin_dir.mkdir()
+        fake_ps = bin_dir / "ps"
+        fake_ps.write_text("#!/bin/sh\n" + "".join(f"echo /usr/lib/quagga/{daemon}\n" for daemon in running.split()))
+        fake_ps.chmod(0o755)
+        env = {**os.environ, "PATH": f"{bin_dir}:{os.environ['PATH']}"}
+        result = subprocess.run(["sh", "-c", probe], env=env)
+        assert (result.returncode == 0) == healthy
+
+
+class TestIncrementalWriteCompose:
+    """Tests for write_compose_for_lab(incremental=True)."""
+
+    def _lab(self, tmp_path: Path) -> Path:
+        (tmp_path / "topology").mkdir()
+        (tmp_path / "topology" / "lab.conf").write_text('r1[0]="lan"\nr1[image]="kathara/frr"\npc1[0]="lan"\n')
+        (tmp_path / "topology" / "pc1.startup").write_text("ip addr add 10.0.0.2/24 dev eth0\n")
+        return tmp_path
+
+    def _write(self, lab_path: Path) -> mock.MagicMock:
+        with mock.patch("inspect_kathara.sandbox.validate_kathara_image", side_effect=lambda image: image) as validate:
+            write_compose_for_lab(lab_path, incremental=True)
+        return validate
+
+    def test_matches_full_generation(self, tmp_path):
+        lab_path = self._lab(tmp_path)
+        self._write(lab_path)
+        with mock.patch("inspect_kathara.sandbox.validate_kathara_image", side_effect=lambda image: image):
+            assert (lab_path / "compose.yaml").read_text() == generate_compose_for_inspect(lab_path)
+
+    def test_unchanged_lab_is_not_rewritten(self, tmp_path):
+        lab_path = self._lab(tmp_path)
+        self._write(lab_path)
+        mtime = (lab_path / "compose.yaml").stat().st_mtime_ns
+
+        validate = self._write(lab_path)
+
+        validate.assert_not_called()
+        assert (lab_path / "compose.yaml").stat().st_mtime_ns == mtime
+
+    def test_only_changed_machine_is_regenerated(self, tmp_path):
+        lab_path = self._lab(tmp_path)
+        self._write(lab_path)
+        startup = lab_path / "topology" / "pc1.startup"
+        startup.write_text("ip addr add 10.0.0.3/24 dev eth0\n")
+        os.utime(startup, ns=(1, 1))
+
+        validate = self._write(lab_path)
+
+        assert [call.args[0] for call in validate.call_args_list] == ["kathara/base"]
+        pc1 = yaml.safe_load((lab_path / "compose.yaml").read_text())["services"]["pc1"]
+        assert "10.0.0.3/24" in _startup_script(lab_path, pc1)
+
+    def test_superseded_startup_scripts_are_pruned(self, tmp_path):
+        lab_path = self._lab(tmp_path)
+        self._write(lab_path)
+        (lab_path / "topology" / "pc1.startup").write_text("ip addr add 10.0.0.3/24 dev eth0\n")
+        self._write(lab_path)
+
+        scripts = list((lab_path / ".kathara" / "startup").iterdir())
+        assert [script.read_text() for script in scripts] == ["ip addr add 10.0.0.3/24 dev eth0\n"]
+
+    @pytest.mark.parametrize("incremental", [True, False])
+    def test_output_outside_lab_gets_its_own_scripts(self, tmp_path, incremental):
+        (tmp_path / "lab").mkdir()
+        lab_path = self._lab(tmp_path / "lab")
+        (lab_path / "topology" / "pc1" / "etc").mkdir(parents=True)
+        output = tmp_path / "out" / "compose.yaml"
+        output.parent.mkdir()
+        with mock.patch("inspect_kathara.sandbox.validate_kathara_image", side_effect=lambda image: image):
+            write_compose_for_lab(lab_path, output, incremental=incremental)
+
+        assert not (lab_path / ".kathara").exists()
+        pc1 = yaml.safe_load(output.read_text())["services"]["pc1"]
+        assert _startup_script(output.parent, pc1) == "ip addr add 10.0.0.2/24 dev eth0\n"
+        sources = {volume.split(":")[1]: volume.split(":")[0] for volume in pc1["volumes"]}
+        assert sources["/tmp/config"] == "../lab/topology/pc1"
+        assert (output.parent / sources["/kathara/prologue.sh"]).is_file()
+
+    def test_missing_startup_script_is_regenerated(self, tmp_path):
+        lab_path = self._lab(tmp_path)
+        self._write(lab_path)
+        for script in (lab_path / ".kathara" / "startup").iterdir():
+            script.unlink()
+
+        validate = self._write(lab_path)
+
+        assert [call.args[0] for call in validate.call_args_list] == ["kathara/base"]
+        pc1 = yaml.safe_load((lab_path / "compose.yaml").read_text())["services"]["pc1"]
+        assert _startup_script(lab_path, pc1) == "ip addr add 10.0.0.2/24 dev eth0\n"
+
+    def test_written_files_get_umask_permissions(self, tmp_path):
+        lab_path = self._lab(tmp_path)
+        previous = os.umask(0o022)
+        try:
+            self._write(lab_path)
+            written = [lab_path / "compose.yaml", lab_path / ".kathara" / "prologue.sh"]
+            written += (lab_path / ".kathara" / "startup").iterdir()
+            assert {oct(path.stat().st_mode & 0o777) for path in written} == {"0o644"}
+
+            # a rewritten file keeps the mode it had
+            (lab_path / "compose.yaml").chmod(0o640)
+            (lab_path / "topology" / "lab.conf").write_text('r1[0]="lan"\nr1[image]="kathara/frr"\n')
+            self._write(lab_path)
+            assert (lab_path / "compose.yaml").stat().st_mode & 0o777 == 0o640
+        finally:
+            os.umask(previous)
+
+    def test_generator_version_bump_regenerates_everything(self, tmp_path):
+        lab_path = self._lab(tmp_path)
+        self._write(lab_path)
+        with mock.patch("inspect_kathara.sandbox.COMPOSE_GENERATOR_VERSION", -1):
+            validate = self._write(lab_path)
+        assert validate.call_count == 2
+
+    def test_offline_fragments_are_validated_by_an_online_write(self, tmp_path):
+        lab_path = self._lab(tmp_path)
+        write_compose_for_lab(lab_path, incremental=True, offline=True)
+
+        validate = self._write(lab_path)
+
+        assert sorted(call.args[0] for call in validate.call_args_list) == ["kathara/base", "kathara/frr"]
+
+
+class TestOfflineGeneration:
+    """Tests for compose generation without image validation."""
+
+    def _lab(self, tmp_path: Path) -> Path:
+        (tmp_path / "topology").mkdir()
+        (tmp_path / "topology" / "lab.conf").write_text('r1[0]="lan"\nr1[image]="kathara/frr"\npc1[0]="lan"\n')
+        return tmp_path
+
+    def test_offline_output_matches_validated_output(self, tmp_path):
+        lab_path = self._lab(tmp_path)
+        with mock.patch("inspect_kathara.sandbox.validate_kathara_image", side_effect=lambda image: image) as validate:
+            online = generate_compose_for_inspect(lab_path)
+            validate.reset_mock()
+            offline = generate_compose_for_inspect(lab_path, offline=True)
+
+        validate.assert_not_called()
+        assert offline == online
+
+    def test_offline_still_rejects_foreign_images(self, tmp_path):
+        lab_path = self._lab(tmp_path)
+        (lab_path / "topology" / "lab.conf").write_text('pc1[0]="lan"\npc1[image]="nginx"\n')
+        with pytest.raises(ValueError, match="Only kathara"):
+            generate_compose_for_inspect(lab_path, offline=True)
+
+    async def test_manifest_is_resolved_in_one_batch(self, tmp_path):
+        lab_path = self._lab(tmp_path)
+        with mock.patch("inspect_kathara.sandbox.validate_kathara_image") as validate:
+            write_compose_for_lab(lab_path, offline=True)
+        validate.assert_not_called()
+
+        manifest = lab_path / "compose.images.json"
+        assert json.loads(manifest.read_text())["images"] == ["kathara/base", "kathara/frr"]
+        with mock.patch("inspect_kathara.sandbox.ensure_kathara_images", mock.AsyncMock()) as ensure:
+            await ensure_image_manifests([manifest, manifest], max_parallel=2)
+        assert list(ensure.call_args.args[0]) == ["kathara/base", "kathara/frr"] * 2
+        assert ensure.call_args.kwargs == {"max_parallel": 2}
+
+
+class TestComposeFormats:
+    """Tests for JSON compose output and cached compose loading."""
+
+    def _lab(self, tmp_path: Path) -> Path:
+        (tmp_path / "topology").mkdir()
+        (tmp_path / "topology" / "lab.conf").write_text('r1[0]="lan"\nr1[image]="kathara/frr"\npc1[0]="lan"\n')
+        (tmp_path / "topology" / "pc1.startup").write_text("echo 'it''s' $HOME\n")
+        return tmp_path
+
+    def test_json_output_matches_yaml(self, tmp_path):
+        lab_path = self._lab(tmp_path)
+        yaml_compose = generate_compose_for_inspect(lab_path, offline=True)
+        json_compose = generate_compose_for_inspect(lab_path, offline=True, output_format="json")
+
+        assert json.loads(json_compose) == yaml.safe_load(yaml_compose)
+
+    def test_incremental_json_output(self, tmp_path):
+        lab_path = self._lab(tmp_path)
+        output = write_compose_for_lab(lab_path, lab_path / "compose.json", incremental=True, offline=True)
+        (lab_path / "topology" / "pc1.startup").write_text("echo changed\n")
+        write_compose_for_lab(lab_path, output, incremental=True, offline=True)
+
+        assert output.read_text() == generate_compose_for_inspect(lab_path, offline=True, output_format="json")
+
+    def test_load_compose_resolves_directories_and_tolerates_unreadable_paths(self, tmp_path):
+        (tmp_path / "docker-compose.yaml").write_text("services:\n  a:\n    image: kathara/base\n")
+        assert set(_load_compose(str(tmp_path))["services"]) == {"a"}
+        assert _load_compose(str(tmp_path / "missing")) is None
+        (tmp_path / "docker-compose.yaml").unlink()
+        assert _load_compose(str(tmp_path)) is None
+
+    def test_load_compose_is_cached_until_file_changes(self, tmp_path):
+        compose_file = tmp_path / "compose.json"
+        compose_file.write_text('{"services": {"a": {"image": "kathara/base"}}}')
+
+        first = _load_compose(str(compose_file))
+        assert _load_compose(str(compose_file)) is first
+
+        compose_file.write_text('{"services": {"b": {"image": "kathara/base"}}}')
+        os.utime(compose_file, ns=(0, 0))
+        assert set(_load_compose(str(compose_file))["services"]) == {"b"}
 
 
 class TestGetMachineServiceMapping:
@@ -226,7 +1005,9 @@ class TestKatharaImages:
         try:
             result = subprocess.run(
                 ["docker", "images", "--format", "{{.Repository}}"],
-                capture_output=True, text=True, timeout=10,
+                capture_output=True,
+                text=True,
+                timeout=10,
             )
             if result.returncode != 0:
                 pytest.skip("Docker is not available")
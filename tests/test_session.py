@@ -0,0 +1,78 @@
+"""Tests for inspect_kathara._session module."""
+
+import pytest
+from inspect_ai.util import OutputLimitExceededError
+
+from inspect_kathara._session import SessionError, ShellSession, sessions_enabled
+
+
+@pytest.fixture
+async def session():
+    # A local shell stands in for `docker exec -i <container> sh`
+    shell = ShellSession(["sh"], output_limit=256)
+    yield shell
+    await shell.close()
+
+
+class TestShellSession:
+    """Tests for commands multiplexed over one shell."""
+
+    async def test_frames_output_and_exit_status(self, session):
+        result = await session.run(["sh", "-c", "echo out; echo err >&2; exit 3"])
+        assert (result.success, result.returncode, result.stdout, result.stderr) == (False, 3, "out\n", "err\n")
+
+        result = await session.run(["printf", "%s", "no trailing newline"])
+        assert result.success and result.stdout == "no trailing newline"
+
+    async def test_input_cwd_and_env(self, session, tmp_path):
+        assert (await session.run(["cat"], input="line 1\nline 2")).stdout == "line 1\nline 2"
+        assert (await session.run(["pwd"], cwd=str(tmp_path))).stdout == f"{tmp_path}\n"
+        result = await session.run(["sh", "-c", 'echo "$GREETING"'], env={"GREETING": "it's $HOME"})
+        assert result.stdout == "it's $HOME\n"
+        with pytest.raises(ValueError):
+            await session.run(["true"], env={"BAD NAME": "x"})
+
+    async def test_commands_do_not_leak_state(self, session, tmp_path):
+        await session.run(["sh", "-c", "exit 1"])
+        await session.run(["sh", "-c", f"cd {tmp_path}; export LEAK=1"])
+        result = await session.run(["sh", "-c", 'echo "${LEAK:-none}"'])
+        assert result.stdout == "none\n"
+
+    async def test_output_over_limit_raises_with_head_and_tail(self, session):
+        with pytest.raises(OutputLimitExceededError) as error:
+            await session.run(["sh", "-c", "seq 1 10000; printf 'é%.0s' $(seq 1 300) >&2"])
+
+        assert error.value.limit_str == "256 bytes"
+        output = error.value.truncated_output
+        assert output.startswith("1\n2\n3\n") and "9999\n10000\n" in output
+        assert output.count("bytes omitted") == 2 and len(output.encode()) <= 2 * (256 + 64)
+        assert "\ufffd" not in output
+
+        small = await session.run(["echo", "small"])
+        assert (small.stdout, small.stdout_bytes) == ("small\n", 6)
+        # the session is still usable after the error
+        exact = await session.run(["sh", "-c", "head -c 256 /dev/zero | tr '\\0' x"])
+        assert exact.stdout_bytes == 256 and "omitted" not in exact.stdout
+
+    async def test_timeout_raises_and_session_continues(self, session):
+        with pytest.raises(TimeoutError):
+            await session.run(["sleep", "5"], timeout=1)
+        assert (await session.run(["echo", "next"])).stdout == "next\n"
+
+    async def test_dead_shell_is_respawned(self, session):
+        await session.run(["true"])
+        session._process.kill()
+        await session._process.wait()
+
+        assert (await session.run(["echo", "again"])).stdout == "again\n"
+
+    async def test_shell_dying_mid_command_raises(self, session):
+        with pytest.raises(SessionError):
+            await session.run(["sh", "-c", "kill -9 $PPID; sleep 1"])
+        assert not session.alive
+
+    def test_sessions_are_opt_in(self, monkeypatch):
+        monkeypatch.delenv("INSPECT_KATHARA_SESSIONS", raising=False)
+        assert not sessions_enabled()
+        monkeypatch.setenv("INSPECT_KATHARA_SESSIONS", "1")
+        assert sessions_enabled()
@@ -0,0 +1,154 @@
+"""Tests for inspect_kathara.snapshot module."""
+
+import asyncio
+from unittest import mock
+
+import pytest
+from inspect_ai.util import ExecResult
+
+from inspect_kathara.sandbox import KatharaSandboxEnvironment, _StackGeneration
+from inspect_kathara.snapshot import PROBES, Probe, network_snapshot, parse_iptables, parse_probes, probe_script
+
+ROUTE_TABLE = [{"dst": "10.0.2.0/24", "gateway": "10.0.1.2"}]
+ROUTES = Probe("routes", """echo '[{"dst": "10.0.2.0/24", "gateway": "10.0.1.2"}]'""", PROBES["routes"].parse)
+IPTABLES = Probe("iptables", "printf '*filter\\n:INPUT DROP [0:0]\\n-A INPUT -p icmp -j ACCEPT\\nCOMMIT\\n'")
+BROKEN = Probe("broken", "echo '{not json'", PROBES["routes"].parse)
+NEIGHBORS = Probe("neighbors", "echo '[]'", PROBES["neighbors"].parse, converges=True)
+VTYSH = Probe("frr_routes", "vtysh-missing -c 'show ip route json'", PROBES["frr_routes"].parse, vtysh=True)
+
+
+async def _run_locally(cmd: list[str]) -> ExecResult[str]:
+    """Run a probe script on the host, as a container would."""
+    process = await asyncio.create_subprocess_exec(*cmd, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+    stdout, stderr = await process.communicate()
+    return ExecResult(process.returncode == 0, process.returncode, stdout.decode(), stderr.decode())
+
+
+async def _docker_exec(self, cmd, *args, **kwargs):
+    return await _run_locally(cmd)
+
+
+class _LocalSandbox:
+    """Non-kathara sandbox running commands on the host."""
+
+    def __init__(self):
+        self.calls = 0
+
+    async def exec(self, cmd, timeout=None, **kwargs):
+        self.calls += 1
+        return await _run_locally(cmd)
+
+    def as_type(self, sandbox_cls):
+        raise TypeError(f"Expected instance of {sandbox_cls.__name__}")
+
+
+class TestProbeParsing:
+    """Tests for probe scripts and their parsed output."""
+
+    async def test_sections_are_parsed_per_probe(self):
+        probes = [ROUTES, IPTABLES, BROKEN, VTYSH]
+        result = await _run_locally(["sh", "-c", probe_script(probes)])
+        parsed = parse_probes(result.stdout, probes)
+
+        assert parsed["routes"].ok and parsed["routes"].data == ROUTE_TABLE
+        assert parsed["iptables"].output.endswith("COMMIT\n")
+        assert parsed["broken"].returncode == 0 and parsed["broken"].error.startswith("unparseable output")
+        assert (parsed["frr_routes"].returncode, parsed["frr_routes"].error) == (127, "vtysh not available")
+
+    def test_missing_sections_are_reported(self):
+        assert parse_probes("", [ROUTES])["routes"].error == "no output"
+
+    def test_iptables_and_sysctl_parsers(self):
+        tables = parse_iptables(
+            "# Generated\n*filter\n:INPUT DROP [3:180]\n:FORWARD ACCEPT [0:0]\n-A INPUT -j LOG\nCOMMIT\n"
+        )
+        assert tables == {"filter": {"policies": {"INPUT": "DROP", "FORWARD": "ACCEPT"}, "rules": ["-A INPUT -j LOG"]}}
+        sysctls = PROBES["sysctl"].parse("net.ipv4.ip_forward = 1\nnet.ipv4.conf.all.rp_filter = 2\n")
+        assert sysctls == {"net.ipv4.ip_forward": "1", "net.ipv4.conf.all.rp_filter": "2"}
+
+
+class TestNetworkSnapshot:
+    """Tests for parallel, cached snapshots across services."""
+
+    @pytest.fixture
+    def docker_exec(self):
+        with mock.patch(
+            "inspect_kathara.sandbox.DockerSandboxEnvironment.exec", autospec=True, side_effect=_docker_exec
+        ) as exec:
+            yield exec
+
+    def _kathara(self, service: str, stack: _StackGeneration | None = None) -> KatharaSandboxEnvironment:
+        return KatharaSandboxEnvironment(service, mock.MagicMock(), "/", stack_generation=stack)
+
+    async def test_one_exec_per_service(self, docker_exec):
+        environments = {"r1": self._kathara("r1"), "pc1": _LocalSandbox()}
+        snapshot = await network_snapshot(
+            probes=[ROUTES, IPTABLES, VTYSH], vtysh_services=["r1"], environments=environments
+        )
+
+        assert docker_exec.call_count == 1 and environments["pc1"].calls == 1
+        assert snapshot.data("routes") == {"r1": ROUTE_TABLE, "pc1": ROUTE_TABLE}
+        assert "frr_routes" in snapshot["r1"].probes and "frr_routes" not in snapshot["pc1"].probes
+        assert snapshot["r1"].data("frr_routes") is None
+
+    async def test_cached_until_state_may_change(self, docker_exec):
+        router = self._kathara("r1")
+        environments = {"r1": router}
+
+        first = await network_snapshot(probes=[ROUTES], environments=environments)
+        second = await network_snapshot(probes=[ROUTES], environments=environments)
+        assert docker_exec.call_count == 1 and second.cached == ["r1"]
+        assert second["r1"].probes == first["r1"].probes
+
+        # a different probe set is a separate cache entry
+        await network_snapshot(probes=[ROUTES, IPTABLES], environments=environments)
+        assert docker_exec.call_count == 2
+
+        await router.exec(["ip", "route", "del", "10.0.2.0/24"])
+        third = await network_snapshot(probes=[ROUTES], environments=environments)
+        assert third.cached == [] and third["r1"].generation == router.generation == 1
+
+        await network_snapshot(probes=[ROUTES], refresh=True, environments=environments)
+        assert docker_exec.call_count == 5
+
+    async def test_exec_on_any_container_of_the_stack_invalidates(self, docker_exec):
+        stack = _StackGeneration()
+        environments = {"r1": self._kathara("r1", stack), "r2": self._kathara("r2", stack)}
+        await network_snapshot(probes=[ROUTES], environments=environments)
+
+        # fixing OSPF on r2 changes the routes of r1 too
+        await environments["r2"].exec(["true"])
+        snapshot = await network_snapshot(["r1"], probes=[ROUTES], environments=environments)
+
+        assert snapshot.cached == [] and docker_exec.call_count == 4
+
+    async def test_converging_probes_are_only_cached_on_request(self, docker_exec):
+        environments = {"r1": self._kathara("r1")}
+        await network_snapshot(probes=[IPTABLES, NEIGHBORS], environments=environments)
+        second = await network_snapshot(probes=[IPTABLES, NEIGHBORS], environments=environments)
+
+        # one exec for the neighbours only; iptables came from the cache
+        assert docker_exec.call_count == 2 and second.cached == []
+        assert "*filter" not in docker_exec.call_args.args[1][2] and "neighbors" in docker_exec.call_args.args[1][2]
+        assert set(second["r1"].probes) == {"iptables", "neighbors"} and second["r1"].probes["iptables"].ok
+
+        await network_snapshot(probes=[IPTABLES, NEIGHBORS], cache_converging=True, environments=environments)
+        third = await network_snapshot(probes=[IPTABLES, NEIGHBORS], cache_converging=True, environments=environments)
+        assert docker_exec.call_count == 3 and third.cached == ["r1"]
+
+    async def test_failures_are_reported_per_service(self, docker_exec):
+        docker_exec.side_effect = TimeoutError()
+        snapshot = await network_snapshot(
+            ["r1", "r9"], probes=[ROUTES], timeout=5, environments={"r1": self._kathara("r1")}
+        )
+
+        assert snapshot.failed == ["r1", "r9"]
+        assert snapshot["r1"].error == "timed out after 5s" and snapshot["r9"].error == "unknown service 'r9'"
+        # failed reads are not cached
+        docker_exec.side_effect = _docker_exec
+        snapshot = await network_snapshot(["r1"], probes=[ROUTES], environments={"r1": self._kathara("r1")})
+        assert snapshot.failed == []
+
+    async def test_unknown_probe_name(self):
+        with pytest.raises(ValueError, match="Unknown probe"):
+            await network_snapshot(probes=["bogus"], environments={})
@@ -0,0 +1,64 @@
+"""Tests for inspect_kathara._telemetry module."""
+
+import logging
+from unittest import mock
+
+import pytest
+
+from inspect_kathara._telemetry import TELEMETRY_SOURCE, PhaseTimer, emit_timing
+
+
+class TestPhaseTimer:
+    """Tests for phase accounting."""
+
+    def test_phases_accumulate_and_survive_errors(self):
+        timer = PhaseTimer("sample_init")
+        with timer.phase("compose_up"):
+            pass
+        with pytest.raises(RuntimeError):
+            with timer.phase("readiness"):
+                raise RuntimeError("boom")
+        with timer.phase("compose_up"):
+            pass
+
+        assert set(timer.phases) == {"compose_up", "readiness"}
+        assert all(seconds >= 0 for seconds in timer.phases.values())
+
+    def test_to_dict_flattens_attributes(self):
+        timer = PhaseTimer("sample_cleanup", phases={"compose_down": 1.23456}, attributes={"project": "p"})
+        timer.services["router"] = 2.5
+        timer.stages["stage_0"] = 4.0004
+        data = timer.to_dict()
+
+        assert data["operation"] == "sample_cleanup"
+        assert data["phases"] == {"compose_down": 1.235}
+        assert data["services"] == {"router": 2.5}
+        assert data["stages"] == {"stage_0": 4.0}
+        assert data["project"] == "p"
+
+
+class TestEmitTiming:
+    """Tests for log and sample emission."""
+
+    def test_attaches_to_transcript_and_store(self, caplog):
+        timer = PhaseTimer("sample_init", phases={"compose_up": 3.0})
+        with (
+            mock.patch("inspect_kathara._telemetry.transcript") as transcript,
+            mock.patch("inspect_kathara._telemetry.store") as store,
+            caplog.at_level(logging.DEBUG, logger="inspect_kathara._telemetry"),
+        ):
+            data = emit_timing(timer)
+
+        transcript.return_value.info.assert_called_once_with(data, source=TELEMETRY_SOURCE)
+        store.return_value.set.assert_called_once_with(f"{TELEMETRY_SOURCE}:sample_init", data)
+        assert caplog.records[0].kathara_timing == data
+
+    def test_detached_timing_is_only_logged(self):
+        with (
+            mock.patch("inspect_kathara._telemetry.transcript") as transcript,
+            mock.patch("inspect_kathara._telemetry.store") as store,
+        ):
+            emit_timing(PhaseTimer("prestart"), attach=False)
+
+        transcript.assert_not_called()
+        store.assert_not_called()
@@ -0,0 +1,88 @@
+"""Tests for inspect_kathara._transfer module."""
+
+import asyncio
+from unittest import mock
+
+import pytest
+
+from inspect_kathara._transfer import read_chunks, write_chunks
+from inspect_kathara.sandbox import KatharaSandboxEnvironment
+
+_create_subprocess_exec = asyncio.create_subprocess_exec
+
+
+async def _local_exec(*argv, **kwargs):
+    """Run the in-container part of a ``docker exec`` command on the host."""
+    return await _create_subprocess_exec(*argv[argv.index("sh") :], **kwargs)
+
+
+@pytest.fixture(autouse=True)
+def local_exec():
+    with mock.patch("inspect_kathara._transfer.asyncio.create_subprocess_exec", side_effect=_local_exec) as spawn:
+        yield spawn
+
+
+async def _read(*args, **kwargs) -> bytes:
+    return b"".join([chunk async for chunk in read_chunks("c1", *args, **kwargs)])
+
+
+class TestReadChunks:
+    """Tests for streaming reads from a container."""
+
+    async def test_ranges(self, tmp_path):
+        log = tmp_path / "frr.log"
+        data = bytes(range(256)) * 40
+        log.write_bytes(data)
+
+        assert await _read(str(log)) == data
+        assert await _read(str(log), offset=1000, length=24) == data[1000:1024]
+        assert await _read(str(log), offset=-100) == data[-100:]
+        assert await _read(str(log), offset=-100, length=10) == data[-100:-90]
+
+    async def test_compressed_stream_in_small_chunks(self, tmp_path):
+        log = tmp_path / "frr.log"
+        data = b"".join(b"%d OSPF neighbour up\n" % i for i in range(20000))
+        log.write_bytes(data)
+
+        chunks = [chunk async for chunk in read_chunks("c1", str(log), compress=True, chunk_size=4096)]
+        assert len(chunks) > 1 and b"".join(chunks) == data
+
+    async def test_missing_file(self, tmp_path):
+        with pytest.raises(FileNotFoundError):
+            await _read(str(tmp_path / "missing"))
+
+
+class TestWriteChunks:
+    """Tests for streaming writes into a container."""
+
+    async def test_writes_from_async_and_plain_iterables(self, tmp_path):
+        async def parts():
+            for i in range(100):
+                yield b"line %d\n" % i
+
+        target = tmp_path / "dir" / "out.txt"
+        written = await write_chunks("c1", str(target), parts(), compress=True)
+        assert target.read_bytes() == b"".join(b"line %d\n" % i for i in range(100))
+        assert written == target.stat().st_size
+
+        await write_chunks("c1", str(target), [b"a", b"b"])
+        assert target.read_bytes() == b"ab"
+
+    async def test_container_failure_raises(self, tmp_path):
+        (tmp_path / "file").write_text("not a directory")
+        with pytest.raises(RuntimeError, match="failed"):
+            await write_chunks("c1", str(tmp_path / "file" / "out"), [b"data"])
+
+
+class TestSandboxTransfer:
+    """Tests for the transfer methods of KatharaSandboxEnvironment."""
+
+    async def test_range_and_download_resolve_relative_paths(self, tmp_path):
+        (tmp_path / "capture.pcap").write_bytes(b"x" * 5000 + b"tail")
+        env = KatharaSandboxEnvironment("r1", mock.MagicMock(), str(tmp_path))
+        env._container = "c1"
+
+        assert await env.read_file_range("capture.pcap", offset=-4) == b"tail"
+        destination = tmp_path / "local.pcap"
+        assert await env.download_file("capture.pcap", destination, compress=True) == 5004
+        assert destination.read_bytes() == b"x" * 5000 + b"tail"
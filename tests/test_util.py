@@ -1,14 +1,29 @@
 """Tests for inspect_kathara._util module."""
 
+import hashlib
+import io
+import os
 from pathlib import Path
+import subprocess
 import tempfile
+from unittest import mock
 
 from inspect_kathara._util import (
     IMAGE_CONFIGS,
+    LabConfError,
+    OutputCapture,
+    _ImageInventory,
+    _hashed_lines,
+    _LabConfCache,
+    ensure_kathara_images,
     get_image_config,
     has_vtysh,
     is_routing_image,
+    machine_service_options,
     parse_lab_conf,
+    parse_lab_conf_lines,
+    parse_memory_mb,
+    truncate_output,
     validate_kathara_image,
 )
 import pytest
@@ -67,6 +82,52 @@ class TestValidateKatharaImage:
             validate_kathara_image("ubuntu:latest")
 
 
+def _docker_images(*repositories: str) -> subprocess.CompletedProcess:
+    return subprocess.CompletedProcess(args=[], returncode=0, stdout="\n".join(repositories) + "\n", stderr="")
+
+
+class TestImageInventory:
+    """Tests for the process-wide image inventory."""
+
+    def test_single_listing_serves_many_lookups(self):
+        inventory = _ImageInventory(ttl=60)
+        with mock.patch("subprocess.run", return_value=_docker_images("kathara/base", "kathara/frr")) as run:
+            assert inventory.is_available("kathara/base")
+            assert inventory.is_available("kathara/frr:latest")
+            assert not inventory.is_available("kathara/bind")
+
+        assert run.call_count == 1
+
+    def test_stale_listing_is_refreshed(self):
+        inventory = _ImageInventory(ttl=0)
+        with mock.patch("subprocess.run", side_effect=[_docker_images(), _docker_images("kathara/bind")]):
+            assert not inventory.is_available("kathara/bind")
+            assert inventory.is_available("kathara/bind")
+
+    def test_positive_result_is_cached(self):
+        inventory = _ImageInventory(ttl=0)
+        with mock.patch("subprocess.run", return_value=_docker_images("kathara/base")) as run:
+            assert inventory.is_available("kathara/base")
+            assert inventory.is_available("kathara/base")
+
+        assert run.call_count == 1
+
+    async def test_ensure_pulls_only_missing_images_once(self):
+        inventory = _ImageInventory(ttl=60)
+        with (
+            mock.patch("inspect_kathara._util._image_inventory", inventory),
+            mock.patch("inspect_kathara._util.get_docker_client", return_value=None),
+            mock.patch("subprocess.run", return_value=_docker_images("kathara/base")),
+            mock.patch("inspect_kathara._util.validate_kathara_image") as validate,
+        ):
+            checked = await ensure_kathara_images(
+                ["kathara/base", "kathara/frr", "ubuntu:latest", "kathara/frr", "kathara/bind"]
+            )
+
+        assert checked == ["kathara/base", "kathara/frr", "kathara/bind"]
+        assert sorted(call.args[0] for call in validate.call_args_list) == ["kathara/bind", "kathara/frr"]
+
+
 class TestParseLabConf:
     """Tests for parse_lab_conf."""
 
@@ -106,7 +167,175 @@ router[image]="kathara/frr"
 
         assert config.machines["router"].image == "kathara/frr"
 
+    def test_parse_extended_directives(self):
+        lab = parse_lab_conf_lines(
+            [
+                'pc1[0]="A/02:42:AC:11:00:02"',
+                'pc1[mem]="256M"',
+                "pc1[cpus]=1.5",
+                "pc1[bridged]=true",
+                "pc1[ipv6]=false",
+                'pc1[exec]="sysctl -w net.ipv4.ip_forward=1"',
+                'pc1[sysctl]="net.ipv4.conf.all.rp_filter=0"',
+                'pc1[env]="MODE=lab"',
+                'pc1[port]="8080:80/tcp"',
+            ]
+        )
+        pc1 = lab.machines["pc1"]
+
+        assert lab.errors == []
+        assert pc1.collision_domains == [(0, "A")]
+        assert pc1.macs == {0: "02:42:ac:11:00:02"}
+        assert (pc1.mem, pc1.cpus, pc1.bridged, pc1.ipv6) == ("256m", 1.5, True, False)
+        assert pc1.exec_commands == ["sysctl -w net.ipv4.ip_forward=1"]
+        assert machine_service_options(pc1) == {
+            "mem_limit": "256m",
+            "cpus": 1.5,
+            "sysctls": {"net.ipv4.conf.all.rp_filter": "0", "net.ipv6.conf.all.disable_ipv6": "1"},
+            "environment": {"MODE": "lab"},
+            "ports": ["8080:80/tcp"],
+        }
+
+    def test_memory_without_unit_is_megabytes(self):
+        lab = parse_lab_conf_lines(['pc1[mem]="512"', 'pc2[mem]="1.5G"'])
+
+        # as in Kathara; compose would read a bare number as bytes
+        assert machine_service_options(lab.machines["pc1"]) == {"mem_limit": "512m"}
+        assert parse_memory_mb(lab.machines["pc1"].mem) == 512
+        assert lab.machines["pc2"].mem == "1.5g"
+
+    def test_invalid_lines_are_reported_with_line_numbers(self):
+        lines = ['pc1[0]="A"', "not a directive", 'pc1[mem]="lots"', 'pc1[0]="B"', 'pc1[colour]="red"']
+        lab = parse_lab_conf_lines(lines, source="lab.conf")
+
+        assert [error.line for error in lab.errors] == [2, 3, 4, 5]
+        assert str(lab.errors[1]) == "lab.conf:3: invalid memory limit 'lots' for pc1"
+        assert lab.machines["pc1"].collision_domains == [(0, "A")]
+
+    def test_strict_mode_raises_first_error(self):
+        with pytest.raises(LabConfError) as excinfo:
+            parse_lab_conf_lines(['pc1[0]="A"', 'pc1[cpus]="-1"'], strict=True)
+        assert excinfo.value.line == 2
+
+    def test_metadata_lines(self):
+        lab = parse_lab_conf_lines(['LAB_NAME="Demo lab"', 'LAB[author]="someone"', "pc1[0]=A"])
+        assert lab.metadata["LAB_NAME"] == "Demo lab"
+        assert lab.metadata["LAB_AUTHOR"] == "someone"
+        assert lab.machines["pc1"].collision_domains == [(0, "A")]
+
     def test_parse_nonexistent_returns_empty(self):
         config = parse_lab_conf(Path("/nonexistent/lab.conf"))
         assert config.machines == {}
         assert config.metadata == {}
+
+
+class TestLabConfCache:
+    """Tests for memoized lab.conf parsing."""
+
+    def test_unchanged_file_is_parsed_once(self, tmp_path):
+        lab_conf = tmp_path / "lab.conf"
+        lab_conf.write_text('pc1[0]="A"\n')
+        cache = _LabConfCache(maxsize=4)
+
+        with mock.patch("inspect_kathara._util.parse_lab_conf_lines", wraps=parse_lab_conf_lines) as parse:
+            assert cache.get(lab_conf) is cache.get(lab_conf)
+        assert parse.call_count == 1
+
+    def test_cold_miss_reads_the_file_once(self, tmp_path):
+        lab_conf = tmp_path / "lab.conf"
+        lab_conf.write_text('pc1[0]="A"\n')
+        cache = _LabConfCache(maxsize=4)
+
+        with mock.patch("inspect_kathara._util._file_sha256") as file_sha256:
+            cache.get(lab_conf)
+        file_sha256.assert_not_called()
+        os.utime(lab_conf, ns=(0, 1))
+        assert cache.get(lab_conf).machines.keys() == {"pc1"}
+
+    def test_chunked_read_keeps_lines_and_hash(self):
+        # a two-byte character straddles the 4 KiB chunk boundary
+        data = b"#" * (4 * 1024 - 1) + "\u00e9\r\n".encode() + b'pc1[0]="A"'
+        digest = hashlib.sha256()
+        lines = list(_hashed_lines(io.BytesIO(data), digest))
+
+        assert lines == ["#" * (4 * 1024 - 1) + "\u00e9\r", 'pc1[0]="A"']
+        assert digest.hexdigest() == hashlib.sha256(data).hexdigest()
+
+    def test_touch_without_content_change_keeps_entry(self, tmp_path):
+        lab_conf = tmp_path / "lab.conf"
+        lab_conf.write_text('pc1[0]="A"\n')
+        cache = _LabConfCache(maxsize=4)
+        first = cache.get(lab_conf)
+        os.utime(lab_conf, ns=(0, 1))
+
+        assert cache.get(lab_conf) is first
+
+    def test_content_change_reparses(self, tmp_path):
+        lab_conf = tmp_path / "lab.conf"
+        lab_conf.write_text('pc1[0]="A"\n')
+        cache = _LabConfCache(maxsize=4)
+        cache.get(lab_conf)
+        lab_conf.write_text('pc1[0]="A"\npc2[0]="A"\n')
+
+        assert set(cache.get(lab_conf).machines) == {"pc1", "pc2"}
+
+    def test_least_recently_used_entry_is_evicted(self, tmp_path):
+        paths = []
+        for name in ("a", "b", "c"):
+            path = tmp_path / f"{name}.conf"
+            path.write_text(f'{name}[0]="A"\n')
+            paths.append(path)
+        cache = _LabConfCache(maxsize=2)
+        first = cache.get(paths[0])
+        cache.get(paths[1])
+        cache.get(paths[0])
+        cache.get(paths[2])
+
+        assert len(cache) == 2
+        assert cache.get(paths[0]) is first
+
+    def test_strict_raises_cached_errors(self, tmp_path):
+        lab_conf = tmp_path / "lab.conf"
+        lab_conf.write_text('pc1[0]="A"\npc1[bogus]=1\n')
+        with mock.patch("inspect_kathara._util._lab_conf_cache", _LabConfCache(maxsize=4)):
+            assert len(parse_lab_conf(lab_conf).errors) == 1
+            with pytest.raises(LabConfError):
+                parse_lab_conf(lab_conf, strict=True)
+
+
+class TestOutputCapture:
+    """Tests for bounded head/tail output capture."""
+
+    def test_small_output_is_kept_whole(self):
+        capture = OutputCapture(limit=1024)
+        capture.feed(b"hello ")
+        capture.feed(b"world")
+        assert (capture.text(), capture.total, capture.truncated) == ("hello world", 11, False)
+
+    def test_streamed_output_keeps_head_and_tail(self):
+        data = b"".join(b"line %d\n" % i for i in range(10000))
+        capture = OutputCapture(limit=200, head=40)
+        for start in range(0, len(data), 333):
+            capture.feed(data[start : start + 333])
+
+        text = capture.text()
+        assert capture.total == len(data) and capture.truncated
+        assert text.startswith("line 0\nline 1\n") and text.endswith("line 9999\n")
+        assert f"[... {len(data) - 40 - 96} bytes omitted ...]" in text
+        assert len(text.encode()) <= 200
+
+    def test_cuts_fall_on_utf8_boundaries(self):
+        data = "€".encode() * 100  # 3 bytes per character
+        capture = OutputCapture(limit=150, head=41)
+        capture.feed(data)
+
+        head, tail = capture.text().split(" bytes omitted ...]\n")
+        assert head.startswith("€" * 13) and "\ufffd" not in head + tail
+        assert set(tail) == {"€"}
+
+    def test_truncate_output(self):
+        assert truncate_output("short", max_size=100) == "short"
+        long = truncate_output("x" * 1000 + "end", max_size=200)
+        assert long == "x" * 197 + "end"
+        # only the tail is kept, cut on a character boundary
+        assert truncate_output("start" + "€" * 100, max_size=10) == "€" * 3